@@ -0,0 +1,96 @@
+"""
+Detalle estructurado del ATS (participantes, EPP verificado, riesgos,
+charla y horarios) guardado en tablas normalizadas para análisis.
+Ver sql/003_ats_detalle.sql.
+"""
+import logging
+
+import catalogo
+
+log = logging.getLogger(__name__)
+
+TABLA_REGISTROS = "ats_registros_diarios"
+RPC_REGISTRAR = "registrar_ats"
+# PostgREST: función inexistente (PGRST202) / Postgres: undefined_function
+CODIGOS_SIN_FUNCION = {"PGRST202", "42883"}
+
+
+def construir_payload(registro: dict, data: dict, cat=None) -> dict:
+    """
+    Registro resumen + detalle del ATS en un solo JSON para la función
+    registrar_ats (upsert del resumen y reemplazo de tablas hijas).
+    EPP y riesgos llevan el id estable del catálogo `cat` (por defecto el
+    vigente) junto al nombre; los que no están en el catálogo van sin id.
+    """
+    cat = cat or catalogo.vigente()
+    participantes = []
+    epp_checks = []
+    for t in data.get("tecnicos", []) or []:
+        item = t.get("item")
+        participantes.append(
+            {
+                "item": item,
+                "usuario": t.get("usuario", ""),
+                "nombre": t.get("nombre", ""),
+                "cargo": t.get("cargo", ""),
+                "dni": t.get("dni", ""),
+                "observaciones": t.get("obs", ""),
+            }
+        )
+        marcados = set(t.get("epp") or [])
+        ids_marcados = cat.ids_epp(marcados)
+        # Se guarda también lo NO marcado para poder medir incumplimiento.
+        # Se compara por id: un alias marca el EPP del catálogo
+        for e in cat.epp:
+            epp_checks.append(
+                {"item": item, "epp_id": e["id"], "epp": e["nombre"], "marcado": e["id"] in ids_marcados}
+            )
+        for epp in sorted(marcados):
+            if cat.id_epp(epp) is None:
+                epp_checks.append({"item": item, "epp_id": None, "epp": epp, "marcado": True})
+
+    riesgos = [
+        {"item": i, "riesgo_id": cat.id_riesgo(r), "riesgo": r}
+        for i, r in enumerate(data.get("riesgos", []) or [], start=1)
+    ]
+
+    payload = dict(registro)
+    payload.update(
+        {
+            "actividad": data.get("actividad", ""),
+            "lugar_trabajo": data.get("lugar_trabajo", ""),
+            "tema_charla": data.get("tema_charla", ""),
+            "expositor_charla": data.get("expositor_charla", ""),
+            "hora_inicio": data.get("hora_inicio", ""),
+            "hora_fin": data.get("hora_fin", ""),
+            "recomendaciones": data.get("recomendaciones", ""),
+            "participantes": participantes,
+            "epp": epp_checks,
+            "riesgos": riesgos,
+        }
+    )
+    return payload
+
+
+def guardar_registro(client, registro: dict, data: dict, cat=None):
+    """
+    Guarda resumen + detalle en un solo viaje a la base (RPC).
+    Si la función aún no está instalada, guarda solo el resumen como antes.
+    Cualquier otro error (timeout, circuito abierto, 5xx, restricciones) se
+    propaga: guardar solo el resumen perdería el detalle sin avisar.
+    Devuelve el id del registro si se conoce.
+    """
+    try:
+        resp = client.rpc(RPC_REGISTRAR, {"p": construir_payload(registro, data, cat)}).execute()
+        return resp.data
+    except Exception as e:
+        if getattr(e, "code", None) not in CODIGOS_SIN_FUNCION:
+            raise
+        log.warning("Falta la función %s (ver sql/003_ats_detalle.sql). Se guarda solo el resumen.", RPC_REGISTRAR)
+
+    resp = client.table(TABLA_REGISTROS).upsert(
+        registro,
+        on_conflict="fecha,brigada,contrata",
+    ).execute()
+    filas = resp.data or []
+    return filas[0].get("id") if filas else None
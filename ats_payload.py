@@ -0,0 +1,202 @@
+"""
+Modo de almacenamiento "payload": en lugar de guardar el PDF terminado,
+se guarda el ATS normalizado (JSON comprimido) + las imágenes (firmas y
+fotos) como blobs direccionados por su hash. El PDF se vuelve a generar
+bajo demanda, de forma determinística (mismos bytes cada vez), y los
+renders recientes se sirven desde un cache LRU con presupuesto de tamaño.
+
+Se activa con ATS_ALMACENAMIENTO=payload (requiere sql/004_ats_payload.sql).
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+
+from cache_local import CacheBytesLRU
+from generate_pdf import PDF_MAX_BYTES, VERSION_DISENO, generar_pdf, generar_pdf_con_limite
+import catalogo as _catalogo
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+MODO_ALMACENAMIENTO = os.getenv("ATS_ALMACENAMIENTO", "pdf").lower()
+CACHE_RENDERS_BYTES = int(os.getenv("PDF_CACHE_RENDERS_MB", "64")) * 1024 * 1024
+
+VERSION_PAYLOAD = 2
+PREFIJO_BLOB = "blob:"
+
+# Campos de `data` que se guardan (las rutas de imágenes se tratan aparte)
+CAMPOS_DATA = [
+    "fecha_dia",
+    "hora_inicio",
+    "hora_fin",
+    "actividad",
+    "lugar_trabajo",
+    "recomendaciones",
+    "supervisor",
+    "usuario_registro",
+    "brigada_usuario",
+    "zona_usuario",
+    "contrata",
+    "area",
+    "brigada",
+    "tema_charla",
+    "expositor_charla",
+    "riesgos",
+    "riesgos_detalle",
+    "catalogo_version",
+]
+CAMPOS_TECNICO = ["item", "usuario", "nombre", "cargo", "dni", "brigada", "zona", "contrata", "epp", "obs"]
+
+_cache_renders = CacheBytesLRU(CACHE_RENDERS_BYTES)
+
+
+def modo_payload() -> bool:
+    return MODO_ALMACENAMIENTO == "payload"
+
+
+# =========================
+# GUARDAR
+# =========================
+def _subir_blob(client, bucket: str, ruta_local, fotos=None) -> str:
+    """
+    Sube la imagen con nombre = sha256 del contenido (se deduplica sola).
+    Si la foto se redujo para el PDF (`fotos`: ruta -> JPEG) se sube la
+    versión reducida, la misma que quedó en el PDF enviado.
+    Devuelve la referencia "blob:<path>" o None.
+    """
+    if not isinstance(ruta_local, str) or not os.path.isfile(ruta_local):
+        return None
+    reducida = (fotos or {}).get(ruta_local)
+    if reducida is not None:
+        contenido, ext = reducida, ".jpg"
+    else:
+        with open(ruta_local, "rb") as f:
+            contenido = f.read()
+        ext = os.path.splitext(ruta_local)[1].lower() or ".bin"
+    path = f"blobs/{hashlib.sha256(contenido).hexdigest()}{ext}"
+    content_type = "image/png" if ext == ".png" else "image/jpeg"
+    client.storage.from_(bucket).upload(
+        path,
+        contenido,
+        file_options={"content-type": content_type, "upsert": "true"},
+    )
+    return PREFIJO_BLOB + path
+
+
+def construir_payload(client, bucket: str, data: dict, catalogo=None, fotos=None) -> dict:
+    payload = {"version": VERSION_PAYLOAD}
+    for campo in CAMPOS_DATA:
+        payload[campo] = data.get(campo)
+    # Columnas de EPP con las que se generó el PDF: el re-render no depende
+    # del catálogo que tenga cargado cada worker
+    cat = catalogo or _catalogo.vigente()
+    payload["epp"] = cat.epp
+    payload["catalogo_version"] = cat.version
+
+    tecnicos = []
+    for t in data.get("tecnicos", []) or []:
+        fila = {c: t.get(c) for c in CAMPOS_TECNICO}
+        fila["firma_path"] = _subir_blob(client, bucket, t.get("firma_path"))
+        fila["foto_path"] = _subir_blob(client, bucket, t.get("foto_path"), fotos)
+        tecnicos.append(fila)
+    payload["tecnicos"] = tecnicos
+    payload["foto_path"] = _subir_blob(client, bucket, data.get("foto_path"), fotos)
+    return payload
+
+
+def guardar_payload(client, bucket: str, data: dict, storage_path: str,
+                    catalogo=None, fotos=None) -> str:
+    """
+    Sube blobs + JSON comprimido. `storage_path` es la ruta que tendría
+    el PDF; el payload se guarda al lado con extensión .json.gz.
+    `catalogo` y `fotos` son los usados al generar el PDF original
+    (ver generar_pdf_con_limite).
+    """
+    payload = construir_payload(client, bucket, data, catalogo, fotos)
+    cuerpo = gzip.compress(
+        json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8"),
+        mtime=0,
+    )
+    payload_path = os.path.splitext(storage_path)[0] + ".json.gz"
+    client.storage.from_(bucket).upload(
+        payload_path,
+        cuerpo,
+        file_options={"content-type": "application/gzip"},
+    )
+    return payload_path
+
+
+# =========================
+# RE-GENERAR PDF
+# =========================
+def cargar_payload(client, bucket: str, payload_path: str) -> dict:
+    """
+    Descarga el payload y reemplaza las referencias a blobs por sus bytes.
+    """
+    storage = client.storage.from_(bucket)
+    data = json.loads(gzip.decompress(storage.download(payload_path)).decode("utf-8"))
+
+    descargados = {}
+
+    def _resolver(ref):
+        if not isinstance(ref, str) or not ref.startswith(PREFIJO_BLOB):
+            return None
+        path = ref[len(PREFIJO_BLOB):]
+        if path not in descargados:
+            descargados[path] = storage.download(path)
+        return descargados[path]
+
+    for t in data.get("tecnicos", []) or []:
+        t["firma_path"] = _resolver(t.get("firma_path"))
+        t["foto_path"] = _resolver(t.get("foto_path"))
+    data["foto_path"] = _resolver(data.get("foto_path"))
+    return data
+
+
+def renderizar(data: dict) -> bytes:
+    """
+    PDF determinístico en memoria a partir del payload ya resuelto, con el
+    mismo tamaño máximo y las columnas de EPP guardadas en el payload.
+    """
+    if data.get("epp"):
+        cat = _catalogo.Catalogo(data["epp"], [], data.get("catalogo_version"))
+    else:
+        # Payloads v1 no guardaban las columnas: se usan las de base, no las
+        # del catálogo vigente, para que todos los workers den los mismos bytes
+        cat = _catalogo.Catalogo.base()
+    buffer = io.BytesIO()
+    if PDF_MAX_BYTES:
+        generar_pdf_con_limite(
+            data, PDF_MAX_BYTES, destino=buffer, invariante=True, limpiar=False, catalogo=cat
+        )
+    else:
+        generar_pdf(data, destino=buffer, invariante=True, limpiar=False, catalogo=cat)
+    return buffer.getvalue()
+
+
+def obtener_pdf(client, bucket: str, payload_path: str, guardar_cache: bool = True) -> bytes:
+    """
+    PDF del payload: desde el cache de renders o generado en el momento.
+    guardar_cache=False para recorridos masivos que no deben desplazar lo
+    que se está viendo.
+    """
+    clave = (_version_render(), payload_path)
+    pdf = _cache_renders.get(clave)
+    if pdf is None:
+        pdf = renderizar(cargar_payload(client, bucket, payload_path))
+        if guardar_cache:
+            _cache_renders.set(clave, pdf)
+    return pdf
+
+
+def _version_render() -> str:
+    # El payload (con sus columnas de EPP) no cambia una vez escrito; los
+    # bytes del PDF sólo dependen además del diseño y del tamaño máximo
+    return f"{VERSION_PAYLOAD}:{VERSION_DISENO}:{PDF_MAX_BYTES}"
+
+
+def etag_payload(payload_path: str) -> str:
+    return hashlib.sha256(f"{_version_render()}:{payload_path}".encode()).hexdigest()[:32]
@@ -0,0 +1,328 @@
+"""
+Login de usuarios_brigadas:
+
+- El perfil del usuario se busca por `usuario` y se cachea unos segundos
+  (también los usuarios inexistentes), así una ola de logins en el cambio
+  de turno no llega a la base. El hash de la clave va en otra cache más
+  corta (LOGIN_CLAVE_CACHE_SEG) que se borra al fallar un intento y se
+  actualiza al guardar un hash nuevo; la clave en texto plano no se
+  cachea nunca. Un cambio de clave o una baja hecha en la tabla tarda
+  hasta LOGIN_CLAVE_CACHE_SEG en verse.
+- La clave se verifica en el servidor contra `clave_hash` (PBKDF2, costo
+  ajustable con LOGIN_HASH_ITERACIONES). Los usuarios que aún tienen solo
+  la clave en texto plano se migran al hash en su primer login correcto.
+  Con el hash guardado, `clave` ya no se compara: para restablecer una
+  clave se edita `clave` en la tabla y el trigger de sql/005 borra el
+  hash (la clave anterior deja de entrar).
+- Un usuario inexistente o con clave plana cuesta lo mismo que uno con
+  hash (se verifica también contra un hash de relleno): el tiempo de
+  respuesta no revela qué usuarios existen.
+- Intentos limitados con token bucket por IP (cada intento) y por usuario
+  (solo los fallidos, así nadie bloquea una cuenta ajena con intentos a su
+  nombre más rápido que su dueño). Al superar el límite se responde sin
+  consultar la base. Por defecto se confía en un proxy (el router) para
+  tomar la IP de X-Forwarded-For; con conexión directa (desarrollo local)
+  usar LOGIN_PROXIES_CONFIABLES=0.
+- La cache de usuarios y los cubos viven en el estado compartido
+  (estado_compartido.py): con varias instancias el límite es global.
+
+Requiere sql/005_usuarios_clave_hash.sql.
+"""
+import hmac
+import logging
+import os
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import estado_compartido
+from estado_compartido import CacheCompartida
+
+log = logging.getLogger(__name__)
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+TABLA_USUARIOS = "usuarios_brigadas"
+COLUMNAS_USUARIO = "id,usuario,nombre,cargo,brigada,zona,contrata,dni,activo,clave,clave_hash"
+# Fuera de la cache del perfil; el hash tiene su propia cache y la clave plana no se cachea
+CAMPOS_CLAVE = ("clave", "clave_hash")
+CAMPOS_SESION = ("id", "usuario", "nombre", "cargo", "brigada", "zona", "contrata", "dni")
+
+CACHE_SEG = int(os.getenv("LOGIN_CACHE_SEG", "60"))
+CACHE_NEGATIVO_SEG = int(os.getenv("LOGIN_CACHE_NEGATIVO_SEG", "30"))
+CLAVE_CACHE_SEG = int(os.getenv("LOGIN_CLAVE_CACHE_SEG", "30"))
+HASH_ITERACIONES = int(os.getenv("LOGIN_HASH_ITERACIONES", "260000"))
+# Al migrar al hash, borrar la clave en texto plano (dejar en 0 hasta validar)
+BORRAR_CLAVE_PLANA = os.getenv("LOGIN_BORRAR_CLAVE_PLANA", "0") == "1"
+
+# Token bucket: ráfaga máxima y recarga por minuto
+INTENTOS_USUARIO = int(os.getenv("LOGIN_INTENTOS_USUARIO", "5"))
+INTENTOS_USUARIO_POR_MIN = float(os.getenv("LOGIN_INTENTOS_USUARIO_POR_MIN", "5"))
+# Por IP es más alto: varias cuadrillas pueden salir por la misma IP (NAT del operador)
+INTENTOS_IP = int(os.getenv("LOGIN_INTENTOS_IP", "30"))
+INTENTOS_IP_POR_MIN = float(os.getenv("LOGIN_INTENTOS_IP_POR_MIN", "30"))
+# Cantidad de proxies delante de la app que agregan X-Forwarded-For. En
+# producción la app está detrás del router: 1. Con conexión directa, 0.
+PROXIES_CONFIABLES = int(os.getenv("LOGIN_PROXIES_CONFIABLES", "1"))
+
+_NO_EXISTE = False  # valor cacheado para usuarios inexistentes o inactivos
+_cache_usuarios = CacheCompartida("login:usuario", ttl=CACHE_SEG)
+# id del usuario -> clave_hash (solo hashes, nunca la clave plana)
+_cache_hashes = CacheCompartida("login:hash", ttl=CLAVE_CACHE_SEG)
+_sin_columna_hash = False
+
+
+# =========================
+# LÍMITE DE INTENTOS
+# =========================
+class CuboTokens:
+    """
+    Token bucket por clave (usuario o IP): `capacidad` intentos seguidos y
+    se recupera `por_minuto` intentos por minuto. Los cubos llenos expiran.
+    El cubo es [tokens, epoch del último consumo] en el estado compartido
+    (hora de pared, no monotónica: se compara entre instancias).
+    """
+
+    def __init__(self, nombre: str, capacidad: int, por_minuto: float):
+        self.nombre = nombre
+        self.capacidad = capacidad
+        self.por_segundo = por_minuto / 60.0
+        self._ttl = capacidad / max(self.por_segundo, 1e-9)
+
+    def _clave(self, clave) -> str:
+        return f"login:cubo:{self.nombre}:{clave}"
+
+    def _tokens(self, cubo, ahora: float) -> float:
+        tokens, ultimo = cubo or (self.capacidad, ahora)
+        return min(self.capacidad, tokens + max(ahora - ultimo, 0) * self.por_segundo)
+
+    def espera(self, clave) -> float:
+        """
+        Segundos a esperar antes del próximo intento, sin consumir.
+        Si el estado compartido no responde, 0.
+        """
+        try:
+            cubo = estado_compartido.obtener(self._clave(clave))
+        except estado_compartido.ErrorEstado as e:
+            log.warning("Límite de intentos no disponible (%s): %s", self.nombre, e)
+            return 0
+        tokens = self._tokens(cubo, time.time())
+        return 0 if tokens >= 1 else (1 - tokens) / self.por_segundo
+
+    def consumir(self, clave) -> float:
+        """
+        Consume un intento. Devuelve 0 si se permite o los segundos a esperar.
+        Si el estado compartido no responde, se permite (no bloquea el login).
+        """
+        espera = [0]
+
+        def _tomar(cubo):
+            ahora = time.time()
+            tokens = self._tokens(cubo, ahora)
+            if tokens < 1:
+                espera[0] = (1 - tokens) / self.por_segundo
+                return cubo
+            espera[0] = 0
+            return [tokens - 1, ahora]
+
+        try:
+            estado_compartido.actualizar(self._clave(clave), _tomar, ttl=self._ttl)
+        except estado_compartido.ErrorEstado as e:
+            log.warning("Límite de intentos no disponible (%s): %s", self.nombre, e)
+            return 0
+        return espera[0]
+
+    def reiniciar(self, clave):
+        try:
+            estado_compartido.borrar(self._clave(clave))
+        except estado_compartido.ErrorEstado as e:
+            log.warning("Límite de intentos no disponible (%s): %s", self.nombre, e)
+
+
+_cubo_usuario = CuboTokens("usuario", INTENTOS_USUARIO, INTENTOS_USUARIO_POR_MIN)
+_cubo_ip = CuboTokens("ip", INTENTOS_IP, INTENTOS_IP_POR_MIN)
+
+
+def ip_cliente(request) -> str:
+    """
+    IP del cliente. Detrás de N proxies confiables se toma la que agregó
+    el más externo de ellos en X-Forwarded-For (las anteriores se pueden falsificar).
+    """
+    if PROXIES_CONFIABLES and request.headers.get("X-Forwarded-For"):
+        ruta = request.access_route
+        return ruta[max(len(ruta) - PROXIES_CONFIABLES, 0)]
+    return request.remote_addr or "-"
+
+
+# =========================
+# USUARIOS
+# =========================
+def buscar_usuario(client, usuario: str):
+    """
+    Registro activo del usuario (dict, con clave / clave_hash) o None.
+    El perfil se cachea sin la clave ni su hash; el hash va aparte, con
+    menos TTL. Con los dos en cache no se consulta la base; con el perfil
+    solo, se lee la clave por id. Los errores de la base se propagan y no
+    se cachean.
+    """
+    perfil = _cache_usuarios.get(usuario)
+    if perfil is not None:
+        if not perfil:
+            return None
+        clave_hash = _cache_hashes.get(perfil["id"])
+        if clave_hash:
+            return dict(perfil, clave_hash=clave_hash)
+        credencial = _consultar_usuario(client, "id", perfil["id"], ",".join(CAMPOS_CLAVE))
+        if credencial is None:
+            # Desactivado o borrado desde que se cacheó
+            invalidar_usuario(usuario)
+            return None
+        _recordar_hash(perfil["id"], credencial.get("clave_hash"))
+        return dict(perfil, **credencial)
+
+    fila = _consultar_usuario(client, "usuario", usuario, COLUMNAS_USUARIO)
+    if fila:
+        _cache_usuarios.set(usuario, {k: v for k, v in fila.items() if k not in CAMPOS_CLAVE})
+        _recordar_hash(fila["id"], fila.get("clave_hash"))
+    else:
+        _cache_usuarios.set(usuario, _NO_EXISTE, ttl=CACHE_NEGATIVO_SEG)
+    return fila
+
+
+def _consultar_usuario(client, campo: str, valor, columnas: str):
+    global _sin_columna_hash
+    if _sin_columna_hash:
+        columnas = ",".join(c for c in columnas.split(",") if c != "clave_hash")
+    try:
+        resp = (
+            client.table(TABLA_USUARIOS)
+            .select(columnas)
+            .eq(campo, valor)
+            .eq("activo", True)
+            .limit(1)
+            .execute()
+        )
+    except Exception as e:
+        if _sin_columna_hash or "clave_hash" not in str(e):
+            raise
+        log.warning("Falta la columna clave_hash (ver sql/005_usuarios_clave_hash.sql). Se usa solo la clave plana.")
+        _sin_columna_hash = True
+        return _consultar_usuario(client, campo, valor, columnas)
+    filas = resp.data or []
+    return filas[0] if filas else None
+
+
+def _recordar_hash(id_usuario, clave_hash):
+    if clave_hash:
+        _cache_hashes.set(id_usuario, clave_hash)
+
+
+def _olvidar_hash(id_usuario):
+    # El próximo intento relee la clave de la base (ej. se restableció)
+    _cache_hashes.borrar(id_usuario)
+
+
+def invalidar_usuario(usuario: str):
+    perfil = _cache_usuarios.get(usuario)
+    if perfil:
+        _olvidar_hash(perfil["id"])
+    _cache_usuarios.borrar(usuario)
+
+
+def datos_sesion(fila: dict) -> dict:
+    return {campo: fila.get(campo) for campo in CAMPOS_SESION}
+
+
+# =========================
+# CLAVES
+# =========================
+def hash_clave(clave: str) -> str:
+    return generate_password_hash(clave, method=f"pbkdf2:sha256:{HASH_ITERACIONES}")
+
+
+def _requiere_rehash(clave_hash: str) -> bool:
+    # Formato werkzeug: "pbkdf2:sha256:<iteraciones>$<sal>$<hash>"
+    metodo = clave_hash.split("$", 1)[0]
+    return metodo != f"pbkdf2:sha256:{HASH_ITERACIONES}"
+
+
+_hash_relleno = None
+
+
+def _verificar_relleno(clave: str):
+    # Mismo trabajo PBKDF2 que un usuario real, para usuarios inexistentes
+    global _hash_relleno
+    if _hash_relleno is None:
+        _hash_relleno = hash_clave(os.urandom(16).hex())
+    check_password_hash(_hash_relleno, clave)
+
+
+def verificar_clave(fila: dict, clave: str) -> bool:
+    clave_hash = fila.get("clave_hash")
+    if clave_hash:
+        return check_password_hash(clave_hash, clave)
+    # Sin hash se paga el mismo PBKDF2 que con hash o sin usuario: el
+    # tiempo de respuesta no distingue los tres casos
+    _verificar_relleno(clave)
+    clave_plana = fila.get("clave")
+    if not clave_plana:
+        return False
+    return hmac.compare_digest(str(clave_plana).encode("utf-8"), clave.encode("utf-8"))
+
+
+def _guardar_hash(client, fila: dict, clave: str):
+    """
+    Migración perezosa: guarda el hash (o lo recalcula si cambió el costo).
+    Un error aquí no impide el login.
+    """
+    if _sin_columna_hash:
+        return
+    nuevo = hash_clave(clave)
+    cambios = {"clave_hash": nuevo}
+    if BORRAR_CLAVE_PLANA:
+        cambios["clave"] = None
+    try:
+        client.table(TABLA_USUARIOS).update(cambios).eq("id", fila["id"]).execute()
+        fila.update(cambios)
+        _recordar_hash(fila["id"], nuevo)
+        log.info("Clave del usuario migrada a hash", extra={"usuario": fila.get("usuario")})
+    except Exception as e:
+        log.warning("No se pudo guardar el hash de la clave: %s", e, extra={"usuario": fila.get("usuario")})
+
+
+# =========================
+# LOGIN
+# =========================
+def autenticar(client, usuario: str, clave: str, ip: str) -> dict:
+    """
+    Devuelve {"ok": bool, "motivo": None | "limite" | "credenciales" | "error",
+    "espera": segundos (si "limite"), "usuario": datos de sesión (si ok)}.
+    """
+    # El cubo del usuario solo se consulta aquí: se consume al fallar
+    espera = max(_cubo_ip.consumir(ip), _cubo_usuario.espera(usuario.lower()))
+    if espera:
+        log.warning("Login limitado por exceso de intentos", extra={"usuario": usuario, "ip": ip})
+        return {"ok": False, "motivo": "limite", "espera": int(espera) + 1}
+
+    try:
+        fila = buscar_usuario(client, usuario)
+    except Exception as e:
+        log.warning("Error consultando usuario para login: %s", e, extra={"usuario": usuario})
+        return {"ok": False, "motivo": "error"}
+
+    if not fila:
+        _verificar_relleno(clave)
+    if not fila or not verificar_clave(fila, clave):
+        if fila:
+            _olvidar_hash(fila["id"])
+        _cubo_usuario.consumir(usuario.lower())
+        log.info("Login rechazado", extra={"usuario": usuario, "ip": ip})
+        return {"ok": False, "motivo": "credenciales"}
+
+    if not fila.get("clave_hash") or _requiere_rehash(fila["clave_hash"]):
+        _guardar_hash(client, fila, clave)
+
+    _cubo_usuario.reiniciar(usuario.lower())
+    return {"ok": True, "motivo": None, "usuario": datos_sesion(fila)}
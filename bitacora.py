@@ -0,0 +1,295 @@
+"""
+Logging estructurado (una línea JSON por evento) sin bloquear al request.
+
+- Los módulos usan `logging.getLogger(__name__)` y pasan datos con `extra`:
+      log.info("PDF generado", extra={"bytes": 123456})
+- configurar_logging() pone un QueueHandler en el logger raíz: el request
+  solo encola el registro y un hilo (QueueListener) escribe a stdout.
+- Cada request tiene un request_id (cabecera X-Request-ID o uno nuevo)
+  que se agrega a todos sus registros y se devuelve en la respuesta.
+- etapa("pdf") mide duración y bytes de cada paso del envío del ATS.
+- Con mucho volumen se muestrea: LOG_MUESTREO (fracción de requests cuyo
+  detalle INFO se registra) y LOG_MAX_POR_SEG (tope de INFO por segundo).
+  WARNING y ERROR se registran siempre.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+NIVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+MUESTREO = float(os.getenv("LOG_MUESTREO", "1"))
+MAX_POR_SEG = int(os.getenv("LOG_MAX_POR_SEG", "200"))
+
+CABECERA_REQUEST_ID = "X-Request-ID"
+_PATRON_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Atributos propios de LogRecord: el resto viene de `extra`
+_ATRIBUTOS_BASE = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "muestreado"}
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_muestreado = contextvars.ContextVar("muestreado", default=True)
+_etapas = contextvars.ContextVar("etapas", default=None)
+
+_listener = None
+_lock = threading.Lock()
+
+log = logging.getLogger(__name__)
+
+
+# =========================
+# CONTEXTO DEL REQUEST
+# =========================
+def request_id_actual():
+    return _request_id.get()
+
+
+def iniciar_contexto(request_id: str = None) -> list:
+    """
+    Abre el contexto de un request o tarea. Devuelve los tokens para
+    cerrar_contexto(). Decide aquí si este request entra en el muestreo.
+    """
+    if not request_id or not _PATRON_REQUEST_ID.match(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    return [
+        _request_id.set(request_id),
+        _muestreado.set(MUESTREO >= 1 or random.random() < MUESTREO),
+        _etapas.set({}),
+    ]
+
+
+def cerrar_contexto(tokens: list):
+    for var, token in zip((_request_id, _muestreado, _etapas), tokens):
+        var.reset(token)
+
+
+@contextmanager
+def contexto(request_id: str = None):
+    """
+    Contexto para trabajos fuera de un request (barridos, resúmenes, CLI).
+    """
+    tokens = iniciar_contexto(request_id)
+    try:
+        yield request_id_actual()
+    finally:
+        cerrar_contexto(tokens)
+
+
+def etapas_actuales() -> dict:
+    return dict(_etapas.get() or {})
+
+
+@contextmanager
+def etapa(nombre: str, **campos):
+    """
+    Mide un paso (pdf, correo, storage, registro...). Dentro del bloque se
+    pueden agregar datos al dict que se entrega, ej. info["bytes"] = n.
+    Si el paso lanza una excepción solo se anota su duración: el error lo
+    registra quien la maneja.
+    """
+    info = dict(campos)
+    inicio = time.perf_counter()
+    registradas = _etapas.get()
+    try:
+        yield info
+    except Exception:
+        if registradas is not None:
+            registradas[nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+        raise
+    info["ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    info.setdefault("ok", True)
+    if registradas is not None:
+        registradas[nombre] = info["ms"]
+    log.info("Etapa '%s' terminada", nombre, extra=dict(info, etapa=nombre))
+
+
+# =========================
+# FILTROS Y FORMATO
+# =========================
+class FiltroContexto(logging.Filter):
+    """
+    Copia request_id y la decisión de muestreo al registro. Corre en el
+    hilo que loguea (antes de encolar), donde el contexto es visible.
+    """
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        record.muestreado = _muestreado.get()
+        return True
+
+
+class FiltroMuestreo(logging.Filter):
+    """
+    Deja pasar siempre WARNING o más. Los INFO/DEBUG pasan si el request
+    entró en el muestreo y mientras no se supere MAX_POR_SEG; lo descartado
+    se informa una vez por segundo.
+    """
+
+    def __init__(self, max_por_seg: int = MAX_POR_SEG):
+        super().__init__()
+        self.max_por_seg = max_por_seg
+        self._segundo = 0
+        self._cantidad = 0
+        self._descartados = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if not getattr(record, "muestreado", True):
+            return False
+        if not self.max_por_seg:
+            return True
+
+        ahora = int(time.monotonic())
+        with self._lock:
+            if ahora != self._segundo:
+                if self._descartados:
+                    # Se adjunta al registro actual para no generar otro
+                    record.descartados_seg_anterior = self._descartados
+                self._segundo, self._cantidad, self._descartados = ahora, 0, 0
+            self._cantidad += 1
+            if self._cantidad > self.max_por_seg:
+                self._descartados += 1
+                return False
+        return True
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record):
+        evento = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            evento["request_id"] = request_id
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_BASE and not clave.startswith("_"):
+                evento[clave] = valor
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            evento["error"] = record.exc_text
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+class _QueueHandlerJSON(logging.handlers.QueueHandler):
+    _formato = logging.Formatter()
+
+    def prepare(self, record):
+        """
+        Resuelve el mensaje y el traceback antes de encolar, pero deja los
+        `extra` como campos: el JSON lo arma el hilo del listener.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._formato.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# =========================
+# CONFIGURACIÓN DEL LOGGING
+# =========================
+def configurar_logging(nivel: str = None):
+    """
+    Instala el logging JSON en el logger raíz (una sola vez por proceso).
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+
+        salida = logging.StreamHandler(sys.stdout)
+        salida.setFormatter(FormatoJSON())
+
+        cola = queue.SimpleQueue()
+        handler = _QueueHandlerJSON(cola)
+        handler.addFilter(FiltroContexto())
+        handler.addFilter(FiltroMuestreo())
+
+        raiz = logging.getLogger()
+        for anterior in list(raiz.handlers):
+            raiz.removeHandler(anterior)
+        raiz.addHandler(handler)
+        raiz.setLevel(nivel or NIVEL)
+        # Librerías muy verbosas en INFO (una línea por request HTTP)
+        for ruidoso in ("httpx", "httpcore", "hpack", "werkzeug"):
+            logging.getLogger(ruidoso).setLevel(logging.WARNING)
+
+        _listener = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_detener)
+
+
+def _detener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# =========================
+# FLASK
+# =========================
+def configurar_flask(app):
+    """
+    request_id por request + una línea de acceso con estado, duración,
+    bytes y tiempos de cada etapa.
+    """
+    from flask import g, request
+
+    acceso = logging.getLogger("acceso")
+
+    @app.before_request
+    def _abrir_contexto():
+        g._bitacora_tokens = iniciar_contexto(request.headers.get(CABECERA_REQUEST_ID))
+        g._bitacora_inicio = time.perf_counter()
+
+    @app.after_request
+    def _registrar_acceso(resp):
+        request_id = request_id_actual()
+        if request_id:
+            resp.headers[CABECERA_REQUEST_ID] = request_id
+        inicio = g.pop("_bitacora_inicio", None)
+        if inicio is not None and request.endpoint != "static":
+            datos = {
+                "metodo": request.method,
+                "ruta": request.path,
+                "estado": resp.status_code,
+                "ms": round((time.perf_counter() - inicio) * 1000, 1),
+                "bytes_entrada": request.content_length or 0,
+                "bytes_salida": None if resp.is_streamed else resp.calculate_content_length(),
+            }
+            etapas = etapas_actuales()
+            if etapas:
+                datos["etapas"] = etapas
+            acceso.info("%s %s %s", request.method, request.path, resp.status_code, extra=datos)
+        return resp
+
+    @app.teardown_request
+    def _cerrar_contexto(exc):
+        tokens = g.pop("_bitacora_tokens", None)
+        if tokens:
+            cerrar_contexto(tokens)
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+_FALTA = object()
+
+
+class CacheTTL:
+    """
+    Cache en memoria del proceso, con expiración por entrada y tamaño máximo.
+    Al llenarse descarta primero la entrada menos usada (LRU).
+    Es segura para usarse desde varios hilos del servidor.
+    """
+
+    def __init__(self, ttl: float, max_items: int = 256):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._datos = OrderedDict()  # clave -> (expira_en, valor)
+        self._lock = threading.Lock()
+
+    def get(self, clave, default=None):
+        ahora = time.monotonic()
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                return default
+            expira_en, valor = item
+            if expira_en <= ahora:
+                del self._datos[clave]
+                return default
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor, ttl: float = None):
+        expira_en = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._datos[clave] = (expira_en, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+
+    def obtener_o_calcular(self, clave, calcular, ttl: float = None):
+        """
+        Devuelve el valor cacheado o lo calcula con `calcular()` y lo guarda.
+        """
+        valor = self.get(clave, _FALTA)
+        if valor is _FALTA:
+            valor = calcular()
+            self.set(clave, valor, ttl)
+        return valor
+
+    def borrar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+class CacheBytesLRU:
+    """
+    Cache LRU de valores `bytes` limitada por tamaño total (no por cantidad).
+    Un valor más grande que el presupuesto completo no se guarda.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes_usados = 0
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            valor = self._datos.get(clave)
+            if valor is not None:
+                self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor: bytes):
+        if len(valor) > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self.bytes_usados -= len(anterior)
+            self._datos[clave] = valor
+            self.bytes_usados += len(valor)
+            while self.bytes_usados > self.max_bytes:
+                _, descartado = self._datos.popitem(last=False)
+                self.bytes_usados -= len(descartado)
+
+    def __len__(self):
+        return len(self._datos)
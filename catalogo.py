@@ -0,0 +1,290 @@
+"""
+Catálogo de EPP y riesgos del ATS (ver sql/006_catalogo_ats.sql).
+
+- Cada EPP y riesgo tiene un id estable. El formulario sigue enviando el
+  nombre; el nombre, la columna del PDF y los alias se traducen al id con
+  un dict armado al cargar el catálogo, no con búsquedas de texto por
+  celda. ats_epp_checks / ats_riesgos guardan el id junto al nombre.
+- Cada riesgo trae sus peligros, consecuencias, medidas de control y nivel
+  (A / M / B) para la matriz del PDF.
+- Se cachea CATALOGO_CACHE_SEG segundos en el estado compartido (las filas,
+  no el objeto): cada instancia arma su Catalogo solo cuando cambia la
+  versión. Al vencer solo se consulta la versión (un trigger la sube en
+  cada cambio): si no cambió, no se recarga.
+- Si las tablas no existen o la base falla, se usa el catálogo base de
+  este archivo (el mismo que trae el script SQL).
+"""
+import logging
+import os
+import threading
+import time
+import unicodedata
+
+from estado_compartido import CacheCompartida
+
+log = logging.getLogger(__name__)
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+TABLA_EPP = "catalogo_epp"
+TABLA_RIESGOS = "catalogo_riesgos"
+TABLA_VERSION = "catalogo_ats_version"
+
+CACHE_SEG = int(os.getenv("CATALOGO_CACHE_SEG", "300"))
+# Tras un error se reintenta antes que con el TTL normal
+CACHE_ERROR_SEG = 30
+
+NIVELES = ("A", "M", "B")
+
+# (id, nombre en el formulario, columna del PDF, alias). Orden = orden de columnas.
+EPP_BASE = [
+    ("fotocheck", "Fotocheck", "Fotocheck", []),
+    ("uniforme", "Uniforme", "Uniforme", []),
+    ("casco", "Casco de seguridad", "Casco", []),
+    ("barbiquejo", "Barbuquejo", "Barbiquejo", []),
+    ("lentes", "Lentes de seguridad", "Lentes", []),
+    ("lentes_uv", "Lentes ultravioletas", "UV", ["Lentes UV"]),
+    ("guantes_dielectricos", "Guantes dieléctricos", "Guantes Dielectricos", []),
+    ("guantes_anticorte", "Guantes anticorte", "Guantes Anticorte", []),
+    ("chaleco", "Chaleco reflectivo", "Chaleco", []),
+    ("arnes", "Arnés / cinturón de seguridad", "Arnes", ["Arnés", "Cinturón de seguridad"]),
+    ("botas", "Botas dieléctricas", "Botas", ["Botas de seguridad"]),
+    ("sctr", "SCTR", "SCTR", []),
+]
+
+# (id, nombre, peligros, riesgos, medidas de control, nivel)
+RIESGOS_BASE = [
+    ("caidas_distinto_nivel", "Caídas a distinto nivel",
+     "Trabajo en altura: postes, escaleras, cámaras y buzones",
+     "Caída de persona, fracturas, contusiones",
+     "Arnés con línea de vida, escalera inspeccionada y asegurada, delimitar la zona", "A"),
+    ("transito_vehicular", "Atropellos / tránsito vehicular",
+     "Trabajo en vía pública con circulación de vehículos",
+     "Atropello, golpes",
+     "Conos y señalización, chaleco reflectivo, vigía de tránsito", "A"),
+    ("cortes_fibra", "Cortes con FO / vidrio",
+     "Fragmentos de fibra y vidrio, herramientas de corte",
+     "Cortes, fibra incrustada en piel u ojos",
+     "Guantes anticorte, lentes de seguridad, recipiente para residuos de fibra", "M"),
+    ("contacto_electrico", "Contacto eléctrico",
+     "Redes eléctricas cercanas, equipos energizados",
+     "Electrocución, quemaduras",
+     "Distancia de seguridad, guantes y botas dieléctricas, verificar ausencia de tensión", "A"),
+    ("golpes_herramientas", "Golpes con herramientas",
+     "Herramientas manuales",
+     "Golpes, contusiones",
+     "Herramientas en buen estado, guantes, orden en la zona de trabajo", "B"),
+    ("superficies_inestables", "Deslizamientos / superficies inestables",
+     "Terreno irregular, húmedo o inestable",
+     "Resbalones, caídas al mismo nivel",
+     "Inspeccionar el terreno, calzado de seguridad, orden y limpieza", "M"),
+    ("ergonomico", "Esfuerzo físico / posturas forzadas",
+     "Manipulación de bobinas y cargas, posturas prolongadas",
+     "Lesiones musculoesqueléticas",
+     "Levantar entre dos o con ayuda mecánica, técnica de levantamiento, pausas activas", "M"),
+    ("exposicion_solar", "Exposición solar / calor",
+     "Radiación UV, temperatura elevada",
+     "Quemaduras solares, golpe de calor",
+     "Bloqueador solar, lentes UV, cubrenuca, hidratación", "M"),
+    ("robo_asalto", "Robo / asalto",
+     "Zonas con riesgo de inseguridad",
+     "Agresiones, robo de equipos",
+     "Trabajar en grupo, coordinar con supervisión, no exponer equipos", "M"),
+    ("animales", "Animales (perros, insectos)",
+     "Perros, insectos y roedores en la zona o en cámaras",
+     "Mordeduras, picaduras",
+     "Inspección previa, repelente, mantener distancia", "B"),
+]
+
+# Texto de la matriz para riesgos fuera del catálogo ("Otro riesgo") y
+# para ATS guardados antes del catálogo
+RIESGO_GENERICO = {
+    "id": None,
+    "peligros": "Riesgo mecánico / eléctrico / físico",
+    "riesgo": "Accidente / lesión / caída",
+    "controles": "Uso de EPP / señalización / orden y limpieza",
+    "nivel": "M",
+}
+
+
+def normalizar(texto) -> str:
+    """
+    Minúsculas, sin tildes y con espacios simples: "Arnés " == "arnes".
+    """
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.lower().split())
+
+
+# =========================
+# CATÁLOGO
+# =========================
+class Catalogo:
+    """
+    Catálogo ya indexado. Inmutable: se reemplaza completo al recargar, así
+    un render en curso no ve cambios a mitad de camino.
+    """
+
+    def __init__(self, epp: list, riesgos: list, version=None):
+        self.version = version
+        self.epp = epp          # [{"id", "nombre", "columna", "alias"}], en orden de columnas
+        self.riesgos = riesgos  # [{"id", "nombre", "peligros", "riesgo", "controles", "nivel"}]
+
+        self._id_epp = {}
+        for e in epp:
+            for texto in [e["nombre"], e["columna"]] + list(e.get("alias") or []):
+                self._id_epp.setdefault(normalizar(texto), e["id"])
+        self._riesgo = {normalizar(r["nombre"]): r for r in riesgos}
+
+        self.nombres_epp = [e["nombre"] for e in epp]
+        self.nombres_riesgos = [r["nombre"] for r in riesgos]
+        self.ids_columnas_epp = [e["id"] for e in epp]
+        self.etiquetas_epp = [e["columna"] for e in epp]
+
+    @classmethod
+    def base(cls):
+        epp = [
+            {"id": i, "nombre": n, "columna": c, "alias": a}
+            for i, n, c, a in EPP_BASE
+        ]
+        riesgos = [
+            {"id": i, "nombre": n, "peligros": p, "riesgo": r, "controles": c, "nivel": nv}
+            for i, n, p, r, c, nv in RIESGOS_BASE
+        ]
+        return cls(epp, riesgos, version=None)
+
+    def id_epp(self, nombre):
+        """
+        Id del EPP (nombre del formulario, columna o alias) o None.
+        """
+        return self._id_epp.get(normalizar(nombre))
+
+    def ids_epp(self, epps) -> set:
+        """
+        Ids del EPP marcado por un técnico (nombres del formulario o alias).
+        """
+        ids = set()
+        for e in epps or []:
+            id_epp = self.id_epp(e)
+            if id_epp:
+                ids.add(id_epp)
+        return ids
+
+    def id_riesgo(self, nombre):
+        """
+        Id del riesgo del catálogo o None ("Otro riesgo", texto libre).
+        """
+        r = self._riesgo.get(normalizar(nombre))
+        return r["id"] if r else None
+
+    def resolver_riesgos(self, nombres) -> list:
+        """
+        Filas de la matriz para los riesgos marcados, en el orden recibido.
+        Los que no están en el catálogo llevan el texto genérico.
+        """
+        filas = []
+        for nombre in nombres or []:
+            r = self._riesgo.get(normalizar(nombre))
+            fila = dict(r) if r else dict(RIESGO_GENERICO)
+            fila["nombre"] = nombre
+            filas.append(fila)
+        return filas
+
+
+_BASE = Catalogo.base()
+_vigente = _BASE
+# {"version", "epp", "riesgos"} del último catálogo cargado por cualquier instancia
+_cache = CacheCompartida("catalogo", ttl=CACHE_SEG)
+_lock = threading.Lock()
+_error_hasta = 0.0  # tras un error no se consulta la base hasta esta hora (monotónica)
+
+
+def vigente() -> Catalogo:
+    """
+    Último catálogo cargado (o el base), sin consultar la base.
+    """
+    return _vigente
+
+
+def obtener(client) -> Catalogo:
+    """
+    Catálogo vigente, revisando la versión en la base como mucho una vez
+    cada CATALOGO_CACHE_SEG segundos.
+    """
+    global _vigente, _error_hasta
+    datos = _cache.get("datos")
+    if datos is not None:
+        return _desde_cache(datos)
+    if time.monotonic() < _error_hasta:
+        return _vigente
+
+    with _lock:
+        datos = _cache.get("datos")
+        if datos is not None:
+            return _desde_cache(datos)
+        try:
+            version = _consultar_version(client)
+            if version is not None and version == _vigente.version:
+                cat = _vigente
+            else:
+                cat = _cargar(client, version)
+        except Exception as e:
+            log.warning("No se pudo cargar el catálogo de EPP y riesgos (se usa el vigente): %s", e)
+            _error_hasta = time.monotonic() + CACHE_ERROR_SEG
+            return _vigente
+        _vigente = cat
+        _cache.set("datos", {"version": cat.version, "epp": cat.epp, "riesgos": cat.riesgos})
+        return cat
+
+
+def _desde_cache(datos: dict) -> Catalogo:
+    # Otra instancia (o esta) ya cargó esta versión: se reutiliza el objeto.
+    # Sin versión (falta la tabla de versión o se usa el catálogo base) se
+    # comparan los datos, que son pocos, para no reconstruir en cada request.
+    global _vigente
+    cat = _vigente
+    if datos["version"] is None and cat.version is None:
+        igual = datos["epp"] == cat.epp and datos["riesgos"] == cat.riesgos
+    else:
+        igual = datos["version"] == cat.version
+    if not igual:
+        cat = _vigente = Catalogo(datos["epp"], datos["riesgos"], datos["version"])
+    return cat
+
+
+def invalidar():
+    _cache.borrar("datos")
+
+
+def _consultar_version(client):
+    filas = client.table(TABLA_VERSION).select("version").limit(1).execute().data or []
+    return filas[0].get("version") if filas else None
+
+
+def _cargar(client, version) -> Catalogo:
+    epp = (
+        client.table(TABLA_EPP)
+        .select("id,nombre,columna,alias")
+        .eq("activo", True)
+        .order("orden")
+        .execute()
+    ).data or []
+    riesgos = (
+        client.table(TABLA_RIESGOS)
+        .select("id,nombre,peligros,riesgo,controles,nivel")
+        .eq("activo", True)
+        .order("orden")
+        .execute()
+    ).data or []
+    if not epp or not riesgos:
+        log.warning("Catálogo de EPP o riesgos vacío en la base: se usa el catálogo base")
+        return Catalogo(_BASE.epp, _BASE.riesgos, version)
+
+    for r in riesgos:
+        if r.get("nivel") not in NIVELES:
+            r["nivel"] = RIESGO_GENERICO["nivel"]
+    log.info("Catálogo de EPP y riesgos cargado",
+             extra={"version": version, "epp": len(epp), "riesgos": len(riesgos)})
+    return Catalogo(epp, riesgos, version)
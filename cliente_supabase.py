@@ -0,0 +1,294 @@
+"""
+Cliente Supabase compartido por la app web y los scripts.
+
+- Un solo httpx.Client (lo usan la API REST y Storage) con pool de
+  conexiones acotado y timeouts por operación: consultas cortas, subidas y
+  descargas de Storage más largas. Esperar un hueco libre en el pool
+  también tiene timeout, así un Supabase lento no deja hilos colgados.
+- Las lecturas (GET / HEAD) se reintentan con backoff exponencial y jitter
+  ante errores de conexión, timeouts y 502 / 503 / 504. Las escrituras no:
+  un insert que llegó pero cuya respuesta se perdió quedaría duplicado.
+- Circuit breaker por servicio (rest, storage): tras SUPABASE_CIRCUITO_FALLOS
+  llamadas fallidas seguidas se abre y durante SUPABASE_CIRCUITO_SEG las
+  llamadas fallan al instante con CircuitoAbierto. Luego deja pasar una
+  llamada de prueba: si responde se cierra, si no vuelve a abrirse.
+- referencia(): datos de referencia (técnicos, charlas) cacheados en el
+  estado compartido que, si la base falla o el circuito está abierto,
+  devuelven la última copia buena.
+- estado(): estado de los circuitos y contadores, para /salud.
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+from supabase import Client, ClientOptions, create_client
+
+from estado_compartido import CacheCompartida
+
+log = logging.getLogger(__name__)
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+# Conexiones por proceso. Con gunicorn conviene igualarlo a --threads;
+# el servidor de desarrollo de Flask abre un hilo por request.
+POOL_CONEXIONES = int(os.getenv("SUPABASE_POOL_CONEXIONES", "10"))
+
+TIMEOUT_CONEXION_SEG = float(os.getenv("SUPABASE_TIMEOUT_CONEXION_SEG", "3"))
+TIMEOUT_POOL_SEG = float(os.getenv("SUPABASE_TIMEOUT_POOL_SEG", "5"))
+TIMEOUT_CONSULTA_SEG = float(os.getenv("SUPABASE_TIMEOUT_CONSULTA_SEG", "10"))
+TIMEOUT_STORAGE_SEG = float(os.getenv("SUPABASE_TIMEOUT_STORAGE_SEG", "30"))
+
+REINTENTOS = int(os.getenv("SUPABASE_REINTENTOS", "2"))
+BACKOFF_BASE_SEG = 0.2
+BACKOFF_MAX_SEG = 2.0
+ESTADOS_REINTENTABLES = {502, 503, 504}
+METODOS_REINTENTABLES = {"GET", "HEAD"}
+
+CIRCUITO_FALLOS = int(os.getenv("SUPABASE_CIRCUITO_FALLOS", "5"))
+CIRCUITO_SEG = float(os.getenv("SUPABASE_CIRCUITO_SEG", "30"))
+
+REFERENCIA_CACHE_SEG = int(os.getenv("SUPABASE_REFERENCIA_CACHE_SEG", "60"))
+
+TIMEOUTS = {
+    "rest": httpx.Timeout(TIMEOUT_CONSULTA_SEG, connect=TIMEOUT_CONEXION_SEG, pool=TIMEOUT_POOL_SEG),
+    "storage": httpx.Timeout(TIMEOUT_STORAGE_SEG, connect=TIMEOUT_CONEXION_SEG, pool=TIMEOUT_POOL_SEG),
+}
+TIMEOUTS["otros"] = TIMEOUTS["rest"]
+
+
+class CircuitoAbierto(httpx.TransportError):
+    """
+    Supabase viene fallando y no se intentó la llamada.
+    """
+
+    def __init__(self, servicio: str, espera: float, request=None):
+        super().__init__(
+            f"Supabase {servicio} no disponible (circuito abierto, reintento en {espera:.0f} s)",
+            request=request,
+        )
+        self.servicio = servicio
+        self.espera = espera
+
+
+# =========================
+# CIRCUIT BREAKER
+# =========================
+class Circuito:
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+    def __init__(self, servicio: str, umbral: int = CIRCUITO_FALLOS, espera: float = CIRCUITO_SEG):
+        self.servicio = servicio
+        self.umbral = umbral
+        self.espera = espera
+        self.estado = self.CERRADO
+        self._fallos_seguidos = 0
+        self._proximo_intento = 0.0
+        self._lock = threading.Lock()
+        self.contadores = {"llamadas": 0, "fallos": 0, "reintentos": 0, "rechazadas": 0, "aperturas": 0}
+
+    def permitir(self, request=None):
+        """
+        Deja pasar la llamada o lanza CircuitoAbierto. Abierto el tiempo de
+        espera, deja pasar una sola llamada de prueba (semiabierto).
+        """
+        with self._lock:
+            self.contadores["llamadas"] += 1
+            if self.estado == self.CERRADO:
+                return
+            ahora = time.monotonic()
+            if ahora >= self._proximo_intento:
+                # Si la prueba no informa resultado, otra puede pasar tras la espera
+                self.estado = self.SEMIABIERTO
+                self._proximo_intento = ahora + self.espera
+                return
+            self.contadores["rechazadas"] += 1
+            espera = self._proximo_intento - ahora
+        raise CircuitoAbierto(self.servicio, espera, request=request)
+
+    @property
+    def abierto(self) -> bool:
+        return self.estado == self.ABIERTO
+
+    def exito(self):
+        with self._lock:
+            self._fallos_seguidos = 0
+            if self.estado != self.CERRADO:
+                log.info("Circuito Supabase cerrado: el servicio responde", extra={"servicio": self.servicio})
+            self.estado = self.CERRADO
+
+    def fallo(self, motivo: str):
+        with self._lock:
+            self.contadores["fallos"] += 1
+            self._fallos_seguidos += 1
+            if self.estado == self.SEMIABIERTO or (
+                self.estado == self.CERRADO and self._fallos_seguidos >= self.umbral
+            ):
+                self.estado = self.ABIERTO
+                self._proximo_intento = time.monotonic() + self.espera
+                self.contadores["aperturas"] += 1
+                log.warning(
+                    "Circuito Supabase abierto por %s fallos seguidos: %s",
+                    self._fallos_seguidos, motivo,
+                    extra={"servicio": self.servicio, "espera_seg": self.espera},
+                )
+
+    def contar_reintento(self):
+        with self._lock:
+            self.contadores["reintentos"] += 1
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return dict(
+                self.contadores,
+                estado=self.estado,
+                fallos_seguidos=self._fallos_seguidos,
+                reintento_en_seg=(
+                    round(max(self._proximo_intento - time.monotonic(), 0), 1)
+                    if self.estado != self.CERRADO else 0
+                ),
+            )
+
+
+_circuitos = {s: Circuito(s) for s in TIMEOUTS}
+
+
+def _servicio(path: str) -> str:
+    # /rest/v1/... -> rest, /storage/v1/... -> storage
+    servicio = path.lstrip("/").split("/", 1)[0]
+    return servicio if servicio in _circuitos else "otros"
+
+
+def _backoff(intento: int) -> float:
+    # Exponencial con jitter completo: evita que todos los hilos reintenten juntos
+    return random.uniform(0, min(BACKOFF_MAX_SEG, BACKOFF_BASE_SEG * 2 ** intento))
+
+
+# =========================
+# TRANSPORTE
+# =========================
+class TransporteResiliente(httpx.BaseTransport):
+    """
+    Envuelve el transporte httpx: timeouts por servicio, reintentos de
+    lecturas y circuit breaker.
+    """
+
+    def __init__(self, base: httpx.BaseTransport):
+        self._base = base
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        servicio = _servicio(request.url.path)
+        circuito = _circuitos[servicio]
+        request.extensions["timeout"] = TIMEOUTS[servicio].as_dict()
+        intentos = 1 + (REINTENTOS if request.method in METODOS_REINTENTABLES else 0)
+
+        circuito.permitir(request)
+        for intento in range(intentos):
+            ultimo = intento == intentos - 1 or circuito.abierto
+            try:
+                resp = self._base.handle_request(request)
+            except httpx.TransportError as e:
+                if ultimo:
+                    circuito.fallo(f"{type(e).__name__}: {e}")
+                    raise
+                motivo = type(e).__name__
+            else:
+                if resp.status_code not in ESTADOS_REINTENTABLES:
+                    circuito.exito()
+                    return resp
+                if ultimo:
+                    circuito.fallo(f"HTTP {resp.status_code}")
+                    return resp
+                resp.close()
+                motivo = f"HTTP {resp.status_code}"
+
+            espera = _backoff(intento)
+            circuito.contar_reintento()
+            log.info("Reintentando lectura en Supabase (%s)", motivo,
+                     extra={"servicio": servicio, "intento": intento + 1, "espera_seg": round(espera, 2)})
+            time.sleep(espera)
+
+    def close(self):
+        self._base.close()
+
+
+# =========================
+# CLIENTE
+# =========================
+def crear_cliente(url: str, key: str) -> Client:
+    http = httpx.Client(
+        transport=TransporteResiliente(httpx.HTTPTransport(
+            limits=httpx.Limits(
+                max_connections=POOL_CONEXIONES,
+                max_keepalive_connections=POOL_CONEXIONES,
+            ),
+            retries=0,
+        )),
+        timeout=TIMEOUTS["rest"],
+        follow_redirects=True,
+    )
+    return create_client(url, key, options=ClientOptions(httpx_client=http))
+
+
+def cliente_desde_env() -> Client:
+    """
+    Cliente para los scripts de consola (lee el .env).
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_ANON_KEY")
+    if not url or not key:
+        raise RuntimeError("Falta configurar SUPABASE_URL o SUPABASE_ANON_KEY en el .env")
+    return crear_cliente(url, key)
+
+
+# =========================
+# DATOS DE REFERENCIA
+# =========================
+_referencias = CacheCompartida("referencia", ttl=REFERENCIA_CACHE_SEG)
+# Sin vencimiento: es el respaldo cuando Supabase no responde
+_ultima_copia = CacheCompartida("referencia:ultima")
+
+
+def referencia(clave: str, consulta, ttl: int = None):
+    """
+    Resultado de `consulta()` cacheado `ttl` segundos. Si la consulta falla
+    se devuelve la última copia buena (aunque esté vencida); sin copia, el
+    error se propaga.
+    """
+    valor = _referencias.get(clave)
+    if valor is not None:
+        return valor
+    try:
+        valor = consulta()
+    except Exception as e:
+        copia = _ultima_copia.get(clave)
+        if copia is None:
+            raise
+        log.warning("Supabase no responde, se usa la última copia de %s: %s", clave, e)
+        return copia
+    _referencias.set(clave, valor, ttl=ttl)
+    _ultima_copia.set(clave, valor)
+    return valor
+
+
+# =========================
+# MÉTRICAS
+# =========================
+def estado() -> dict:
+    circuitos = {s: c.resumen() for s, c in _circuitos.items()}
+    return {
+        "estado": "ok" if all(c["estado"] == Circuito.CERRADO for c in circuitos.values()) else "degradado",
+        "circuitos": circuitos,
+        "pool_conexiones": POOL_CONEXIONES,
+        "timeouts_seg": {"consulta": TIMEOUT_CONSULTA_SEG, "storage": TIMEOUT_STORAGE_SEG,
+                         "conexion": TIMEOUT_CONEXION_SEG, "pool": TIMEOUT_POOL_SEG},
+    }
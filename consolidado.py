@@ -0,0 +1,538 @@
+"""
+PDF consolidado del día: todos los ATS de una zona o de un supervisor en
+un solo documento, con página índice y marcadores por reporte.
+
+- Los reportes se agregan de a uno: se descarga (o regenera desde el
+  payload) el PDF, sus objetos se escriben directo en el archivo de salida
+  y se suelta antes del siguiente. En memoria solo quedan las posiciones
+  de los objetos, así el consumo no crece con el tamaño del consolidado.
+- Los streams idénticos (logo, fotos repetidas) se escriben una sola vez.
+- El índice se escribe al final, pero queda como primera página (el orden
+  de las páginas lo da el árbol de páginas, no la posición en el archivo).
+
+La ruta web /consolidado atiende hasta CONSOLIDADO_WEB_MAX_REPORTES
+reportes dentro del request; días más grandes se filtran por zona o
+supervisor, o se generan por consola.
+
+Uso por consola:
+    python consolidado.py --fecha 2025-11-09 --zona NORTE
+    python consolidado.py --fecha 2025-11-09 --supervisor "CARLOS ROCA" -o roca.pdf
+"""
+import argparse
+import hashlib
+import io
+import logging
+import os
+from datetime import date
+
+from pypdf import PdfReader
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    NumberObject,
+    StreamObject,
+    TextStringObject,
+)
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.units import cm
+from reportlab.platypus import SimpleDocTemplate, Spacer, Table, TableStyle
+
+import ats_payload
+import bitacora
+import cliente_supabase
+import historial
+from generate_pdf import IMG, P
+
+log = logging.getLogger(__name__)
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+TAMANO_LOTE = 500
+# Tope de reportes por consolidado (un día de todas las zonas ronda los cientos)
+MAX_REPORTES = int(os.getenv("CONSOLIDADO_MAX_REPORTES", "1000"))
+# Tope para la ruta web, que arma el consolidado dentro del request
+MAX_REPORTES_WEB = int(os.getenv("CONSOLIDADO_WEB_MAX_REPORTES", "50"))
+
+AZUL = colors.HexColor("#002b5c")
+GRIS = colors.HexColor("#f2f3f5")
+
+
+# =========================
+# REGISTROS DEL DÍA
+# =========================
+def registros_del_dia(client, fecha: str, zona: str = None, supervisor: str = None,
+                      max_reportes: int = None) -> list:
+    """
+    Registros de la fecha (solo columnas, sin PDFs) ordenados por zona y brigada.
+    Se recortan a `max_reportes` (por defecto MAX_REPORTES).
+    """
+    max_reportes = max_reportes or MAX_REPORTES
+    lote = min(TAMANO_LOTE, max_reportes)
+    filtros = {"desde": fecha, "hasta": fecha}
+    if zona:
+        filtros["zona"] = zona
+    if supervisor:
+        filtros["supervisor"] = supervisor
+
+    registros = []
+    despues_de = None
+    while len(registros) < max_reportes:
+        filas = historial.consultar_pagina(client, filtros, despues_de, lote)
+        registros.extend(filas)
+        if len(filas) < lote:
+            break
+        despues_de = (filas[-1]["fecha"], filas[-1]["id"])
+
+    if len(registros) > max_reportes:
+        log.warning("Consolidado recortado a %s reportes", max_reportes, extra=filtros)
+        registros = registros[:max_reportes]
+    return sorted(registros, key=lambda r: (r.get("zona") or "", r.get("brigada") or "", r["id"]))
+
+
+def _pdf_registro(client, bucket: str, registro: dict):
+    """
+    Bytes del PDF del reporte o None si no se pudo obtener.
+    """
+    try:
+        if registro.get("payload_path"):
+            # Sin guardar en el cache de renders: un consolidado lo vaciaría
+            return ats_payload.obtener_pdf(client, bucket, registro["payload_path"], guardar_cache=False)
+        if registro.get("pdf_path"):
+            return client.storage.from_(bucket).download(registro["pdf_path"])
+    except Exception as e:
+        log.warning("No se pudo obtener el PDF del ATS %s para el consolidado: %s",
+                    registro.get("id"), e)
+    return None
+
+
+# =========================
+# ÍNDICE
+# =========================
+def _titulo(fecha: str, zona: str = None, supervisor: str = None) -> str:
+    partes = [f"Consolidado ATS {fecha}"]
+    if zona:
+        partes.append(f"Zona {zona}")
+    if supervisor:
+        partes.append(f"Supervisor {supervisor}")
+    return " – ".join(partes)
+
+
+def _indice(titulo: str, entradas: list, desplazamiento: int) -> bytes:
+    """
+    Páginas del índice. `desplazamiento` = páginas del propio índice, para
+    numerar las páginas de cada reporte en el documento final.
+    """
+    filas = [[
+        P("N°", True), P("Brigada", True), P("Zona", True), P("Contrata", True),
+        P("Supervisor", True), P("Registrado por", True), P("Técnicos", True), P("Página", True),
+    ]]
+    for n, (registro, inicio) in enumerate(entradas, start=1):
+        filas.append([
+            P(n),
+            P(registro.get("brigada") or "-", False, 7, "LEFT"),
+            P(registro.get("zona") or "-"),
+            P(registro.get("contrata") or "-", False, 7, "LEFT"),
+            P(registro.get("supervisor") or "-", False, 7, "LEFT"),
+            P(registro.get("usuario_registro") or "-"),
+            P(registro.get("tecnicos_count") or 0),
+            P(inicio + desplazamiento + 1 if inicio is not None else "No disponible"),
+        ])
+
+    tabla = Table(
+        filas,
+        # 1.0 + 5.0 + 3.0 + 5.0 + 5.0 + 3.7 + 2.0 + 3.0 = 27.7
+        colWidths=[1.0 * cm, 5.0 * cm, 3.0 * cm, 5.0 * cm, 5.0 * cm, 3.7 * cm, 2.0 * cm, 3.0 * cm],
+        repeatRows=1,
+    )
+    tabla.setStyle(
+        TableStyle(
+            [
+                ("BOX", (0, 0), (-1, -1), 0.6, colors.black),
+                ("INNERGRID", (0, 0), (-1, -1), 0.25, colors.black),
+                ("BACKGROUND", (0, 0), (-1, 0), GRIS),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+            ]
+        )
+    )
+
+    incluidos = sum(1 for _, inicio in entradas if inicio is not None)
+    story = [
+        IMG("static/logo_cicsa.png", 4.5 * cm, 1.5 * cm),
+        Spacer(1, 6),
+        P(titulo, True, 11, "LEFT", AZUL, True),
+        P(f"{incluidos} de {len(entradas)} reportes incluidos", False, 8, "LEFT"),
+        Spacer(1, 6),
+        tabla,
+    ]
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=landscape(A4),
+        leftMargin=1.0 * cm,
+        rightMargin=1.0 * cm,
+        topMargin=0.8 * cm,
+        bottomMargin=0.8 * cm,
+        title=titulo,
+        author="CICSA PERU S.A.C.",
+        creator="Plataforma ATS CICSA",
+    )
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def _indice_paginado(titulo: str, entradas: list):
+    """
+    El índice puede ocupar varias páginas y eso corre la numeración: se arma
+    una vez para contar sus páginas y otra con los números definitivos.
+    """
+    paginas = len(PdfReader(io.BytesIO(_indice(titulo, entradas, 1))).pages)
+    pdf = _indice(titulo, entradas, paginas)
+    return pdf, paginas
+
+
+# =========================
+# ESCRITURA INCREMENTAL
+# =========================
+class EscritorPDF:
+    """
+    Escribe un PDF objeto por objeto en `salida` (archivo binario, no hace
+    falta que se pueda hacer seek). Las páginas se copian de PDFs leídos con
+    pypdf y se renumeran; al cerrar se escriben el árbol de páginas, los
+    marcadores, el catálogo y la tabla xref.
+    """
+
+    _EN_CURSO = object()
+
+    def __init__(self, salida):
+        self._salida = salida
+        self._pos = 0
+        self._offsets = [None]  # offsets[n] = posición del objeto n
+        self._por_hash = {}     # sha256 de un stream ya escrito -> número
+        self._pendientes = None      # (número, bytes) del PDF que se está copiando
+        self._hashes_pendientes = {}
+        self._raiz_paginas = self._reservar()
+        self.paginas = []       # números de objeto de las páginas, en orden
+        self._escribir_bytes(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    # --- bajo nivel ---
+    def _escribir_bytes(self, datos: bytes):
+        self._salida.write(datos)
+        self._pos += len(datos)
+
+    def _reservar(self) -> int:
+        self._offsets.append(None)
+        return len(self._offsets) - 1
+
+    def _escribir_objeto(self, numero: int, datos: bytes):
+        if self._pendientes is not None:
+            self._pendientes.append((numero, datos))
+            return
+        self._offsets[numero] = self._pos
+        self._escribir_bytes(b"%d 0 obj\n" % numero + datos + b"\nendobj\n")
+
+    @staticmethod
+    def _serializar(obj) -> bytes:
+        buffer = io.BytesIO()
+        (NullObject() if obj is None else obj).write_to_stream(buffer)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _ref(numero: int) -> IndirectObject:
+        return IndirectObject(numero, 0, None)
+
+    # --- copia de objetos ---
+    def _convertir(self, obj, lector, mapa):
+        if isinstance(obj, IndirectObject):
+            return self._ref(self._copiar_objeto(lector, obj.idnum, mapa))
+        if isinstance(obj, StreamObject):
+            copia = obj.__class__()
+            for k, v in obj.items():
+                copia[NameObject(k)] = self._convertir(v, lector, mapa)
+            copia._data = obj._data  # datos tal cual (ya comprimidos)
+            return copia
+        if isinstance(obj, DictionaryObject):
+            copia = DictionaryObject()
+            for k, v in obj.items():
+                copia[NameObject(k)] = self._convertir(v, lector, mapa)
+            return copia
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._convertir(v, lector, mapa) for v in obj)
+        return obj
+
+    def _copiar_objeto(self, lector, idnum: int, mapa: dict) -> int:
+        """
+        Copia el objeto `idnum` del lector (y lo que referencia) y devuelve su
+        número en la salida. Los streams repetidos reutilizan el ya escrito.
+        """
+        numero = mapa.get(idnum)
+        if numero is self._EN_CURSO:
+            # Referencia circular: se fija el número antes de terminar de copiarlo
+            numero = mapa[idnum] = self._reservar()
+        if numero is not None:
+            return numero
+
+        mapa[idnum] = self._EN_CURSO
+        obj = lector.get_object(idnum)
+        datos = self._serializar(self._convertir(obj, lector, mapa))
+
+        numero = mapa[idnum]
+        if numero is not self._EN_CURSO:
+            self._escribir_objeto(numero, datos)
+            return numero
+
+        clave = hashlib.sha256(datos).digest() if isinstance(obj, StreamObject) else None
+        numero = None
+        if clave:
+            numero = self._por_hash.get(clave) or self._hashes_pendientes.get(clave)
+        if numero is None:
+            numero = self._reservar()
+            self._escribir_objeto(numero, datos)
+            if clave:
+                self._hashes_pendientes[clave] = numero
+        mapa[idnum] = numero
+        return numero
+
+    def agregar_pdf(self, pdf: bytes) -> int:
+        """
+        Agrega todas las páginas de `pdf`. Devuelve el índice (desde 0) de
+        su primera página en el documento.
+        Todo o nada: los objetos se preparan en memoria y se escriben recién
+        cuando el PDF se leyó completo. Si falla, la salida queda como estaba.
+        """
+        inicio = len(self.paginas)
+        reservados = len(self._offsets)
+        self._pendientes = []
+        self._hashes_pendientes = {}
+        try:
+            nuevas = self._preparar(pdf)
+            pendientes, hashes = self._pendientes, self._hashes_pendientes
+        except Exception:
+            # Se descartan los números reservados para este PDF
+            del self._offsets[reservados:]
+            raise
+        finally:
+            self._pendientes = None
+            self._hashes_pendientes = {}
+
+        for numero, datos in pendientes:
+            self._escribir_objeto(numero, datos)
+        self._por_hash.update(hashes)
+        self.paginas.extend(nuevas)
+        return inicio
+
+    def _preparar(self, pdf: bytes) -> list:
+        lector = PdfReader(io.BytesIO(pdf))
+        mapa = {}
+        paginas = []
+        # Primero se numeran las páginas, por si algún objeto las referencia
+        for pagina in lector.pages:
+            numero = self._reservar()
+            mapa[pagina.indirect_reference.idnum] = numero
+            paginas.append((numero, pagina))
+
+        for numero, pagina in paginas:
+            copia = DictionaryObject()
+            for k, v in pagina.items():
+                if k != "/Parent":
+                    copia[NameObject(k)] = self._convertir(v, lector, mapa)
+            copia[NameObject("/Parent")] = self._ref(self._raiz_paginas)
+            self._escribir_objeto(numero, self._serializar(copia))
+        return [numero for numero, _ in paginas]
+
+    # --- cierre ---
+    def _escribir_marcadores(self, items: list, padre: int) -> tuple:
+        """
+        items = [(título, índice de página, hijos)]. Devuelve (primero,
+        último, cantidad visible) para el padre.
+        """
+        numeros = [self._reservar() for _ in items]
+        visibles = len(items)
+        for i, (titulo, pagina, hijos) in enumerate(items):
+            d = DictionaryObject({
+                NameObject("/Title"): TextStringObject(titulo),
+                NameObject("/Parent"): self._ref(padre),
+                NameObject("/Dest"): ArrayObject([self._ref(self.paginas[pagina]), NameObject("/Fit")]),
+            })
+            if i > 0:
+                d[NameObject("/Prev")] = self._ref(numeros[i - 1])
+            if i < len(items) - 1:
+                d[NameObject("/Next")] = self._ref(numeros[i + 1])
+            if hijos:
+                primero, ultimo, cantidad = self._escribir_marcadores(hijos, numeros[i])
+                d[NameObject("/First")] = self._ref(primero)
+                d[NameObject("/Last")] = self._ref(ultimo)
+                d[NameObject("/Count")] = NumberObject(cantidad)
+                visibles += cantidad
+            self._escribir_objeto(numeros[i], self._serializar(d))
+        return numeros[0], numeros[-1], visibles
+
+    def cerrar(self, orden: list, marcadores: list, info: dict):
+        """
+        `orden`: índices de página en el orden final. `marcadores`: ver
+        _escribir_marcadores. `info`: metadatos (/Title, /Author...).
+        """
+        kids = ArrayObject(self._ref(self.paginas[i]) for i in orden)
+        self._escribir_objeto(self._raiz_paginas, self._serializar(DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): kids,
+            NameObject("/Count"): NumberObject(len(kids)),
+        })))
+
+        catalogo = DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): self._ref(self._raiz_paginas),
+        })
+        if marcadores:
+            raiz = self._reservar()
+            primero, ultimo, cantidad = self._escribir_marcadores(marcadores, raiz)
+            self._escribir_objeto(raiz, self._serializar(DictionaryObject({
+                NameObject("/Type"): NameObject("/Outlines"),
+                NameObject("/First"): self._ref(primero),
+                NameObject("/Last"): self._ref(ultimo),
+                NameObject("/Count"): NumberObject(cantidad),
+            })))
+            catalogo[NameObject("/Outlines")] = self._ref(raiz)
+            catalogo[NameObject("/PageMode")] = NameObject("/UseOutlines")
+        num_catalogo = self._reservar()
+        self._escribir_objeto(num_catalogo, self._serializar(catalogo))
+
+        num_info = self._reservar()
+        self._escribir_objeto(num_info, self._serializar(DictionaryObject({
+            NameObject(k): TextStringObject(v) for k, v in info.items()
+        })))
+
+        inicio_xref = self._pos
+        lineas = [b"xref\n0 %d\n" % len(self._offsets), b"0000000000 65535 f \n"]
+        for offset in self._offsets[1:]:
+            lineas.append(b"%010d 00000 n \n" % offset if offset is not None else b"0000000000 65535 f \n")
+        self._escribir_bytes(b"".join(lineas))
+        self._escribir_bytes(
+            b"trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(self._offsets), num_catalogo, num_info, inicio_xref)
+        )
+
+
+# =========================
+# CONSOLIDADO
+# =========================
+def generar_consolidado(client, bucket: str, fecha: str, destino,
+                        zona: str = None, supervisor: str = None, registros: list = None) -> dict:
+    """
+    Escribe el consolidado en `destino` (ruta o archivo binario).
+    `registros` evita volver a consultarlos si ya se tienen (registros_del_dia).
+    Devuelve {"reportes", "incluidos", "paginas"}; reportes = 0 si no hay ATS.
+    """
+    if registros is None:
+        registros = registros_del_dia(client, fecha, zona, supervisor)
+    resultado = {"reportes": len(registros), "incluidos": 0, "paginas": 0}
+    if not registros:
+        return resultado
+
+    titulo = _titulo(fecha, zona, supervisor)
+    propio = isinstance(destino, (str, os.PathLike))
+    salida = open(destino, "wb") if propio else destino
+    try:
+        escritor = EscritorPDF(salida)
+        entradas = []    # (registro, página inicial sin contar el índice | None)
+        reportes = []    # (zona, título, página inicial)
+
+        for registro in registros:
+            pdf = _pdf_registro(client, bucket, registro)
+            if pdf is None:
+                entradas.append((registro, None))
+                continue
+            try:
+                inicio = escritor.agregar_pdf(pdf)
+            except Exception as e:
+                log.warning("PDF del ATS %s ilegible, se omite del consolidado: %s", registro.get("id"), e)
+                entradas.append((registro, None))
+                continue
+            finally:
+                del pdf
+            entradas.append((registro, inicio))
+            reportes.append((
+                registro.get("zona") or "SIN ZONA",
+                f"{registro.get('brigada') or 'SIN BRIGADA'} – {registro.get('contrata') or '-'}",
+                inicio,
+            ))
+
+        paginas_reportes = len(escritor.paginas)
+        indice, paginas_indice = _indice_paginado(titulo, entradas)
+        escritor.agregar_pdf(indice)
+        orden = list(range(paginas_reportes, len(escritor.paginas))) + list(range(paginas_reportes))
+
+        # Marcadores: índice y un grupo por zona si hay más de una.
+        # Las páginas se refieren por índice en escritor.paginas.
+        marcadores = [("Índice", paginas_reportes, [])]
+        if len({z for z, _, _ in reportes}) > 1:
+            grupos = {}
+            for zona_reg, texto, inicio in reportes:
+                if zona_reg not in grupos:
+                    grupos[zona_reg] = (f"Zona {zona_reg}", inicio, [])
+                    marcadores.append(grupos[zona_reg])
+                grupos[zona_reg][2].append((texto, inicio, []))
+        else:
+            marcadores.extend((texto, inicio, []) for _, texto, inicio in reportes)
+
+        escritor.cerrar(orden, marcadores, {
+            "/Title": titulo,
+            "/Author": "CICSA PERU S.A.C.",
+            "/Producer": "Plataforma ATS CICSA",
+        })
+    finally:
+        if propio:
+            salida.close()
+
+    resultado["incluidos"] = len(reportes)
+    resultado["paginas"] = len(orden)
+    log.info("Consolidado ATS generado", extra=dict(resultado, fecha=fecha, zona=zona, supervisor=supervisor))
+    return resultado
+
+
+def nombre_archivo(fecha: str, zona: str = None, supervisor: str = None) -> str:
+    sufijo = "_".join(
+        (v or "").strip().replace(" ", "_") for v in (zona, supervisor) if v
+    )
+    return f"ATS_consolidado_{fecha}{'_' + sufijo if sufijo else ''}.pdf"
+
+
+# =========================
+# CLI
+# =========================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDF consolidado de los ATS de un día")
+    parser.add_argument("--fecha", default=date.today().isoformat(), help="Fecha (YYYY-MM-DD), por defecto hoy")
+    parser.add_argument("--zona")
+    parser.add_argument("--supervisor")
+    parser.add_argument("--bucket", default=os.getenv("SUPABASE_PDF_BUCKET", "ats_pdfs"))
+    parser.add_argument("-o", "--salida", help="Archivo de salida (por defecto se genera el nombre)")
+    args = parser.parse_args(argv)
+
+    bitacora.configurar_logging()
+    try:
+        date.fromisoformat(args.fecha)
+    except ValueError:
+        parser.error("--fecha debe tener el formato YYYY-MM-DD")
+
+    salida = args.salida or nombre_archivo(args.fecha, args.zona, args.supervisor)
+    client = cliente_supabase.cliente_desde_env()
+    with bitacora.contexto():
+        resultado = generar_consolidado(client, args.bucket, args.fecha, salida, args.zona, args.supervisor)
+
+    if not resultado["reportes"]:
+        print("No hay ATS registrados para ese día y filtro.")
+        return 1
+    print(f"✅ Consolidado listo: {salida} ({resultado['incluidos']} de {resultado['reportes']} "
+          f"reportes, {resultado['paginas']} páginas)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,259 @@
+import os
+import threading
+from datetime import date, timedelta
+
+from cache_local import CacheTTL
+import historial
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+MAX_DIAS_RANGO = int(os.getenv("CUMPLIMIENTO_MAX_DIAS", "62"))
+
+# El padrón de brigadas cambia poco
+CACHE_PADRON_SEG = int(os.getenv("CUMPLIMIENTO_CACHE_PADRON_SEG", "300"))
+# Días pasados casi no cambian; el día de hoy se actualiza con cada registro
+CACHE_DIA_PASADO_SEG = 3600
+CACHE_DIA_HOY_SEG = int(os.getenv("CUMPLIMIENTO_CACHE_HOY_SEG", "300"))
+
+COLUMNAS_REGISTRO = "id,fecha,brigada,zona,contrata,supervisor,completado"
+# Máximo de filas que PostgREST devuelve por defecto en una respuesta
+FILAS_POR_PAGINA = 1000
+
+SIN_SUPERVISOR = "SIN SUPERVISOR"
+
+_cache_padron = CacheTTL(ttl=CACHE_PADRON_SEG, max_items=1)
+# fecha ISO -> {(brigada, contrata): {"zona":..., "supervisor":...}}
+_cache_dias = CacheTTL(ttl=CACHE_DIA_PASADO_SEG, max_items=400)
+# (desde, hasta, version) -> resumen ya calculado
+_cache_resumen = CacheTTL(ttl=CACHE_DIA_PASADO_SEG, max_items=64)
+
+_lock = threading.Lock()
+_version = 0
+
+
+# =========================
+# PADRÓN (usuarios_brigadas)
+# =========================
+def obtener_padron(client) -> dict:
+    """
+    Brigadas activas: {(brigada, contrata): zona}. Paginado por keyset
+    sobre id: PostgREST corta cada respuesta en max-rows sin avisar.
+    """
+
+    def _consultar():
+        padron = {}
+        despues_de = None
+        while True:
+            consulta = (
+                client.table("usuarios_brigadas")
+                .select("id,brigada,zona,contrata")
+                .eq("activo", True)
+            )
+            if despues_de is not None:
+                consulta = consulta.gt("id", despues_de)
+            filas = consulta.order("id").limit(FILAS_POR_PAGINA).execute().data or []
+            for f in filas:
+                brigada = f.get("brigada")
+                if not brigada:
+                    continue
+                padron.setdefault((brigada, f.get("contrata") or ""), f.get("zona") or "")
+            if len(filas) < FILAS_POR_PAGINA:
+                return padron
+            despues_de = filas[-1]["id"]
+
+    return _cache_padron.obtener_o_calcular("padron", _consultar)
+
+
+# =========================
+# REGISTROS POR DÍA
+# =========================
+def _ttl_dia(fecha: str) -> int:
+    return CACHE_DIA_HOY_SEG if fecha >= date.today().isoformat() else CACHE_DIA_PASADO_SEG
+
+
+def consultar_registros(client, desde: str, hasta: str) -> dict:
+    """
+    Una sola consulta (paginada por keyset si supera el límite de filas)
+    con los registros completados del rango, agrupados por día.
+    """
+    por_dia = {}
+    d = date.fromisoformat(desde)
+    while d.isoformat() <= hasta:
+        por_dia[d.isoformat()] = {}
+        d += timedelta(days=1)
+
+    filtros = {"desde": desde, "hasta": hasta}
+    despues_de = None
+    while True:
+        filas = historial.consultar_pagina(
+            client, filtros, despues_de, FILAS_POR_PAGINA, columnas=COLUMNAS_REGISTRO
+        )
+        for f in filas:
+            if not f.get("completado"):
+                continue
+            dia = por_dia.setdefault(f["fecha"], {})
+            dia[(f.get("brigada"), f.get("contrata") or "")] = {
+                "zona": f.get("zona") or "",
+                "supervisor": f.get("supervisor") or SIN_SUPERVISOR,
+            }
+        if len(filas) < FILAS_POR_PAGINA:
+            break
+        despues_de = (filas[-1]["fecha"], filas[-1]["id"])
+
+    return por_dia
+
+
+def _registros_por_dia(client, desde: str, hasta: str) -> dict:
+    por_dia = {}
+    faltantes = []
+    d = date.fromisoformat(desde)
+    while d.isoformat() <= hasta:
+        fecha = d.isoformat()
+        dia = _cache_dias.get(fecha)
+        if dia is None:
+            faltantes.append(fecha)
+        else:
+            por_dia[fecha] = dia
+        d += timedelta(days=1)
+
+    if faltantes:
+        # Se piden juntos todos los días que no estaban en cache
+        consultados = consultar_registros(client, faltantes[0], faltantes[-1])
+        for fecha in faltantes:
+            dia = consultados.get(fecha, {})
+            _cache_dias.set(fecha, dia, ttl=_ttl_dia(fecha))
+            por_dia[fecha] = dia
+
+    return por_dia
+
+
+# =========================
+# ACTUALIZACIÓN INCREMENTAL
+# =========================
+def registrar(registro: dict):
+    """
+    Aplica un upsert recién hecho en ats_registros_diarios sobre el cache,
+    sin volver a consultar la base.
+    """
+    global _version
+
+    fecha = registro.get("fecha")
+    if not fecha or not registro.get("completado"):
+        return
+
+    with _lock:
+        dia = _cache_dias.get(fecha)
+        if dia is not None:
+            dia = dict(dia)
+            dia[(registro.get("brigada"), registro.get("contrata") or "")] = {
+                "zona": registro.get("zona") or "",
+                "supervisor": registro.get("supervisor") or SIN_SUPERVISOR,
+            }
+            _cache_dias.set(fecha, dia, ttl=_ttl_dia(fecha))
+        _version += 1
+
+
+# =========================
+# RESUMEN
+# =========================
+def _nuevo_grupo():
+    return {"esperados": 0, "completados": 0}
+
+
+def _cerrar_grupos(grupos: dict) -> list:
+    salida = []
+    for clave, g in sorted(grupos.items()):
+        g["clave"] = clave
+        g["porcentaje"] = round(100.0 * g["completados"] / g["esperados"], 1) if g["esperados"] else 0.0
+        salida.append(g)
+    return salida
+
+
+def _calcular(padron: dict, por_dia: dict, desde: str, hasta: str) -> dict:
+    # Último supervisor conocido de cada brigada (para asignar los pendientes)
+    supervisor_de = {}
+    for fecha in sorted(por_dia):
+        for clave, reg in por_dia[fecha].items():
+            supervisor_de[clave] = reg["supervisor"]
+
+    por_zona, por_contrata, por_supervisor = {}, {}, {}
+    pendientes = []
+    esperados = completados = 0
+
+    for fecha in sorted(por_dia):
+        dia = por_dia[fecha]
+        for clave, zona in padron.items():
+            brigada, contrata = clave
+            reg = dia.get(clave)
+            hecho = reg is not None
+            supervisor = reg["supervisor"] if hecho else supervisor_de.get(clave, SIN_SUPERVISOR)
+
+            for grupos, k in (
+                (por_zona, zona or "-"),
+                (por_contrata, contrata or "-"),
+                (por_supervisor, supervisor),
+            ):
+                g = grupos.setdefault(k, _nuevo_grupo())
+                g["esperados"] += 1
+                g["completados"] += 1 if hecho else 0
+
+            esperados += 1
+            if hecho:
+                completados += 1
+            else:
+                pendientes.append(
+                    {
+                        "fecha": fecha,
+                        "brigada": brigada,
+                        "zona": zona,
+                        "contrata": contrata,
+                        "supervisor": supervisor,
+                    }
+                )
+
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "esperados": esperados,
+        "completados": completados,
+        "porcentaje": round(100.0 * completados / esperados, 1) if esperados else 0.0,
+        "por_zona": _cerrar_grupos(por_zona),
+        "por_contrata": _cerrar_grupos(por_contrata),
+        "por_supervisor": _cerrar_grupos(por_supervisor),
+        "pendientes": pendientes,
+    }
+
+
+def normalizar_rango(desde: str = None, hasta: str = None):
+    """
+    Valida el rango; por defecto es solo el día de hoy.
+    Lanza ValueError si las fechas son inválidas o el rango es muy largo.
+    """
+    hoy = date.today()
+    try:
+        d_hasta = date.fromisoformat(hasta) if hasta else hoy
+        d_desde = date.fromisoformat(desde) if desde else d_hasta
+    except ValueError:
+        raise ValueError("Rango de fechas inválido.")
+    if d_desde > d_hasta:
+        d_desde, d_hasta = d_hasta, d_desde
+    if (d_hasta - d_desde).days + 1 > MAX_DIAS_RANGO:
+        raise ValueError(f"El rango no puede superar {MAX_DIAS_RANGO} días.")
+    return d_desde.isoformat(), d_hasta.isoformat()
+
+
+def resumen_cumplimiento(client, desde: str = None, hasta: str = None) -> dict:
+    """
+    Cumplimiento por zona, contrata y supervisor para un día o rango.
+    """
+    desde, hasta = normalizar_rango(desde, hasta)
+    clave = (desde, hasta, _version)
+
+    def _calcular_resumen():
+        padron = obtener_padron(client)
+        por_dia = _registros_por_dia(client, desde, hasta)
+        return _calcular(padron, por_dia, desde, hasta)
+
+    return _cache_resumen.obtener_o_calcular(clave, _calcular_resumen)
@@ -4,30 +4,69 @@ from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 import os
 import json
+import html
+import logging
 from datetime import datetime
 
+log = logging.getLogger(__name__)
 
-def enviar_correo(pdf_path: str, supervisor: str, subject: str) -> bool:
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+def config_smtp() -> dict:
     """
-    Envía el PDF por correo usando la config del .env.
-    Retorna:
-      - True si el correo se envió correctamente.
-      - False si hubo cualquier problema (SIN romper la app).
+    Configuración SMTP leída del .env.
     """
-
-    # === Configuración básica SMTP ===
     remitente = os.getenv("SMTP_USER")
-    password = os.getenv("SMTP_PASS")
-    smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    smtp_port = int(os.getenv("SMTP_PORT", 587))
-    from_header = os.getenv("MAIL_FROM", remitente or "")
-    timeout = int(os.getenv("SMTP_TIMEOUT", "8"))
-
-    if not remitente or not password:
-        print("⚠️ SMTP_USER / SMTP_PASS no configurado. No se envía correo.")
-        return False
+    return {
+        "remitente": remitente,
+        "password": os.getenv("SMTP_PASS"),
+        "server": os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+        "port": int(os.getenv("SMTP_PORT", 587)),
+        "from_header": os.getenv("MAIL_FROM", remitente or ""),
+        "timeout": int(os.getenv("SMTP_TIMEOUT", "8")),
+        # SMTP_STARTTLS=0 solo para servidores locales (ej. loadtest/smtp_sumidero.py)
+        "starttls": os.getenv("SMTP_STARTTLS", "1") != "0",
+    }
 
-    # === Destinatarios ===
+
+def correo_supervisor(supervisor: str):
+    """
+    Busca el correo del supervisor en SUPERVISOR_EMAILS_JSON.
+    """
+    sup_json = os.getenv("SUPERVISOR_EMAILS_JSON", "{}")
+    try:
+        mapa_supervisores = json.loads(sup_json)
+    except Exception as e:
+        log.warning("Error parseando SUPERVISOR_EMAILS_JSON: %s", e)
+        mapa_supervisores = {}
+
+    if not supervisor:
+        return None
+
+    # Normalizamos claves para evitar fallos por mayúsculas
+    sup_norm = supervisor.strip()
+    sup_norm_upper = sup_norm.upper()
+
+    # Buscar directo
+    if sup_norm in mapa_supervisores:
+        return mapa_supervisores[sup_norm]
+    if sup_norm_upper in mapa_supervisores:
+        return mapa_supervisores[sup_norm_upper]
+
+    # Intento flexible
+    for k, v in mapa_supervisores.items():
+        if k.strip().upper() == sup_norm_upper:
+            return v
+    return None
+
+
+def destinatarios_supervisor(supervisor: str):
+    """
+    Devuelve (destinatarios, cc) para un supervisor:
+    MAIL_TO_DEFAULT + correo del supervisor, y MAIL_CC.
+    """
     destinatarios = []
 
     # Destinatario por defecto
@@ -39,54 +78,149 @@ def enviar_correo(pdf_path: str, supervisor: str, subject: str) -> bool:
     cc_raw = os.getenv("MAIL_CC", "")
     cc = [c.strip() for c in cc_raw.split(",") if c.strip()] if cc_raw else []
 
-    # Correos de supervisores desde JSON
-    sup_json = os.getenv("SUPERVISOR_EMAILS_JSON", "{}")
+    correo_sup = correo_supervisor(supervisor)
+    if correo_sup:
+        destinatarios.append(correo_sup)
+    else:
+        log.info(
+            "No se encontró correo específico para el supervisor. Se usa solo MAIL_TO_DEFAULT/CC.",
+            extra={"supervisor": supervisor},
+        )
+
+    return destinatarios, cc
+
+
+def _nuevo_mensaje(config: dict, destinatarios: list, cc: list, subject: str) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg["From"] = config["from_header"] or config["remitente"]
+    msg["To"] = ", ".join(destinatarios)
+    if cc:
+        msg["Cc"] = ", ".join(cc)
+    msg["Subject"] = subject
+    return msg
+
+
+def _adjuntar_pdf(msg, pdf_path: str) -> int:
+    """
+    Adjunta el PDF al mensaje. Devuelve los bytes adjuntados (0 si falla).
+    """
     try:
-        mapa_supervisores = json.loads(sup_json)
+        with open(pdf_path, "rb") as f:
+            contenido = f.read()
     except Exception as e:
-        print(f"⚠️ Error parseando SUPERVISOR_EMAILS_JSON: {e}")
-        mapa_supervisores = {}
+        log.warning("Error leyendo el PDF para adjuntar: %s", e, extra={"pdf": pdf_path})
+        return 0
+    attach = MIMEApplication(contenido, _subtype="pdf")
+    attach.add_header(
+        "Content-Disposition",
+        "attachment",
+        filename=os.path.basename(pdf_path),
+    )
+    msg.attach(attach)
+    return len(contenido)
 
-    correo_sup = None
-    if supervisor:
-        # Normalizamos claves para evitar fallos por mayúsculas
-        sup_norm = supervisor.strip()
-        sup_norm_upper = sup_norm.upper()
-
-        # Buscar directo
-        if sup_norm in mapa_supervisores:
-            correo_sup = mapa_supervisores[sup_norm]
-        elif sup_norm_upper in mapa_supervisores:
-            correo_sup = mapa_supervisores[sup_norm_upper]
-        else:
-            # Intento flexible
-            for k, v in mapa_supervisores.items():
-                if k.strip().upper() == sup_norm_upper:
-                    correo_sup = v
-                    break
 
-    if correo_sup:
-        destinatarios.append(correo_sup)
-    else:
-        print(f"ℹ️ No se encontró correo específico para el supervisor '{supervisor}'. Se usa solo MAIL_TO_DEFAULT/CC.")
+# =========================
+# SESIÓN SMTP REUTILIZABLE
+# =========================
+class SesionSMTP:
+    """
+    Una sola conexión SMTP (connect + STARTTLS + login) para enviar
+    varios correos seguidos, en lugar de abrir una por mensaje.
+
+        with SesionSMTP() as sesion:
+            sesion.enviar(msg1)
+            sesion.enviar(msg2)
+    """
+
+    def __init__(self, config: dict = None):
+        self.config = config or config_smtp()
+        self._server = None
+
+    def __enter__(self):
+        self.abrir()
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+        return False
+
+    def abrir(self):
+        if self._server is not None:
+            return
+        c = self.config
+        server = smtplib.SMTP(c["server"], c["port"], timeout=c["timeout"])
+        try:
+            if c.get("starttls", True):
+                server.starttls()
+            server.login(c["remitente"], c["password"])
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+
+    def cerrar(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            self._server.close()
+        self._server = None
+
+    def enviar(self, msg) -> bool:
+        """
+        Envía un mensaje. Si la conexión se cayó, reintenta una vez reconectando.
+        """
+        for intento in (1, 2):
+            try:
+                self.abrir()
+                self._server.send_message(msg)
+                return True
+            except smtplib.SMTPServerDisconnected as e:
+                self._server = None
+                if intento == 2:
+                    log.warning("Conexión SMTP perdida enviando correo: %s", e)
+            except Exception as e:
+                log.warning("Error enviando correo (manejado, no se cae la app): %s", e)
+                return False
+        return False
+
+
+# =========================
+# REPORTE ATS INDIVIDUAL
+# =========================
+def enviar_correo(pdf_path: str, supervisor: str, subject: str, sesion: SesionSMTP = None) -> bool:
+    """
+    Envía el PDF por correo usando la config del .env.
+    Si se pasa `sesion`, reutiliza esa conexión SMTP.
+    Retorna:
+      - True si el correo se envió correctamente.
+      - False si hubo cualquier problema (SIN romper la app).
+    """
+
+    # === Configuración básica SMTP ===
+    config = sesion.config if sesion else config_smtp()
+
+    if not config["remitente"] or not config["password"]:
+        log.warning("SMTP_USER / SMTP_PASS no configurado. No se envía correo.")
+        return False
+
+    # === Destinatarios ===
+    destinatarios, cc = destinatarios_supervisor(supervisor)
 
     # Validar que haya al menos un destinatario
     if not destinatarios and not cc:
-        print("⚠️ No hay destinatarios configurados. No se envía correo.")
+        log.warning("No hay destinatarios configurados. No se envía correo.")
         return False
 
     # Validar PDF
     if not pdf_path or not os.path.isfile(pdf_path):
-        print(f"⚠️ No se encontró el archivo PDF para adjuntar: {pdf_path}")
+        log.warning("No se encontró el archivo PDF para adjuntar", extra={"pdf": pdf_path})
         return False
 
     # === Construcción del mensaje ===
-    msg = MIMEMultipart()
-    msg["From"] = from_header or remitente
-    msg["To"] = ", ".join(destinatarios)
-    if cc:
-        msg["Cc"] = ", ".join(cc)
-    msg["Subject"] = subject
+    msg = _nuevo_mensaje(config, destinatarios, cc, subject)
 
     fecha_actual = datetime.now().strftime("%Y-%m-%d")
 
@@ -101,30 +235,147 @@ def enviar_correo(pdf_path: str, supervisor: str, subject: str) -> bool:
     msg.attach(MIMEText(body, "html"))
 
     # Adjuntar PDF
-    try:
-        with open(pdf_path, "rb") as f:
-            attach = MIMEApplication(f.read(), _subtype="pdf")
-        attach.add_header(
-            "Content-Disposition",
-            "attachment",
-            filename=os.path.basename(pdf_path),
-        )
-        msg.attach(attach)
-    except Exception as e:
-        print(f"⚠️ Error leyendo el PDF para adjuntar: {e}")
+    bytes_adjunto = _adjuntar_pdf(msg, pdf_path)
+    if not bytes_adjunto:
         return False
 
     # === Envío (con timeout y manejo de errores) ===
-    try:
-        with smtplib.SMTP(smtp_server, smtp_port, timeout=timeout) as server:
-            server.starttls()
-            server.login(remitente, password)
-            server.send_message(msg)
+    if sesion is not None:
+        ok = sesion.enviar(msg)
+    else:
+        try:
+            with SesionSMTP(config) as nueva:
+                ok = nueva.enviar(msg)
+        except Exception as e:
+            # Importante: NO reventar la app, solo loguear
+            log.warning("Error enviando correo (manejado, no se cae la app): %s", e)
+            return False
 
-        print(f"✅ Correo enviado a: {destinatarios}  CC: {cc}")
-        return True
+    if ok:
+        log.info("Correo enviado", extra={"destinatarios": destinatarios, "cc": cc, "bytes_adjuntos": bytes_adjunto})
+    return ok
 
-    except Exception as e:
-        # Importante: NO reventar la app, solo loguear
-        print(f"⚠️ Error enviando correo (manejado, no se cae la app): {e}")
+
+# =========================
+# RECORDATORIO DE ATS FALTANTES
+# =========================
+def enviar_recordatorio_faltantes(supervisor: str, fecha: str, brigadas: list,
+                                  sesion: SesionSMTP) -> bool:
+    """
+    Un solo correo por supervisor con todas sus brigadas sin ATS del día.
+    `brigadas`: lista de dicts con brigada / zona / contrata.
+    """
+    config = sesion.config
+    destinatarios, cc = destinatarios_supervisor(supervisor)
+    if not destinatarios and not cc:
+        log.warning("No hay destinatarios configurados. No se envía recordatorio.")
         return False
+
+    subject = f"Recordatorio ATS pendientes – {supervisor} – {fecha} ({len(brigadas)})"
+    msg = _nuevo_mensaje(config, destinatarios, cc, subject)
+
+    filas = "".join(
+        f"<tr><td>{html.escape(str(b.get('brigada') or '-'))}</td>"
+        f"<td>{html.escape(str(b.get('zona') or '-'))}</td>"
+        f"<td>{html.escape(str(b.get('contrata') or '-'))}</td></tr>"
+        for b in brigadas
+    )
+    body = f"""
+    Estimado(a),<br><br>
+    Las siguientes brigadas aún no registran su ATS del día <b>{fecha}</b>:<br><br>
+    <table border="1" cellpadding="4" cellspacing="0" style="border-collapse:collapse;font-size:12px">
+      <tr><th>Brigada</th><th>Zona</th><th>Contrata</th></tr>
+      {filas}
+    </table><br>
+    <b>Supervisor:</b> {html.escape(supervisor or '-')}<br><br>
+    Saludos cordiales,<br>
+    <b>CICSA – Sistema de Reportes ATS</b>
+    """
+    msg.attach(MIMEText(body, "html"))
+
+    ok = sesion.enviar(msg)
+    if ok:
+        log.info("Recordatorio enviado", extra={"destinatarios": destinatarios, "cc": cc, "brigadas": len(brigadas)})
+    return ok
+
+
+# =========================
+# RESUMEN DE REPORTES ATS
+# =========================
+def enviar_resumen_ats(supervisor: str, reportes: list, sesion: SesionSMTP,
+                       adjunto_max_bytes: int = 0, adjuntos_total_bytes: int = 0) -> bool:
+    """
+    Un solo correo por supervisor con la tabla de sus reportes ATS y el
+    enlace a cada PDF. Solo se adjuntan los PDFs de hasta `adjunto_max_bytes`
+    mientras el total no pase de `adjuntos_total_bytes`.
+    `reportes`: dicts con fecha / brigada / zona / contrata /
+    usuario_registro / tecnicos_count / enlace / pdf_path (local).
+    """
+    config = sesion.config
+    destinatarios, cc = destinatarios_supervisor(supervisor)
+    if not destinatarios and not cc:
+        log.warning("No hay destinatarios configurados. No se envía resumen.")
+        return False
+
+    fechas = sorted({str(r.get("fecha") or "") for r in reportes} - {""})
+    rango = " a ".join([fechas[0], fechas[-1]] if len(fechas) > 1 else fechas) or "-"
+    subject = f"Resumen ATS – {supervisor} – {rango} ({len(reportes)})"
+    msg = _nuevo_mensaje(config, destinatarios, cc, subject)
+
+    adjuntados = 0
+    filas = []
+    pendientes_adjuntar = []
+    for r in reportes:
+        pdf_path = r.get("pdf_path")
+        tamano = os.path.getsize(pdf_path) if pdf_path and os.path.isfile(pdf_path) else None
+        adjunto = (
+            tamano is not None
+            and tamano <= adjunto_max_bytes
+            and adjuntados + tamano <= adjuntos_total_bytes
+        )
+        if adjunto:
+            adjuntados += tamano
+            pendientes_adjuntar.append(pdf_path)
+
+        enlace = r.get("enlace")
+        if enlace:
+            celda_pdf = f'<a href="{html.escape(enlace, quote=True)}">Ver PDF</a>'
+        else:
+            celda_pdf = "-"
+        if adjunto:
+            celda_pdf += " (adjunto)"
+
+        filas.append(
+            f"<tr><td>{html.escape(str(r.get('fecha') or '-'))}</td>"
+            f"<td>{html.escape(str(r.get('brigada') or '-'))}</td>"
+            f"<td>{html.escape(str(r.get('zona') or '-'))}</td>"
+            f"<td>{html.escape(str(r.get('contrata') or '-'))}</td>"
+            f"<td>{html.escape(str(r.get('usuario_registro') or '-'))}</td>"
+            f"<td style=\"text-align:center\">{html.escape(str(r.get('tecnicos_count') or '-'))}</td>"
+            f"<td>{celda_pdf}</td></tr>"
+        )
+
+    body = f"""
+    Estimado(a),<br><br>
+    Se registraron los siguientes reportes ATS en la plataforma:<br><br>
+    <table border="1" cellpadding="4" cellspacing="0" style="border-collapse:collapse;font-size:12px">
+      <tr><th>Fecha</th><th>Brigada</th><th>Zona</th><th>Contrata</th><th>Registrado por</th><th>Técnicos</th><th>PDF</th></tr>
+      {"".join(filas)}
+    </table><br>
+    <b>Supervisor:</b> {html.escape(supervisor or '-')}<br>
+    <b>Total de reportes:</b> {len(reportes)}<br><br>
+    Saludos cordiales,<br>
+    <b>CICSA – Sistema de Reportes ATS</b>
+    """
+    msg.attach(MIMEText(body, "html"))
+
+    for pdf_path in pendientes_adjuntar:
+        _adjuntar_pdf(msg, pdf_path)
+
+    ok = sesion.enviar(msg)
+    if ok:
+        log.info(
+            "Resumen ATS enviado",
+            extra={"destinatarios": destinatarios, "cc": cc, "reportes": len(reportes), "bytes_adjuntos": adjuntados},
+        )
+    return ok
@@ -0,0 +1,502 @@
+"""
+Estado compartido entre instancias de la app (varios dynos o workers detrás
+de un balanceador).
+
+- ESTADO_BACKEND=memoria (por defecto): todo vive en la memoria del
+  proceso, como antes. Alcanza para una sola instancia.
+- ESTADO_BACKEND=redis y ESTADO_REDIS_URL=redis://[:clave@]host:6379/0:
+  lo comparten todas las instancias. El cliente habla el protocolo de
+  Redis (RESP) directamente, sin dependencias extra; para probar sin un
+  Redis real está loadtest/redis_falso.py.
+
+Pasan por aquí: las caches de datos de referencia y de consultas
+(CacheCompartida), las claves de idempotencia del formulario y de las
+tareas programadas (reclamar), los contadores del límite de intentos de
+login (actualizar) y la cola del resumen de correos (listas).
+
+Quedan en cada instancia, a propósito: la cache de PDFs renderizados
+(blobs grandes que solo ahorran CPU), la de URLs firmadas (una lectura por
+fila del historial; solo ahorra llamadas) y los agregados de cumplimiento
+(el día de hoy vence a los CUMPLIMIENTO_CACHE_HOY_SEG).
+
+Los valores se guardan como JSON con los dos backends, así lo que funciona
+en memoria funciona igual con Redis. Si Redis no responde, las caches se
+comportan como vacías y el resto de las operaciones lanza ErrorEstado.
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import unquote, urlparse
+
+log = logging.getLogger(__name__)
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+# Se leen al crear el backend (primer uso), después del load_dotenv() de la app
+def _config() -> dict:
+    return {
+        "backend": os.getenv("ESTADO_BACKEND", "memoria").lower(),
+        "url": os.getenv("ESTADO_REDIS_URL", "redis://127.0.0.1:6379/0"),
+        "prefijo": os.getenv("ESTADO_PREFIJO", "ats:"),
+        "pool": int(os.getenv("ESTADO_REDIS_POOL", "10")),
+        "timeout": float(os.getenv("ESTADO_REDIS_TIMEOUT_SEG", "2")),
+    }
+
+
+# Reintentos de actualizar() cuando otra instancia modificó la clave a la vez
+MAX_CONFLICTOS = 50
+
+
+class ErrorEstado(RuntimeError):
+    """
+    El backend de estado compartido no respondió o devolvió un error.
+    """
+
+
+# =========================
+# BACKEND EN MEMORIA
+# =========================
+class EstadoMemoria:
+    """
+    Claves con expiración opcional, listas y conjuntos en un dict del
+    proceso. Las claves vencidas se borran al leerlas y en barridos
+    periódicos.
+    """
+
+    BARRIDO_CADA = 1000  # escrituras
+
+    def __init__(self):
+        self._datos = {}  # clave -> (expira_en | None, valor)
+        self._lock = threading.RLock()
+        self._escrituras = 0
+
+    def _leer(self, clave):
+        item = self._datos.get(clave)
+        if item is None:
+            return None
+        expira_en, valor = item
+        if expira_en is not None and expira_en <= time.monotonic():
+            del self._datos[clave]
+            return None
+        return valor
+
+    def _escribir(self, clave, valor, ttl=None):
+        expira_en = time.monotonic() + ttl if ttl is not None else None
+        self._datos[clave] = (expira_en, valor)
+        self._escrituras += 1
+        if self._escrituras % self.BARRIDO_CADA == 0:
+            ahora = time.monotonic()
+            for k in [k for k, (e, _) in self._datos.items() if e is not None and e <= ahora]:
+                del self._datos[k]
+
+    def get(self, clave: str):
+        with self._lock:
+            return self._leer(clave)
+
+    def set(self, clave: str, valor: bytes, ttl: float = None):
+        with self._lock:
+            self._escribir(clave, valor, ttl)
+
+    def reclamar(self, clave: str, valor: bytes, ttl: float) -> bool:
+        with self._lock:
+            if self._leer(clave) is not None:
+                return False
+            self._escribir(clave, valor, ttl)
+            return True
+
+    def borrar(self, clave: str):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def incrementar(self, clave: str) -> int:
+        with self._lock:
+            valor = int(self._leer(clave) or 0) + 1
+            self._escribir(clave, str(valor).encode())
+            return valor
+
+    def actualizar(self, clave: str, funcion, ttl: float = None) -> bytes:
+        with self._lock:
+            nuevo = funcion(self._leer(clave))
+            self._escribir(clave, nuevo, ttl)
+            return nuevo
+
+    def empujar(self, clave: str, valores: list, al_inicio: bool = False) -> int:
+        with self._lock:
+            lista = self._leer(clave) or []
+            lista = list(valores) + lista if al_inicio else lista + list(valores)
+            self._escribir(clave, lista)
+            return len(lista)
+
+    def tomar_lista(self, clave: str) -> list:
+        with self._lock:
+            lista = self._leer(clave) or []
+            self._datos.pop(clave, None)
+            return lista
+
+    def largo(self, clave: str) -> int:
+        with self._lock:
+            return len(self._leer(clave) or [])
+
+    def agregar_miembro(self, clave: str, miembro: bytes):
+        with self._lock:
+            conjunto = self._leer(clave) or set()
+            conjunto.add(miembro)
+            self._escribir(clave, conjunto)
+
+    def miembros(self, clave: str) -> set:
+        with self._lock:
+            return set(self._leer(clave) or ())
+
+
+# =========================
+# BACKEND REDIS (RESP)
+# =========================
+class _ErrorRespuesta(Exception):
+    pass
+
+
+class _ConexionRedis:
+    def __init__(self, host: str, puerto: int, db: int, clave: str, timeout: float):
+        self._sock = socket.create_connection((host, puerto), timeout)
+        self._lector = self._sock.makefile("rb")
+        if clave:
+            self.comando("AUTH", clave)
+        if db:
+            self.comando("SELECT", db)
+
+    def enviar(self, *args):
+        partes = [b"*%d\r\n" % len(args)]
+        for a in args:
+            if not isinstance(a, bytes):
+                a = str(a).encode()
+            partes.append(b"$%d\r\n%s\r\n" % (len(a), a))
+        self._sock.sendall(b"".join(partes))
+
+    def leer(self):
+        linea = self._lector.readline()
+        if not linea.endswith(b"\r\n"):
+            raise ConnectionError("Redis cerró la conexión")
+        tipo, resto = linea[:1], linea[1:-2]
+        if tipo == b"+":
+            return resto.decode()
+        if tipo == b"-":
+            return _ErrorRespuesta(resto.decode())
+        if tipo == b":":
+            return int(resto)
+        if tipo == b"$":
+            n = int(resto)
+            return None if n < 0 else self._lector.read(n + 2)[:-2]
+        if tipo == b"*":
+            n = int(resto)
+            return None if n < 0 else [self.leer() for _ in range(n)]
+        raise ConnectionError(f"Respuesta RESP inválida: {linea[:40]!r}")
+
+    def comando(self, *args):
+        self.enviar(*args)
+        respuesta = self.leer()
+        if isinstance(respuesta, _ErrorRespuesta):
+            raise ErrorEstado(f"Redis {args[0]}: {respuesta}")
+        return respuesta
+
+    def cerrar(self):
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+
+
+class EstadoRedis:
+    """
+    Mismas operaciones que EstadoMemoria sobre un servidor Redis, con un
+    pool de conexiones. Las operaciones compuestas usan MULTI/EXEC y
+    actualizar() usa WATCH (bloqueo optimista).
+    """
+
+    def __init__(self, url: str, pool: int = 10, timeout: float = 2):
+        partes = urlparse(url)
+        if partes.scheme != "redis":
+            raise ValueError(f"ESTADO_REDIS_URL debe empezar con redis://: {url}")
+        self._destino = (
+            partes.hostname or "127.0.0.1",
+            partes.port or 6379,
+            int((partes.path or "/0").lstrip("/") or 0),
+            unquote(partes.password) if partes.password else None,
+            timeout,
+        )
+        self._libres = queue.LifoQueue(maxsize=pool)
+
+    @contextmanager
+    def _conexion(self):
+        try:
+            con = self._libres.get_nowait()
+        except queue.Empty:
+            try:
+                con = _ConexionRedis(*self._destino)
+            except OSError as e:
+                raise ErrorEstado(f"No se pudo conectar a Redis: {e}") from e
+        try:
+            yield con
+        except BaseException as e:
+            # Una conexión a mitad de un comando o de un WATCH no se reutiliza
+            con.cerrar()
+            if isinstance(e, (OSError, ConnectionError)):
+                raise ErrorEstado(f"Error de conexión con Redis: {e}") from e
+            raise
+        try:
+            self._libres.put_nowait(con)
+        except queue.Full:
+            con.cerrar()
+
+    def _comando(self, *args):
+        with self._conexion() as con:
+            return con.comando(*args)
+
+    def _transaccion(self, *comandos) -> list:
+        with self._conexion() as con:
+            for c in (("MULTI",),) + comandos + (("EXEC",),):
+                con.enviar(*c)
+            respuestas = [con.leer() for _ in range(len(comandos) + 2)]
+        resultado = respuestas[-1]
+        if not isinstance(resultado, list):
+            raise ErrorEstado(f"Redis rechazó la transacción: {resultado}")
+        return resultado
+
+    @staticmethod
+    def _ms(ttl: float) -> int:
+        return max(int(ttl * 1000), 1)
+
+    def get(self, clave: str):
+        return self._comando("GET", clave)
+
+    def set(self, clave: str, valor: bytes, ttl: float = None):
+        if ttl is None:
+            self._comando("SET", clave, valor)
+        else:
+            self._comando("SET", clave, valor, "PX", self._ms(ttl))
+
+    def reclamar(self, clave: str, valor: bytes, ttl: float) -> bool:
+        return self._comando("SET", clave, valor, "PX", self._ms(ttl), "NX") is not None
+
+    def borrar(self, clave: str):
+        self._comando("DEL", clave)
+
+    def incrementar(self, clave: str) -> int:
+        return self._comando("INCR", clave)
+
+    def actualizar(self, clave: str, funcion, ttl: float = None) -> bytes:
+        for _ in range(MAX_CONFLICTOS):
+            with self._conexion() as con:
+                con.comando("WATCH", clave)
+                nuevo = funcion(con.comando("GET", clave))
+                escritura = ("SET", clave, nuevo) if ttl is None else ("SET", clave, nuevo, "PX", self._ms(ttl))
+                for c in (("MULTI",), escritura, ("EXEC",)):
+                    con.enviar(*c)
+                resultado = [con.leer() for _ in range(3)][-1]
+            if isinstance(resultado, _ErrorRespuesta):
+                raise ErrorEstado(f"Redis rechazó la transacción: {resultado}")
+            if resultado is not None:
+                return nuevo
+        raise ErrorEstado(f"Demasiados conflictos actualizando {clave}")
+
+    def empujar(self, clave: str, valores: list, al_inicio: bool = False) -> int:
+        if not valores:
+            return self.largo(clave)
+        if al_inicio:
+            return self._comando("LPUSH", clave, *reversed(valores))
+        return self._comando("RPUSH", clave, *valores)
+
+    def tomar_lista(self, clave: str) -> list:
+        return self._transaccion(("LRANGE", clave, 0, -1), ("DEL", clave))[0]
+
+    def largo(self, clave: str) -> int:
+        return self._comando("LLEN", clave)
+
+    def agregar_miembro(self, clave: str, miembro: bytes):
+        self._comando("SADD", clave, miembro)
+
+    def miembros(self, clave: str) -> set:
+        return set(self._comando("SMEMBERS", clave))
+
+
+# =========================
+# BACKEND VIGENTE
+# =========================
+_backend = None
+_prefijo = ""
+_lock = threading.Lock()
+
+
+def backend():
+    global _backend, _prefijo
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                config = _config()
+                _prefijo = config["prefijo"]
+                if config["backend"] == "redis":
+                    _backend = EstadoRedis(config["url"], config["pool"], config["timeout"])
+                    log.info("Estado compartido en Redis", extra={"destino": urlparse(config["url"]).hostname})
+                elif config["backend"] == "memoria":
+                    _backend = EstadoMemoria()
+                else:
+                    raise RuntimeError(f"ESTADO_BACKEND desconocido: {config['backend']} (memoria | redis)")
+    return _backend
+
+
+def es_local() -> bool:
+    """
+    True si el estado vive solo en este proceso (backend en memoria).
+    """
+    return isinstance(backend(), EstadoMemoria)
+
+
+def _clave(clave) -> str:
+    if not isinstance(clave, str):
+        clave = json.dumps(clave, ensure_ascii=False, separators=(",", ":"), default=str)
+    return _prefijo + clave
+
+
+def _codificar(valor) -> bytes:
+    return json.dumps(valor, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _decodificar(datos):
+    return None if datos is None else json.loads(datos)
+
+
+# =========================
+# OPERACIONES
+# =========================
+def obtener(clave, default=None):
+    valor = _decodificar(backend().get(_clave(clave)))
+    return default if valor is None else valor
+
+
+def guardar(clave, valor, ttl: float = None):
+    backend().set(_clave(clave), _codificar(valor), ttl)
+
+
+def borrar(clave):
+    backend().borrar(_clave(clave))
+
+
+def reclamar(clave, ttl: float, valor=True) -> bool:
+    """
+    Guarda `valor` solo si la clave no existe. True si esta llamada la
+    reclamó (idempotencia: la primera instancia en reclamar hace el trabajo).
+    """
+    return backend().reclamar(_clave(clave), _codificar(valor), ttl)
+
+
+def actualizar(clave, funcion, ttl: float = None):
+    """
+    Lee, aplica `funcion(valor | None) -> nuevo` y guarda, sin que otra
+    instancia escriba en el medio. Devuelve el valor nuevo.
+    """
+    nuevo = backend().actualizar(
+        _clave(clave), lambda datos: _codificar(funcion(_decodificar(datos))), ttl
+    )
+    return _decodificar(nuevo)
+
+
+def empujar(clave, valores: list, al_inicio: bool = False) -> int:
+    return backend().empujar(_clave(clave), [_codificar(v) for v in valores], al_inicio)
+
+
+def tomar_lista(clave) -> list:
+    """
+    Saca y devuelve todos los elementos de la lista (operación atómica).
+    """
+    return [_decodificar(v) for v in backend().tomar_lista(_clave(clave))]
+
+
+def largo(clave) -> int:
+    return backend().largo(_clave(clave))
+
+
+def agregar_miembro(clave, miembro: str):
+    backend().agregar_miembro(_clave(clave), miembro.encode("utf-8"))
+
+
+def miembros(clave) -> set:
+    return {m.decode("utf-8") for m in backend().miembros(_clave(clave))}
+
+
+def estado() -> dict:
+    """
+    Backend en uso y si responde, para /salud.
+    """
+    resultado = {"backend": "memoria" if es_local() else "redis", "ok": True}
+    try:
+        backend().get(_clave("salud"))
+    except ErrorEstado as e:
+        resultado.update(ok=False, error=str(e))
+    return resultado
+
+
+# =========================
+# CACHE
+# =========================
+class CacheCompartida:
+    """
+    Misma interfaz que cache_local.CacheTTL sobre el estado compartido.
+    Las claves pueden ser tuplas (se pasan a JSON) y los valores deben
+    poder guardarse como JSON. Un error del backend cuenta como "no está".
+
+    limpiar() cambia la generación del espacio (una clave más por lectura),
+    por eso solo está disponible con limpiable=True.
+    """
+
+    def __init__(self, espacio: str, ttl: float = None, limpiable: bool = False):
+        self.espacio = espacio
+        self.ttl = ttl
+        self.limpiable = limpiable
+
+    def _clave(self, clave) -> str:
+        if not isinstance(clave, str):
+            clave = json.dumps(clave, ensure_ascii=False, separators=(",", ":"), default=str)
+        if self.limpiable:
+            generacion = obtener(f"{self.espacio}:generacion", 0)
+            return f"{self.espacio}:{generacion}:{clave}"
+        return f"{self.espacio}:{clave}"
+
+    def get(self, clave, default=None):
+        try:
+            return obtener(self._clave(clave), default)
+        except ErrorEstado as e:
+            log.warning("Estado compartido no disponible (cache %s): %s", self.espacio, e)
+            return default
+
+    def set(self, clave, valor, ttl: float = None):
+        try:
+            guardar(self._clave(clave), valor, self.ttl if ttl is None else ttl)
+        except ErrorEstado as e:
+            log.warning("Estado compartido no disponible (cache %s): %s", self.espacio, e)
+
+    def obtener_o_calcular(self, clave, calcular, ttl: float = None):
+        valor = self.get(clave)
+        if valor is None:
+            valor = calcular()
+            self.set(clave, valor, ttl)
+        return valor
+
+    def borrar(self, clave):
+        try:
+            borrar(self._clave(clave))
+        except ErrorEstado as e:
+            log.warning("Estado compartido no disponible (cache %s): %s", self.espacio, e)
+
+    def limpiar(self):
+        if not self.limpiable:
+            raise RuntimeError(f"La cache {self.espacio} no se creó con limpiable=True")
+        try:
+            backend().incrementar(_clave(f"{self.espacio}:generacion"))
+        except ErrorEstado as e:
+            log.warning("Estado compartido no disponible (cache %s): %s", self.espacio, e)
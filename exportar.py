@@ -0,0 +1,243 @@
+"""
+Exportación de ats_registros_diarios a CSV o Parquet, por streaming.
+Las filas se leen en lotes con paginación keyset y se escriben a medida
+que llegan: nunca se tiene el resultado completo en memoria.
+Si la lectura falla a mitad de camino el error se registra y se propaga:
+la descarga queda cortada (sin el fin del cuerpo chunked) en vez de
+entregar un archivo truncado como si estuviera completo.
+
+Uso por consola:
+    python exportar.py --desde 2025-01-01 --hasta 2025-12-31 -o ats_2025.csv
+    python exportar.py --desde 2025-11-01 --zona NORTE --formato parquet -o nov.parquet
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+from datetime import date
+
+import bitacora
+import cliente_supabase
+import historial
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet es opcional
+    pa = None
+    pq = None
+
+log = logging.getLogger(__name__)
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+TAMANO_LOTE = int(os.getenv("EXPORT_TAMANO_LOTE", "1000"))
+
+CAMPOS = [
+    "id",
+    "fecha",
+    "brigada",
+    "zona",
+    "contrata",
+    "usuario_registro",
+    "supervisor",
+    "tecnicos_count",
+    "completado",
+    "pdf_path",
+]
+
+FORMATOS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def formato_disponible(formato: str) -> bool:
+    if formato == "parquet":
+        return pq is not None
+    return formato in FORMATOS
+
+
+# =========================
+# LECTURA POR LOTES
+# =========================
+def iterar_lotes(client, filtros: dict, tamano_lote: int = TAMANO_LOTE):
+    """
+    Genera listas de filas (fecha DESC, id DESC) hasta agotar el rango.
+    """
+    despues_de = None
+    while True:
+        filas = historial.consultar_pagina(
+            client, filtros, despues_de, tamano_lote, columnas=",".join(CAMPOS)
+        )
+        if not filas:
+            return
+        yield filas
+        if len(filas) < tamano_lote:
+            return
+        despues_de = (filas[-1]["fecha"], filas[-1]["id"])
+
+
+# =========================
+# CSV
+# =========================
+def generar_csv(lotes):
+    """
+    Genera el CSV en trozos (un trozo por lote).
+    Incluye BOM para que Excel lea bien tildes y ñ.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CAMPOS, extrasaction="ignore")
+    buffer.write("\ufeff")
+    writer.writeheader()
+
+    for filas in lotes:
+        writer.writerows(filas)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    resto = buffer.getvalue()
+    if resto:
+        yield resto.encode("utf-8")
+
+
+# =========================
+# PARQUET
+# =========================
+class _SalidaIncremental(io.RawIOBase):
+    """
+    Archivo de solo escritura que acumula bytes hasta que se retiran con
+    `retirar()`; así cada row group se entrega apenas se escribe.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._partes = []
+        self._posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        datos = bytes(b)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def retirar(self) -> bytes:
+        datos = b"".join(self._partes)
+        self._partes = []
+        return datos
+
+
+def _esquema_parquet():
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("fecha", pa.date32()),
+            ("brigada", pa.string()),
+            ("zona", pa.string()),
+            ("contrata", pa.string()),
+            ("usuario_registro", pa.string()),
+            ("supervisor", pa.string()),
+            ("tecnicos_count", pa.int32()),
+            ("completado", pa.bool_()),
+            ("pdf_path", pa.string()),
+        ]
+    )
+
+
+def generar_parquet(lotes):
+    """
+    Genera el archivo Parquet en trozos: un row group por lote.
+    """
+    if pq is None:
+        raise RuntimeError("pyarrow no está instalado: no se puede exportar a Parquet.")
+
+    esquema = _esquema_parquet()
+    salida = _SalidaIncremental()
+    writer = pq.ParquetWriter(salida, esquema, compression="snappy")
+    try:
+        for filas in lotes:
+            columnas = {c: [f.get(c) for f in filas] for c in CAMPOS}
+            columnas["fecha"] = [date.fromisoformat(v[:10]) if v else None for v in columnas["fecha"]]
+            writer.write_table(pa.Table.from_pydict(columnas, schema=esquema))
+            trozo = salida.retirar()
+            if trozo:
+                yield trozo
+    finally:
+        writer.close()
+    yield salida.retirar()
+
+
+def _con_registro_de_errores(trozos, filtros: dict, formato: str):
+    enviados = 0
+    try:
+        for trozo in trozos:
+            yield trozo
+            enviados += len(trozo)
+    except Exception:
+        log.exception("Exportación interrumpida: el archivo quedó incompleto",
+                      extra=dict(filtros, formato=formato, bytes=enviados))
+        raise
+
+
+def generar_exportacion(client, filtros: dict, formato: str = "csv"):
+    lotes = iterar_lotes(client, filtros)
+    if formato == "parquet":
+        trozos = generar_parquet(lotes)
+    else:
+        trozos = generar_csv(lotes)
+    return _con_registro_de_errores(trozos, filtros, formato)
+
+
+def nombre_archivo(filtros: dict, formato: str) -> str:
+    desde = filtros.get("desde") or "inicio"
+    hasta = filtros.get("hasta") or "hoy"
+    return f"ats_registros_{desde}_{hasta}.{FORMATOS[formato][1]}"
+
+
+# =========================
+# CLI
+# =========================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exportar registros ATS a CSV / Parquet")
+    parser.add_argument("--desde", help="Fecha inicial (YYYY-MM-DD)")
+    parser.add_argument("--hasta", help="Fecha final (YYYY-MM-DD)")
+    for campo in historial.FILTROS_EXACTOS:
+        parser.add_argument(f"--{campo}")
+    parser.add_argument("--formato", choices=sorted(FORMATOS), default="csv")
+    parser.add_argument("-o", "--salida", help="Archivo de salida (por defecto se genera el nombre)")
+    args = parser.parse_args(argv)
+
+    bitacora.configurar_logging()
+    if not formato_disponible(args.formato):
+        parser.error("Para exportar a Parquet instale pyarrow.")
+
+    filtros = historial.leer_filtros(vars(args))
+    salida = args.salida or nombre_archivo(filtros, args.formato)
+
+    client = cliente_supabase.cliente_desde_env()
+    total = 0
+    try:
+        with open(salida, "wb") as f:
+            for trozo in generar_exportacion(client, filtros, args.formato):
+                f.write(trozo)
+                total += len(trozo)
+    except Exception:
+        # No dejar un archivo a medias que parezca completo
+        os.remove(salida)
+        raise
+
+    print(f"✅ Exportación lista: {salida} ({total} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
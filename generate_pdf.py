@@ -8,17 +8,60 @@ from reportlab.platypus import (
     Paragraph,
     Spacer,
     Image,
+    Flowable,
 )
 from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas as rl_canvas
+from reportlab import rl_config
+from PIL import Image as ImagenPIL
 from datetime import datetime
+import logging
 import os
+import io
 import html
+import uuid
+from functools import lru_cache
+
+import catalogo as catalogo_ats
+
+log = logging.getLogger(__name__)
+
+# Streams binarios: sin ASCII85 las fotos pesan ~25% menos y no pasan por el
+# codificador en Python puro (sin rl_accel es lo más lento de armar el PDF)
+rl_config.useA85 = 0
+
+# Niveles para ajustar el PDF a un tamaño máximo: (lado mayor en px, calidad JPEG).
+# El nivel 0 deja las fotos como llegaron. En el PDF se ven de ~4.5 cm,
+# así que incluso 800 px sigue nítido al imprimir.
+NIVELES_FOTO = [
+    (None, None),
+    (1600, 85),
+    (1200, 75),
+    (1000, 65),
+    (800, 55),
+    (600, 45),
+    (400, 35),
+]
+
+# Tamaño máximo del PDF. El adjunto viaja en base64 (+33%): 7 MB entran en
+# pasarelas que rechazan correos de más de 10 MB. 0 = sin límite.
+PDF_MAX_BYTES = int(float(os.getenv("PDF_MAX_MB", "7")) * 1024 * 1024)
+
+# Fotos de campo por fila en la grilla de imágenes (27.7 cm / 5 = 5.54 cm c/u)
+FOTOS_POR_FILA = 5
+
+# Versión del diseño del PDF: subirla con cada cambio de maquetación.
+# Entra en el ETag de los PDFs regenerados desde payload (ver ats_payload.py).
+VERSION_DISENO = 1
 
 
 # ========= Helpers =========
 
-def P(text, bold=False, size=7, align="CENTER", color=colors.black, nowrap=False):
-    style = ParagraphStyle(
+@lru_cache(maxsize=128)
+def _estilo(bold, size, align, color, nowrap):
+    # Con cuadrillas grandes hay miles de celdas: un estilo por combinación
+    return ParagraphStyle(
         name="p",
         fontName="Helvetica-Bold" if bold else "Helvetica",
         fontSize=size,
@@ -28,11 +71,48 @@ def P(text, bold=False, size=7, align="CENTER", color=colors.black, nowrap=False
         wordWrap=None if nowrap else "LTR",
         splitLongWords=False,
     )
+
+
+def P(text, bold=False, size=7, align="CENTER", color=colors.black, nowrap=False):
+    style = _estilo(bold, size, align, color, nowrap)
     return Paragraph(html.escape(str(text if text is not None else "")), style)
 
 
+def hay_imagen(img) -> bool:
+    """
+    True si `img` es una ruta existente o una imagen en memoria (bytes / archivo).
+    """
+    if not img:
+        return False
+    if isinstance(img, (bytes, bytearray)) or hasattr(img, "read"):
+        return True
+    return os.path.exists(img)
+
+
+class _LectorEnMemoria(ImageReader):
+    """
+    Imagen en memoria (bytes o archivo). Los JPEG se incrustan tal cual,
+    pero ImageReader los decodificaría completos (y retendría el RGB hasta
+    terminar el PDF) solo para calcular el nombre con el que reportlab
+    reutiliza las imágenes repetidas: aquí el nombre sale de los bytes.
+    """
+
+    def getRGBData(self):
+        if self.jpeg_fh() is None:
+            return super().getRGBData()
+        self._dataA = None
+        return self.fp.getvalue()
+
+
 def IMG(path, w, h):
-    return Image(path, width=w, height=h) if path and os.path.exists(path) else ""
+    if not hay_imagen(path):
+        return ""
+    if isinstance(path, (bytes, bytearray)):
+        path = io.BytesIO(path)
+    imagen = Image(path, width=w, height=h)
+    if hasattr(path, "read"):
+        imagen._img = _LectorEnMemoria(path)
+    return imagen
 
 
 def vertical_label(text):
@@ -48,35 +128,271 @@ def vertical_label(text):
     c
     k
     """
-    letters = [c for c in text if c != " "]
+    letters = [html.escape(c) for c in text if c != " "]
     html_text = "<br/>".join(letters)
-    style = ParagraphStyle(
-        name="v",
-        fontName="Helvetica-Bold",
-        fontSize=5,
-        alignment=1,      # CENTER
-        leading=5,
-    )
-    # NO escapamos porque necesitamos <br/>
-    return Paragraph(html_text, style)
+    # NO escapamos el texto completo porque necesitamos <br/>
+    return Paragraph(html_text, _ESTILO_VERTICAL)
+
+
+_ESTILO_VERTICAL = ParagraphStyle(
+    name="v",
+    fontName="Helvetica-Bold",
+    fontSize=5,
+    alignment=1,      # CENTER
+    leading=5,
+)
+
+
+# ========= Numeración "Página X de Y" =========
+
+FORM_TOTAL_PAGINAS = "totalPaginas"
+
+
+class CanvasNumerado(rl_canvas.Canvas):
+    """
+    El total de páginas se conoce recién al terminar: cada página dibuja
+    "X de " y referencia un XObject que se llena con el total en save().
+    Así no hay que guardar el estado de cada página ni construir dos veces.
+    """
+
+    def save(self):
+        # build() ya hizo showPage() de la última página
+        total = self.getPageNumber() - 1
+        self.beginForm(FORM_TOTAL_PAGINAS)
+        self.setFont("Helvetica", 7)
+        self.drawString(0, 0, str(total))
+        self.endForm()
+        super().save()
+
+
+def dibujar_numero_pagina(canv, x, y, prefijo="", bold=False):
+    # Tamaño 7 igual que el XObject del total; el color lo hereda de quien llama
+    fuente = "Helvetica-Bold" if bold else "Helvetica"
+    texto = f"{prefijo}{canv.getPageNumber()} de "
+    canv.setFont(fuente, 7)
+    canv.drawString(x, y, texto)
+    canv.saveState()
+    canv.translate(x + canv.stringWidth(texto, fuente, 7), y)
+    canv.doForm(FORM_TOTAL_PAGINAS)
+    canv.restoreState()
+
+
+class NumeroPagina(Flowable):
+    """
+    Celda "X de Y" del encabezado.
+    """
+
+    def __init__(self, color=colors.black):
+        super().__init__()
+        self.color = color
+
+    def wrap(self, ancho, alto):
+        return ancho, 8.5
+
+    def draw(self):
+        self.canv.setFillColor(self.color)
+        dibujar_numero_pagina(self.canv, 0, 2)
+
+
+def _pie_pagina(canv, doc):
+    canv.saveState()
+    canv.setFillColor(colors.HexColor("#555555"))
+    ancho, _ = doc.pagesize
+    dibujar_numero_pagina(canv, ancho - doc.rightMargin - 2.4 * cm, 0.35 * cm, "Página ")
+    canv.restoreState()
+
+
+def _abrir_foto(ref, lado_max: int):
+    """
+    Abre la foto (ruta, bytes o archivo) reducida a `lado_max` px de lado mayor.
+    En JPEG `draft` deja que el decodificador ya la lea a 1/2, 1/4 u 1/8.
+    """
+    if isinstance(ref, (bytes, bytearray)):
+        ref = io.BytesIO(ref)
+    elif hasattr(ref, "seek"):
+        ref.seek(0)
+    with ImagenPIL.open(ref) as original:
+        # draft pide que los dos lados queden >= al pedido: se pide el
+        # tamaño final con la proporción de la foto
+        escala = min(lado_max / max(original.size), 1)
+        original.draft("RGB", (max(int(original.width * escala), 1), max(int(original.height * escala), 1)))
+        img = original.convert("RGB")
+    img.thumbnail((lado_max, lado_max))
+    return img
+
+
+def _reductor_fotos(lado_max: int, calidad: int, previas: dict = None):
+    """
+    Devuelve una función que recomprime cada foto a JPEG con el nivel dado.
+    `previas` son los JPEG del nivel anterior (más grandes): se parte de
+    ellos y no del original, así cada original se decodifica una sola vez.
+    Solo se guardan JPEG (en `reducir.hechas`): entre fotos y entre
+    niveles no queda ninguna imagen decodificada.
+    """
+    previas = previas or {}
+    hechas = {}
+
+    def reducir(ref):
+        clave = ref if isinstance(ref, str) else id(ref)
+        if clave not in hechas:
+            img = _abrir_foto(previas.get(clave, ref), lado_max)
+            salida = io.BytesIO()
+            img.save(salida, format="JPEG", quality=calidad, optimize=True)
+            img.close()
+            # La misma foto (ej. la general repetida por técnico) se incrusta una vez
+            hechas[clave] = salida.getvalue()
+        return hechas[clave]
+
+    reducir.hechas = hechas
+    return reducir
+
+
+def _bytes_fotos(data: dict) -> int:
+    """
+    Tamaño de las fotos de campo distintas (rutas o bytes) del ATS.
+    """
+    refs = [data.get("foto_path")] + [t.get("foto_path") for t in data.get("tecnicos", []) or []]
+    vistas = {}
+    for ref in refs:
+        if isinstance(ref, (bytes, bytearray)):
+            vistas[id(ref)] = len(ref)
+        elif isinstance(ref, str) and os.path.exists(ref):
+            vistas[ref] = os.path.getsize(ref)
+    return sum(vistas.values())
 
 
 # ========= Generar PDF =========
 
-def generar_pdf(data: dict) -> str:
-    filename = f"ATS_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+def limpiar_temporales(data: dict):
+    """
+    Borra las fotos y firmas temporales (rutas en disco) usadas por el PDF.
+    """
+    try:
+        rutas = [data.get("foto_path")]
+        for t in data.get("tecnicos", []) or []:
+            rutas.append(t.get("firma_path"))
+            rutas.append(t.get("foto_path"))
+        for r in rutas:
+            if isinstance(r, str) and os.path.exists(r):
+                os.remove(r)
+    except Exception:
+        pass
+
+
+def _nombre_por_defecto() -> str:
+    # Sufijo aleatorio: dos envíos en el mismo segundo no deben pisarse
+    return f"ATS_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}.pdf"
+
+
+def generar_pdf(data: dict, destino=None, invariante: bool = False, limpiar: bool = True,
+                catalogo=None):
+    """
+    Genera el PDF del ATS.
+      - destino: ruta o archivo en memoria (BytesIO). Por defecto ATS_<fecha_hora>_<sufijo>.pdf
+      - invariante: fechas y metadatos fijos, para que el mismo `data`
+        produzca exactamente los mismos bytes (re-generación bajo demanda).
+      - limpiar: borrar las fotos / firmas temporales al terminar.
+      - catalogo: columnas de EPP (por defecto el último catálogo cargado).
+    Retorna `destino` (la ruta del archivo si no se indicó).
+    """
+    filename = destino or _nombre_por_defecto()
+    _construir_pdf(data, filename, invariante, catalogo=catalogo)
+
+    # Limpieza temporales
+    if limpiar:
+        limpiar_temporales(data)
+
+    return filename
+
+
+def generar_pdf_con_limite(data: dict, max_bytes: int, destino=None,
+                           invariante: bool = False, limpiar: bool = True, catalogo=None) -> dict:
+    """
+    Genera el PDF con compresión de páginas y, si supera `max_bytes`, lo
+    vuelve a armar bajando resolución y calidad JPEG de las fotos (NIVELES_FOTO)
+    hasta que entre. Firmas y logo no se tocan.
+    Retorna {"destino", "bytes", "nivel", "lado_max", "calidad", "dentro_limite",
+    "fotos"}; "fotos" son los JPEG reducidos que quedaron en el PDF (ruta o
+    id() de los bytes -> JPEG), vacío en el nivel 0.
+    Si ni el último nivel entra, se guarda ese (el más chico) con dentro_limite=False.
+    """
+    destino = destino or _nombre_por_defecto()
+    # Si las fotos originales ya no entran, no vale la pena armar el nivel 0
+    inicio = 1 if _bytes_fotos(data) > max_bytes else 0
+
+    buffer = previas = None
+    for nivel, (lado_max, calidad) in enumerate(NIVELES_FOTO[inicio:], start=inicio):
+        # Se suelta el intento anterior antes de armar el siguiente
+        buffer = None
+        reducir = _reductor_fotos(lado_max, calidad, previas) if lado_max else None
+        buffer = io.BytesIO()
+        _construir_pdf(data, buffer, invariante, comprimir=True, reducir_foto=reducir, catalogo=catalogo)
+        tamano = buffer.getbuffer().nbytes
+        if tamano <= max_bytes:
+            break
+        previas = reducir.hechas if reducir else None
+    fotos = reducir.hechas if reducir else {}
+    reducir = previas = None
+
+    resultado = {
+        "destino": destino,
+        "bytes": tamano,
+        "nivel": nivel,
+        "lado_max": lado_max,
+        "calidad": calidad,
+        "dentro_limite": tamano <= max_bytes,
+    }
+    if not resultado["dentro_limite"]:
+        log.warning("El PDF del ATS supera el tamaño máximo aun con las fotos al mínimo",
+                    extra=dict(resultado, max_bytes=max_bytes))
+    elif nivel:
+        log.info("Fotos del PDF reducidas para respetar el tamaño máximo",
+                 extra=dict(resultado, max_bytes=max_bytes))
+    resultado["fotos"] = fotos
+
+    # getbuffer(): se escribe sin copiar el PDF
+    if isinstance(destino, str):
+        with open(destino, "wb") as f:
+            f.write(buffer.getbuffer())
+    else:
+        destino.write(buffer.getbuffer())
+    buffer.close()
+
+    if limpiar:
+        limpiar_temporales(data)
+
+    return resultado
+
+
+def _construir_pdf(data: dict, destino, invariante: bool = False,
+                   comprimir: bool = False, reducir_foto=None, catalogo=None):
+    """
+    Arma el documento en `destino`. `reducir_foto(ref) -> bytes` se aplica
+    a las fotos de campo (no a firmas ni logo) cuando se ajusta el tamaño.
+    """
+    cat = catalogo or catalogo_ats.vigente()
+
+    def FOTO(ref, w, h):
+        if reducir_foto and hay_imagen(ref):
+            ref = reducir_foto(ref)
+        return IMG(ref, w, h)
 
     AZUL = colors.HexColor("#002b5c")
     GRIS = colors.HexColor("#f2f3f5")
 
     # A4 horizontal. Ancho útil = 29.7 - 2 cm = 27.7 cm
     doc = SimpleDocTemplate(
-        filename,
+        destino,
         pagesize=landscape(A4),
         leftMargin=1.0 * cm,
         rightMargin=1.0 * cm,
         topMargin=0.8 * cm,
         bottomMargin=0.8 * cm,
+        invariant=1 if invariante else 0,
+        pageCompression=1 if comprimir else 0,
+        title="ATS - Charla de 5 min",
+        author="CICSA PERU S.A.C.",
+        creator="Plataforma ATS CICSA",
     )
 
     story = []
@@ -103,7 +419,7 @@ def generar_pdf(data: dict) -> str:
             [P("Fecha:", True, 7, "LEFT", colors.white, True),
              P("09/03/2020", False, 7, "LEFT", colors.white, True)],
             [P("Página:", True, 7, "LEFT", colors.white, True),
-             P("1 de 1", False, 7, "LEFT", colors.white, True)],
+             NumeroPagina(colors.white)],
         ],
         colWidths=[2.6 * cm, 3.1 * cm],
     )
@@ -185,21 +501,8 @@ def generar_pdf(data: dict) -> str:
 
     tecnicos = data.get("tecnicos", []) or []
 
-    # Encabezados EPP en vertical
-    epp_headers = [
-        vertical_label("Fotocheck"),
-        vertical_label("Uniforme"),
-        vertical_label("Casco"),
-        vertical_label("Barbiquejo"),
-        vertical_label("Lentes"),
-        vertical_label("UV"),
-        vertical_label("Guantes Dielectricos"),
-        vertical_label("Guantes Anticorte"),
-        vertical_label("Chaleco"),
-        vertical_label("Arnes"),
-        vertical_label("Botas"),
-        vertical_label("SCTR"),
-    ]
+    # Encabezados EPP en vertical (columnas del catálogo)
+    epp_headers = [vertical_label(etiqueta) for etiqueta in cat.etiquetas_epp]
 
     header = [
         P("Item", True, nowrap=True),
@@ -213,34 +516,12 @@ def generar_pdf(data: dict) -> str:
 
     filas = [header]
 
-    def marcado(keys, epps):
-        for kw in keys:
-            for e in epps:
-                if kw.lower() in e.lower():
-                    return "✔"
-        return ""
-
-    checks_map = [
-        ["fotocheck", "foto"],
-        ["uniforme"],
-        ["casco"],
-        ["barbuquejo", "barb"],
-        ["lentes"],
-        ["uv", "ultravioleta"],
-        ["diel"],
-        ["anticorte"],
-        ["chaleco"],
-        ["arnes", "arnés", "cinturon", "cinturón"],
-        ["bota"],
-        ["sctr"],
-    ]
-
     for i, t in enumerate(tecnicos, start=1):
         nombre = t.get("nombre", "")
         cargo = t.get("cargo", "")
         dni = t.get("dni", "")
         obs = t.get("obs", "")
-        epps = [str(x) for x in (t.get("epp") or [])]
+        marcados = cat.ids_epp(t.get("epp"))
 
         fila = [
             P(i),
@@ -248,13 +529,13 @@ def generar_pdf(data: dict) -> str:
             P(cargo, False, 6.2, "LEFT"),
             P(dni, False, 6.2, "LEFT"),
         ]
-        for ks in checks_map:
-            fila.append(P(marcado(ks, epps), False, 6))
+        for id_epp in cat.ids_columnas_epp:
+            fila.append(P("✔" if id_epp in marcados else "", False, 6))
 
         fila.append(P(obs, False, 6.2, "LEFT"))
 
         firma_path = t.get("firma_path")
-        if firma_path and os.path.exists(firma_path):
+        if hay_imagen(firma_path):
             firma_cell = IMG(firma_path, 2.6 * cm, 1.2 * cm)
         else:
             firma_cell = P("_________________", False, 6)
@@ -262,17 +543,20 @@ def generar_pdf(data: dict) -> str:
 
         filas.append(fila)
 
-    # 0.7 + 6.0 + 2.0 + 2.0 + 12*0.7 + 4.3 + 4.3 = 27.7
+    # 0.7 + nombre + 2.0 + 2.0 + n*epp + 4.3 + 4.3 = 27.7
+    # Con las 12 columnas base: nombre 6.0 cm y EPP 0.7 cm. Si el catálogo
+    # trae más EPP se angostan sus columnas, dejando al menos 3 cm al nombre.
+    n_epp = max(len(cat.ids_columnas_epp), 1)
+    ancho_epp = min(0.7, (27.7 - 13.3 - 3.0) / n_epp)
+    ancho_nombre = 27.7 - 13.3 - n_epp * ancho_epp
     tabla_part = Table(
         filas,
         colWidths=[
             0.7 * cm,
-            6.0 * cm,
+            ancho_nombre * cm,
             2.0 * cm,
             2.0 * cm,
-            0.7 * cm, 0.7 * cm, 0.7 * cm, 0.7 * cm,
-            0.7 * cm, 0.7 * cm, 0.7 * cm, 0.7 * cm,
-            0.7 * cm, 0.7 * cm, 0.7 * cm, 0.7 * cm,
+        ] + [ancho_epp * cm] * len(cat.ids_columnas_epp) + [
             4.3 * cm,
             4.3 * cm,
         ],
@@ -348,7 +632,16 @@ def generar_pdf(data: dict) -> str:
         )
     )
 
-    riesgos = data.get("riesgos", []) or ["Sin riesgos registrados"]
+    # riesgos_detalle se resuelve con el catálogo al enviar el ATS; los ATS
+    # guardados antes del catálogo solo tienen los nombres (texto genérico)
+    riesgos = data.get("riesgos_detalle")
+    if riesgos is None:
+        riesgos = [
+            dict(catalogo_ats.RIESGO_GENERICO, nombre=r)
+            for r in (data.get("riesgos", []) or [])
+        ]
+    if not riesgos:
+        riesgos = [dict(catalogo_ats.RIESGO_GENERICO, nombre="Sin riesgos registrados")]
 
     header_r = [
         P("ITEM", True, nowrap=True),
@@ -366,13 +659,13 @@ def generar_pdf(data: dict) -> str:
         filas_r.append(
             [
                 P(i),
-                P(r, False, 6.3, "LEFT"),
-                P("Riesgo mecánico / eléctrico / físico", False, 6.3, "LEFT"),
-                P("Accidente / lesión / caída", False, 6.3, "LEFT"),
-                P("Uso de EPP / señalización / orden y limpieza", False, 6.3, "LEFT"),
-                P(""),
-                P("X", True),
-                P(""),
+                P(r.get("nombre"), False, 6.3, "LEFT"),
+                P(r.get("peligros"), False, 6.3, "LEFT"),
+                P(r.get("riesgo"), False, 6.3, "LEFT"),
+                P(r.get("controles"), False, 6.3, "LEFT"),
+            ] + [
+                P("X", True) if r.get("nivel") == nivel else P("")
+                for nivel in catalogo_ats.NIVELES
             ]
         )
 
@@ -456,48 +749,39 @@ def generar_pdf(data: dict) -> str:
     story.append(Spacer(1, 3))
 
     # ========= IMAGEN DEL PERSONAL EN CAMPO CON EPP =========
-    fotos_rows = []
-
-    # Fotos individuales por técnico
-    for t in tecnicos:
-        nombre = t.get("nombre", "")
-        fpath = t.get("foto_path")
-        if fpath and os.path.exists(fpath):
-            fotos_rows.append(
-                [
-                    P(nombre, False, 6.5, "LEFT"),
-                    IMG(fpath, 4.5 * cm, 3.5 * cm),
-                ]
-            )
-
-    # Foto general si no hay individuales
+    # Fotos individuales por técnico; si no hay, la foto general una sola vez
+    fotos = [
+        (t.get("nombre", ""), t.get("foto_path"))
+        for t in tecnicos
+        if hay_imagen(t.get("foto_path"))
+    ]
     foto_general = data.get("foto_path")
-    if not fotos_rows and foto_general and os.path.exists(foto_general):
-        for t in tecnicos:
-            fotos_rows.append(
-                [
-                    P(t.get("nombre", ""), False, 6.5, "LEFT"),
-                    IMG(foto_general, 4.5 * cm, 3.5 * cm),
-                ]
-            )
+    if not fotos and hay_imagen(foto_general):
+        fotos = [("Personal en campo", foto_general)]
 
-    if fotos_rows:
+    if fotos:
         story.append(P("IMAGEN DEL PERSONAL EN CAMPO CON EPP", True, 7, "LEFT", AZUL, True))
 
+        celdas = [
+            [FOTO(ref, 4.5 * cm, 3.5 * cm), P(nombre, False, 6.5, "CENTER")]
+            for nombre, ref in fotos
+        ]
+        celdas += [""] * (-len(celdas) % FOTOS_POR_FILA)
         filas_foto = [
-            [P("Nombre y Apellidos", True, 6.5, "CENTER"),
-             P("Foto", True, 6.5, "CENTER")]
-        ] + fotos_rows
+            celdas[k:k + FOTOS_POR_FILA]
+            for k in range(0, len(celdas), FOTOS_POR_FILA)
+        ]
 
         tabla_foto = Table(
             filas_foto,
-            colWidths=[13.85 * cm, 13.85 * cm],
+            colWidths=[27.7 * cm / FOTOS_POR_FILA] * FOTOS_POR_FILA,
         )
         tabla_foto.setStyle(
             TableStyle(
                 [
                     ("BOX", (0, 0), (-1, -1), 0.6, colors.black),
                     ("INNERGRID", (0, 0), (-1, -1), 0.25, colors.black),
+                    ("ALIGN", (0, 0), (-1, -1), "CENTER"),
                     ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
                 ]
             )
@@ -517,21 +801,5 @@ def generar_pdf(data: dict) -> str:
         )
     )
 
-    # Construir PDF
-    doc.build(story)
-
-    # Limpieza temporales
-    try:
-        if foto_general and os.path.exists(foto_general):
-            os.remove(foto_general)
-        for t in tecnicos:
-            f = t.get("firma_path")
-            if f and os.path.exists(f):
-                os.remove(f)
-            ft = t.get("foto_path")
-            if ft and os.path.exists(ft):
-                os.remove(ft)
-    except Exception:
-        pass
-
-    return filename
+    # Construir PDF (pie con "Página X de Y" en todas las páginas)
+    doc.build(story, onFirstPage=_pie_pagina, onLaterPages=_pie_pagina, canvasmaker=CanvasNumerado)
@@ -0,0 +1,242 @@
+import base64
+import logging
+import os
+import time
+from datetime import date, timedelta
+
+from cache_local import CacheTTL
+from estado_compartido import CacheCompartida
+
+log = logging.getLogger(__name__)
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+TABLA_REGISTROS = "ats_registros_diarios"
+
+# payload_path se pide siempre, sin importar ATS_ALMACENAMIENTO: los reportes
+# ya guardados como payload (ver ats_payload.py) no tienen PDF en el bucket
+COLUMNAS = (
+    "id,fecha,brigada,zona,contrata,usuario_registro,"
+    "supervisor,tecnicos_count,completado,pdf_path,payload_path"
+)
+COLUMNA_PAYLOAD = "payload_path"
+# Sin sql/004_ats_payload.sql aplicado se consulta sin la columna y se
+# vuelve a probar pasado este tiempo (la migración puede llegar en caliente)
+REINTENTO_COLUMNA_SEG = 300
+
+FILTROS_EXACTOS = ("brigada", "zona", "contrata", "supervisor")
+
+LIMITE_DEFECTO = 50
+LIMITE_MAXIMO = 200
+
+# Consultas "calientes" (hoy / esta semana) se repiten mucho: se cachean unos segundos
+CACHE_CONSULTAS_SEG = int(os.getenv("HISTORIAL_CACHE_SEG", "30"))
+
+# URLs firmadas para descargar el PDF desde el bucket
+URL_FIRMADA_EXPIRA_SEG = int(os.getenv("PDF_URL_EXPIRA_SEG", "3600"))
+
+# Compartida entre instancias: invalidar_cache() se ve en todas al instante
+_cache_consultas = CacheCompartida("historial:consultas", ttl=CACHE_CONSULTAS_SEG, limpiable=True)
+# Se reutiliza la URL mientras le queden al menos 5 min de vigencia.
+# Local: se consulta una por fila y no cambia el resultado, solo ahorra llamadas.
+_cache_urls = CacheTTL(ttl=max(URL_FIRMADA_EXPIRA_SEG - 300, 60), max_items=5000)
+
+_sin_columna_payload_hasta = 0.0  # hora monotónica
+
+
+# =========================
+# CURSOR (keyset)
+# =========================
+def codificar_cursor(fecha: str, registro_id) -> str:
+    raw = f"{fecha}|{registro_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str):
+    """
+    Devuelve (fecha, id) o None si el cursor es inválido.
+    """
+    if not cursor:
+        return None
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        fecha, registro_id = (
+            base64.urlsafe_b64decode(cursor + padding).decode().split("|", 1)
+        )
+        date.fromisoformat(fecha)
+        return fecha, int(registro_id)
+    except Exception:
+        return None
+
+
+# =========================
+# FILTROS
+# =========================
+def rango_rapido(nombre: str, hoy: date = None):
+    """
+    Atajos de la pantalla: 'hoy' y 'semana' (lunes a hoy).
+    """
+    hoy = hoy or date.today()
+    if nombre == "hoy":
+        return hoy.isoformat(), hoy.isoformat()
+    if nombre == "semana":
+        lunes = hoy - timedelta(days=hoy.weekday())
+        return lunes.isoformat(), hoy.isoformat()
+    return None, None
+
+
+def leer_filtros(args) -> dict:
+    """
+    Normaliza los filtros desde request.args (o cualquier dict).
+    Las fechas inválidas se ignoran.
+    """
+    filtros = {}
+
+    desde, hasta = rango_rapido(args.get("rango") or "")
+    desde = (args.get("desde") or "").strip() or desde
+    hasta = (args.get("hasta") or "").strip() or hasta
+    for clave, valor in (("desde", desde), ("hasta", hasta)):
+        if not valor:
+            continue
+        try:
+            filtros[clave] = date.fromisoformat(valor).isoformat()
+        except ValueError:
+            pass
+
+    for clave in FILTROS_EXACTOS:
+        valor = (args.get(clave) or "").strip()
+        if valor:
+            filtros[clave] = valor
+
+    return filtros
+
+
+def aplicar_filtros(query, filtros: dict):
+    if filtros.get("desde"):
+        query = query.gte("fecha", filtros["desde"])
+    if filtros.get("hasta"):
+        query = query.lte("fecha", filtros["hasta"])
+    for clave in FILTROS_EXACTOS:
+        if filtros.get(clave):
+            query = query.eq(clave, filtros[clave])
+    return query
+
+
+# =========================
+# BÚSQUEDA
+# =========================
+def consultar_pagina(client, filtros: dict, despues_de=None, limite: int = LIMITE_DEFECTO,
+                     columnas: str = COLUMNAS) -> list:
+    """
+    Una página ordenada por (fecha DESC, id DESC), empezando después de
+    `despues_de` = (fecha, id). Sin OFFSET: el costo no crece con la página.
+    """
+
+    def _armar(query):
+        query = aplicar_filtros(query, filtros)
+        if despues_de:
+            fecha, registro_id = despues_de
+            query = query.or_(
+                f"fecha.lt.{fecha},and(fecha.eq.{fecha},id.lt.{registro_id})"
+            )
+        return query.order("fecha", desc=True).order("id", desc=True).limit(limite)
+
+    return consultar_registros(client, columnas, _armar)
+
+
+def consultar_registros(client, columnas: str, armar) -> list:
+    """
+    Ejecuta `armar(select)` sobre ats_registros_diarios. Si la base aún no
+    tiene la columna payload_path, se consulta sin ella (no hay payloads).
+    """
+    global _sin_columna_payload_hasta
+    pide_payload = COLUMNA_PAYLOAD in columnas.split(",")
+    if pide_payload and time.monotonic() < _sin_columna_payload_hasta:
+        columnas = _sin_payload(columnas)
+        pide_payload = False
+    try:
+        resp = armar(client.table(TABLA_REGISTROS).select(columnas)).execute()
+    except Exception as e:
+        if not pide_payload or COLUMNA_PAYLOAD not in str(e):
+            raise
+        log.warning("Falta la columna payload_path (ver sql/004_ats_payload.sql). Se consulta sin ella.")
+        _sin_columna_payload_hasta = time.monotonic() + REINTENTO_COLUMNA_SEG
+        resp = armar(client.table(TABLA_REGISTROS).select(_sin_payload(columnas))).execute()
+    return resp.data or []
+
+
+def _sin_payload(columnas: str) -> str:
+    return ",".join(c for c in columnas.split(",") if c != COLUMNA_PAYLOAD)
+
+
+def buscar_registros(client, filtros: dict, cursor: str = None,
+                     limite: int = LIMITE_DEFECTO) -> dict:
+    """
+    Devuelve {"items": [...], "siguiente": cursor | None}.
+    """
+    limite = max(1, min(int(limite or LIMITE_DEFECTO), LIMITE_MAXIMO))
+    despues_de = decodificar_cursor(cursor)
+
+    clave = (tuple(sorted(filtros.items())), despues_de, limite)
+
+    def _consultar():
+        # Se pide una fila extra para saber si hay página siguiente
+        filas = consultar_pagina(client, filtros, despues_de, limite + 1)
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            ultima = filas[-1]
+            siguiente = codificar_cursor(ultima["fecha"], ultima["id"])
+        return {"items": filas, "siguiente": siguiente}
+
+    return _cache_consultas.obtener_o_calcular(clave, _consultar)
+
+
+def invalidar_cache():
+    """
+    Llamar después de registrar un ATS para que el historial lo muestre al instante.
+    """
+    _cache_consultas.limpiar()
+
+
+# =========================
+# URLs DE ACCESO A LOS PDFs
+# =========================
+def urls_firmadas(client, bucket: str, paths: list) -> dict:
+    """
+    Genera (en una sola llamada) URLs firmadas para los paths que no estén
+    en cache. Devuelve {path: url}.
+    """
+    urls = {}
+    faltantes = []
+    for path in paths:
+        if not path:
+            continue
+        url = _cache_urls.get((bucket, path))
+        if url:
+            urls[path] = url
+        elif path not in faltantes:
+            faltantes.append(path)
+
+    if faltantes:
+        try:
+            firmadas = client.storage.from_(bucket).create_signed_urls(
+                faltantes, URL_FIRMADA_EXPIRA_SEG
+            )
+            for item in firmadas:
+                url = item.get("signedURL") or item.get("signedUrl")
+                if item.get("error") or not url:
+                    continue
+                urls[item["path"]] = url
+                _cache_urls.set((bucket, item["path"]), url)
+        except Exception as e:
+            log.warning("Error generando URLs firmadas de PDFs: %s", e)
+
+    return urls
+
+
+def adjuntar_urls(client, bucket: str, items: list) -> list:
+    urls = urls_firmadas(client, bucket, [r.get("pdf_path") for r in items])
+    return [dict(r, pdf_url=urls.get(r.get("pdf_path"))) for r in items]
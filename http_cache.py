@@ -0,0 +1,191 @@
+import gzip
+import hashlib
+import os
+
+from flask import current_app, request
+
+from cache_local import CacheBytesLRU
+
+try:
+    import brotli  # opcional: si no está instalado se usa solo gzip
+except ImportError:
+    brotli = None
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+# No vale la pena comprimir respuestas muy pequeñas
+MIN_BYTES_COMPRESION = int(os.getenv("HTTP_MIN_BYTES_COMPRESION", "500"))
+GZIP_NIVEL = int(os.getenv("HTTP_GZIP_NIVEL", "6"))
+BROTLI_NIVEL = int(os.getenv("HTTP_BROTLI_NIVEL", "5"))
+# Memoria para las versiones comprimidas de los estáticos
+ESTATICOS_COMPRIMIDOS_BYTES = int(float(os.getenv("HTTP_CACHE_ESTATICOS_MB", "16")) * 1024 * 1024)
+
+# Estáticos con la huella vigente (?v=...) se pueden cachear "para siempre"
+UN_ANIO = 365 * 24 * 3600
+# Estáticos pedidos sin huella o con otra (ej. enlaces viejos) se revalidan cada hora
+UNA_HORA = 3600
+
+TIPOS_COMPRIMIBLES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+}
+
+# ruta absoluta -> (mtime, huella)
+_huellas = {}
+# (etag, encoding) -> bytes comprimidos de un estático
+_estaticos_comprimidos = CacheBytesLRU(ESTATICOS_COMPRIMIDOS_BYTES)
+
+
+# =========================
+# HUELLAS DE ESTÁTICOS
+# =========================
+def huella_estatico(static_folder: str, filename: str):
+    """
+    Devuelve un hash corto del contenido del archivo estático.
+    Se recalcula solo si cambia el mtime del archivo.
+    """
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    cacheado = _huellas.get(path)
+    if cacheado and cacheado[0] == mtime:
+        return cacheado[1]
+
+    with open(path, "rb") as f:
+        huella = hashlib.sha256(f.read()).hexdigest()[:12]
+    _huellas[path] = (mtime, huella)
+    return huella
+
+
+# =========================
+# COMPRESIÓN
+# =========================
+def _elegir_encoding():
+    aceptados = request.accept_encodings
+    if brotli is not None and aceptados["br"]:
+        return "br"
+    if aceptados["gzip"]:
+        return "gzip"
+    return None
+
+
+def _comprimir_bytes(datos: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(datos, quality=BROTLI_NIVEL)
+    return gzip.compress(datos, compresslevel=GZIP_NIVEL, mtime=0)
+
+
+def _comprimir(resp):
+    if resp.status_code != 200 or "Content-Encoding" in resp.headers:
+        return resp
+    # Respuestas generadas por streaming (exportaciones): no se bufferizan.
+    # Los estáticos también son "streamed" pero llegan como direct_passthrough.
+    if resp.is_streamed and not resp.direct_passthrough:
+        return resp
+    if resp.mimetype not in TIPOS_COMPRIMIBLES:
+        return resp
+
+    resp.vary.add("Accept-Encoding")
+
+    encoding = _elegir_encoding()
+    if not encoding:
+        return resp
+
+    es_estatico = request.endpoint == "static"
+    etag, _ = resp.get_etag()
+    clave = (etag, encoding)
+
+    comprimido = _estaticos_comprimidos.get(clave) if es_estatico and etag else None
+    if comprimido is None:
+        # send_file entrega un wrapper de archivo; hay que leerlo para comprimir
+        resp.direct_passthrough = False
+        datos = resp.get_data()
+        if len(datos) < MIN_BYTES_COMPRESION:
+            return resp
+        comprimido = _comprimir_bytes(datos, encoding)
+        if es_estatico and etag:
+            _estaticos_comprimidos.set(clave, comprimido)
+
+    resp.set_data(comprimido)
+    resp.headers["Content-Encoding"] = encoding
+    # Los rangos de bytes se refieren al archivo original, no al comprimido
+    resp.headers.pop("Accept-Ranges", None)
+    # El cuerpo ya no es idéntico byte a byte: el ETag pasa a ser débil.
+    # If-None-Match usa comparación débil, así que los 304 siguen funcionando.
+    if etag:
+        resp.set_etag(etag, weak=True)
+    return resp
+
+
+# =========================
+# CABECERAS DE CACHE
+# =========================
+def _cabeceras_cache(resp):
+    if request.endpoint == "static":
+        # send_file marca no-cache por defecto (SEND_FILE_MAX_AGE_DEFAULT=None)
+        resp.cache_control.no_cache = None
+        resp.cache_control.public = True
+        # Solo la huella actual del archivo: un ?v= inventado o de una
+        # versión anterior no debe quedar cacheado un año
+        huella = None
+        if resp.status_code in (200, 304):
+            huella = huella_estatico(current_app.static_folder, request.view_args["filename"])
+        if huella and request.args.get("v") == huella:
+            resp.cache_control.max_age = UN_ANIO
+            resp.cache_control.immutable = True
+        else:
+            resp.cache_control.max_age = UNA_HORA
+        return resp
+
+    # Páginas renderizadas: dependen de la sesión, se revalidan siempre
+    # pero con ETag para responder 304 sin cuerpo si no cambiaron.
+    if (
+        request.method in ("GET", "HEAD")
+        and resp.status_code == 200
+        and resp.mimetype == "text/html"
+        and not resp.direct_passthrough
+    ):
+        resp.cache_control.private = True
+        resp.cache_control.no_cache = True
+        resp.add_etag()
+        resp.make_conditional(request)
+    return resp
+
+
+def configurar_http_cache(app):
+    """
+    Registra en la app:
+      - huella de contenido en url_for('static', ...) -> ?v=<hash>
+      - Cache-Control de larga duración para estáticos con huella
+      - ETag / GET condicional para páginas HTML
+      - compresión brotli (si está instalado) o gzip
+    """
+
+    @app.url_defaults
+    def _agregar_huella(endpoint, values):
+        if endpoint != "static" or "v" in values:
+            return
+        filename = values.get("filename")
+        if not filename:
+            return
+        huella = huella_estatico(app.static_folder, filename)
+        if huella:
+            values["v"] = huella
+
+    @app.after_request
+    def _post_respuesta(resp):
+        resp = _cabeceras_cache(resp)
+        return _comprimir(resp)
+
+    return app
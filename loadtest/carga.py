@@ -0,0 +1,503 @@
+"""
+Prueba de carga de punta a punta sin tocar Supabase ni Gmail reales.
+
+Levanta el servidor Supabase falso y el sumidero SMTP, arranca la app
+apuntando a ellos y reproduce envíos completos del formulario (login,
+GET /formulario, POST /formulario con firmas y fotos) subiendo la
+concurrencia por niveles. Al final muestra RPS, percentiles por endpoint
+y el punto de saturación.
+
+Uso (desde la raíz del repo):
+    python -m loadtest.carga
+    python -m loadtest.carga --niveles 1,4,8,16,32 --duracion 30
+    python -m loadtest.carga --servidor gunicorn --workers 4 --threads 4
+    python -m loadtest.carga --latencia-db-ms 60 --latencia-smtp-ms 300 --json resultado.json
+    python -m loadtest.carga --instancias 2 --estado redis   # dos instancias detrás de un "balanceador"
+
+Con --instancias N cada usuario virtual reparte sus requests entre las N
+instancias (sin afinidad de sesión) y cada una corre en su propio
+directorio. --estado redis levanta loadtest/redis_falso.py y lo comparten.
+
+La app corre en un directorio temporal (los PDFs y temp/ no ensucian el
+repo). Las variables de Supabase y SMTP se pasan por entorno y tienen
+prioridad sobre el .env, así que nunca se usan las credenciales reales.
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date
+
+import requests
+from PIL import Image, ImageDraw
+
+from loadtest.redis_falso import RedisFalso
+from loadtest.smtp_sumidero import SumideroSMTP
+from loadtest.supabase_falso import SupabaseFalso
+
+
+RAIZ_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ZONAS = ["NORTE", "SUR", "ESTE", "OESTE"]
+SUPERVISORES = ["WISMAN MEZA", "CARLOS ROCA", "MIGUEL PORTOCARRERO", "LUIS SÁNCHEZ"]
+TRABAJOS = ["Empalme de Fibra Óptica", "Mantenimiento preventivo", "Atención de avería"]
+RIESGOS = ["Caídas a distinto nivel", "Riesgo eléctrico", "Atropellos", "Cortes"]
+EPP = ["Casco", "Lentes de seguridad", "Guantes", "Zapatos de seguridad", "Chaleco reflectivo"]
+CLAVE = "carga123"
+
+# Criterios de saturación
+MEJORA_MINIMA = 0.10  # el nivel siguiente debe dar al menos +10% de envíos/s
+
+
+# =========================
+# DATOS DE PRUEBA
+# =========================
+def sembrar(servidor: SupabaseFalso, usuarios: int):
+    servidor.base.sembrar("usuarios_brigadas", [
+        {
+            "usuario": f"carga{i:03d}",
+            "clave": CLAVE,
+            "nombre": f"TECNICO CARGA {i:03d}",
+            "cargo": "TECNICO",
+            "brigada": f"BRIG-{i:03d}",
+            "zona": ZONAS[i % len(ZONAS)],
+            "contrata": "CICSA",
+            "dni": f"{70000000 + i}",
+            "activo": True,
+        }
+        for i in range(1, usuarios + 1)
+    ])
+    servidor.base.sembrar("charlas_programadas", [
+        {"item": i, "tema": f"Charla de seguridad {i}", "expositor": "SUPERVISOR"}
+        for i in range(1, 6)
+    ])
+
+
+def firma_png() -> str:
+    img = Image.new("RGBA", (500, 150), (255, 255, 255, 0))
+    dibujo = ImageDraw.Draw(img)
+    puntos = [(20 + i * 12, 75 + random.randint(-50, 50)) for i in range(38)]
+    dibujo.line(puntos, fill=(0, 0, 0, 255), width=3)
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def foto_jpg(ancho: int, alto: int, calidad: int) -> bytes:
+    """
+    Foto con ruido (poco comprimible), parecida en peso a una de celular.
+    """
+    canales = [Image.effect_noise((ancho, alto), 60 + 10 * i) for i in range(3)]
+    img = Image.merge("RGB", canales)
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=calidad)
+    return buffer.getvalue()
+
+
+class Envios:
+    """
+    Formularios pre-generados (las imágenes se crean una sola vez).
+    """
+
+    def __init__(self, usuarios: int, tecnicos: int, foto: bytes, con_foto_general: bool):
+        self.usuarios = usuarios
+        self.tecnicos = tecnicos
+        self.foto = foto
+        self.con_foto_general = con_foto_general
+        self.firmas = [firma_png() for _ in range(5)]
+
+    def formulario(self, n: int):
+        campos = [
+            ("fecha_dia", date.today().isoformat()),
+            ("hora_inicio", "08:00"),
+            ("hora_fin", "17:00"),
+            ("trabajo", TRABAJOS[n % len(TRABAJOS)]),
+            ("lugar_trabajo", f"Av. Prueba de carga {n}"),
+            ("recomendaciones", "Generado por loadtest"),
+            ("supervisor", SUPERVISORES[n % len(SUPERVISORES)]),
+            ("charla", str(1 + n % 5)),
+            ("expositor_charla", ""),
+            ("envio_id", uuid.uuid4().hex),
+        ]
+        campos += [("riesgos[]", r) for r in RIESGOS[: 1 + n % len(RIESGOS)]]
+        archivos = []
+        for i in range(1, self.tecnicos + 1):
+            campos.append((f"tec{i}", f"carga{1 + (n + i) % self.usuarios:03d}"))
+            campos += [(f"epp{i}[]", e) for e in EPP[: 2 + (n + i) % (len(EPP) - 1)]]
+            campos.append((f"obs{i}", ""))
+            campos.append((f"firma{i}", random.choice(self.firmas)))
+            archivos.append((f"foto_tec{i}", (f"foto{i}.jpg", self.foto, "image/jpeg")))
+        if self.con_foto_general:
+            archivos.append(("foto_epp", ("general.jpg", self.foto, "image/jpeg")))
+        return campos, archivos
+
+
+# =========================
+# APP BAJO PRUEBA
+# =========================
+def entorno_app(supabase_url: str, smtp_puerto: int, modo_email: str, estado_url: str = None) -> dict:
+    # load_dotenv() no pisa variables ya definidas
+    entorno = dict(os.environ)
+    entorno.update({
+        "SUPABASE_URL": supabase_url,
+        "SUPABASE_ANON_KEY": "loadtest",
+        "SUPABASE_PDF_BUCKET": "ats_pdfs",
+        "SECRET_KEY": "loadtest",
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp_puerto),
+        "SMTP_STARTTLS": "0",
+        "SMTP_USER": "loadtest@localhost",
+        "SMTP_PASS": "loadtest",
+        "MAIL_FROM": "loadtest@localhost",
+        "MAIL_TO_DEFAULT": "supervision@localhost",
+        "MAIL_CC": "",
+        "SUPERVISOR_EMAILS_JSON": "{}",
+        "EMAIL_MODO": modo_email,
+        "RECORDATORIOS_EN_PROCESO": "0",
+        "PYTHONUNBUFFERED": "1",
+        "ESTADO_BACKEND": "redis" if estado_url else "memoria",
+    })
+    if estado_url:
+        entorno["ESTADO_REDIS_URL"] = estado_url
+    return entorno
+
+
+def arrancar_app(args, supabase_url: str, smtp_puerto: int, directorio: str,
+                 puerto: int, estado_url: str = None):
+    # La app busca static/ relativo al directorio de trabajo
+    os.symlink(os.path.join(RAIZ_REPO, "static"), os.path.join(directorio, "static"))
+
+    bind = f"127.0.0.1:{puerto}"
+    if args.servidor == "gunicorn":
+        comando = [
+            sys.executable, "-m", "gunicorn",
+            "-w", str(args.workers), "--threads", str(args.threads),
+            "-b", bind, "--pythonpath", RAIZ_REPO, "main:app",
+        ]
+    else:
+        comando = [
+            sys.executable, "-c",
+            "import sys; sys.path.insert(0, sys.argv[1]); from main import app; "
+            "app.run(host='127.0.0.1', port=int(sys.argv[2]), threaded=True)",
+            RAIZ_REPO, str(puerto),
+        ]
+
+    log = open(os.path.join(directorio, "app.log"), "wb")
+    proceso = subprocess.Popen(
+        comando,
+        cwd=directorio,
+        env=entorno_app(supabase_url, smtp_puerto, args.modo_email, estado_url),
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+    url = f"http://{bind}"
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            break
+        try:
+            requests.get(url + "/login", timeout=2)
+            return proceso, url
+        except requests.RequestException:
+            time.sleep(0.3)
+    proceso.kill()
+    raise RuntimeError(f"La app no arrancó. Revisar {log.name}")
+
+
+# =========================
+# CARGA
+# =========================
+class Muestras:
+    def __init__(self):
+        self.datos = []  # (endpoint, ms, ok)
+        self._lock = threading.Lock()
+
+    def agregar(self, endpoint: str, ms: float, ok: bool):
+        with self._lock:
+            self.datos.append((endpoint, ms, ok))
+
+
+def _medir(muestras: Muestras, endpoint: str, funcion, validar):
+    inicio = time.perf_counter()
+    try:
+        resp = funcion()
+        ok = validar(resp)
+    except requests.RequestException:
+        ok = False
+    muestras.agregar(endpoint, (time.perf_counter() - inicio) * 1000, ok)
+    return ok
+
+
+def usuario_virtual(n: int, urls: list, envios: Envios, muestras: Muestras,
+                    fin: float, timeout: float):
+    sesion = requests.Session()
+    # Cada request va a la instancia siguiente (balanceo sin afinidad)
+    turno = [n]
+
+    def siguiente() -> str:
+        turno[0] += 1
+        return urls[turno[0] % len(urls)]
+
+    usuario = f"carga{1 + n % envios.usuarios:03d}"
+    ok = _medir(
+        muestras, "POST /login",
+        lambda: sesion.post(siguiente() + "/login", data={"usuario": usuario, "clave": CLAVE},
+                            allow_redirects=False, timeout=timeout),
+        lambda r: r.status_code == 302 and "/formulario" in r.headers.get("Location", ""),
+    )
+    if not ok:
+        return
+
+    envio = n * 1000
+    while time.monotonic() < fin:
+        _medir(
+            muestras, "GET /formulario",
+            lambda: sesion.get(siguiente() + "/formulario", timeout=timeout),
+            lambda r: r.status_code == 200,
+        )
+        campos, archivos = envios.formulario(envio)
+        _medir(
+            muestras, "POST /formulario",
+            lambda: sesion.post(siguiente() + "/formulario", data=campos, files=archivos, timeout=timeout),
+            lambda r: r.status_code == 200 and "Reporte ATS generado" in r.text,
+        )
+        envio += 1
+
+
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    k = (len(valores) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(valores) - 1)
+    return valores[i] + (valores[j] - valores[i]) * (k - i)
+
+
+def resumir(muestras: Muestras, segundos: float) -> dict:
+    por_endpoint = {}
+    for endpoint, ms, ok in muestras.datos:
+        por_endpoint.setdefault(endpoint, []).append((ms, ok))
+
+    endpoints = {}
+    for endpoint, filas in sorted(por_endpoint.items()):
+        tiempos = sorted(ms for ms, _ in filas)
+        errores = sum(1 for _, ok in filas if not ok)
+        endpoints[endpoint] = {
+            "n": len(filas),
+            "errores": errores,
+            "rps": round(len(filas) / segundos, 2),
+            "p50": round(percentil(tiempos, 50), 1),
+            "p90": round(percentil(tiempos, 90), 1),
+            "p95": round(percentil(tiempos, 95), 1),
+            "p99": round(percentil(tiempos, 99), 1),
+            "max": round(tiempos[-1], 1),
+        }
+
+    total = len(muestras.datos)
+    envios = endpoints.get("POST /formulario", {})
+    return {
+        "segundos": round(segundos, 2),
+        "rps": round(total / segundos, 2),
+        "envios_ok_por_seg": round((envios.get("n", 0) - envios.get("errores", 0)) / segundos, 2),
+        "tasa_error": round(sum(e["errores"] for e in endpoints.values()) / total, 4) if total else 0,
+        "endpoints": endpoints,
+    }
+
+
+def correr_nivel(concurrencia: int, args, urls: list, envios: Envios) -> dict:
+    muestras = Muestras()
+    inicio = time.monotonic()
+    fin = inicio + args.duracion
+    hilos = [
+        threading.Thread(
+            target=usuario_virtual,
+            args=(n, urls, envios, muestras, fin, args.timeout),
+            daemon=True,
+        )
+        for n in range(concurrencia)
+    ]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return resumir(muestras, time.monotonic() - inicio)
+
+
+def punto_saturacion(resultados: list, p95_max_ms: float, error_max: float):
+    """
+    Último nivel que todavía escala: más concurrencia ya no da al menos
+    MEJORA_MINIMA más envíos/s, o se pasa el p95 o la tasa de error.
+    Devuelve (nivel, motivo) o (None, None) si no se saturó.
+    """
+    mejor = None
+    for r in resultados:
+        p95 = r["endpoints"].get("POST /formulario", {}).get("p95", 0)
+        if r["tasa_error"] > error_max:
+            return (mejor or r)["concurrencia"], f"errores {r['tasa_error']:.1%} con {r['concurrencia']}"
+        if p95 > p95_max_ms:
+            return (mejor or r)["concurrencia"], f"p95 {p95:.0f} ms con {r['concurrencia']}"
+        if mejor and r["envios_ok_por_seg"] < mejor["envios_ok_por_seg"] * (1 + MEJORA_MINIMA):
+            return mejor["concurrencia"], (
+                f"{r['concurrencia']} usuarios dan {r['envios_ok_por_seg']} envíos/s "
+                f"(vs {mejor['envios_ok_por_seg']})"
+            )
+        mejor = r
+    return None, None
+
+
+def imprimir(resultados: list, saturacion, supabase: SupabaseFalso, smtp: SumideroSMTP):
+    print()
+    print(f"{'conc':>5} {'rps':>7} {'envíos/s':>9} {'error':>7}   endpoint            "
+          f"{'n':>6} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for r in resultados:
+        primero = True
+        for endpoint, e in r["endpoints"].items():
+            cabecera = (
+                f"{r['concurrencia']:>5} {r['rps']:>7} {r['envios_ok_por_seg']:>9} {r['tasa_error']:>7.1%}"
+                if primero else " " * 31
+            )
+            print(f"{cabecera}   {endpoint:<18} {e['n']:>6} {e['p50']:>8} {e['p90']:>8} "
+                  f"{e['p95']:>8} {e['p99']:>8} {e['max']:>8}")
+            primero = False
+    print()
+    nivel, motivo = saturacion
+    if nivel is None:
+        print("Sin saturación en los niveles probados: probar con más concurrencia.")
+    else:
+        print(f"Punto de saturación: ~{nivel} usuarios concurrentes ({motivo}).")
+    print(f"Supabase falso: {sum(supabase.llamadas.values())} llamadas, "
+          f"{supabase.bytes_subidos / 1024 / 1024:.1f} MB subidos")
+    print(f"SMTP: {smtp.mensajes} correos ({smtp.bytes / 1024 / 1024:.1f} MB) "
+          f"en {smtp.conexiones} conexiones")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga del formulario ATS")
+    parser.add_argument("--niveles", default="1,2,4,8,16",
+                        help="Usuarios concurrentes por nivel, ej. 1,2,4,8,16")
+    parser.add_argument("--duracion", type=float, default=20, help="Segundos por nivel")
+    parser.add_argument("--timeout", type=float, default=60, help="Timeout por request (s)")
+    parser.add_argument("--tecnicos", type=int, default=3, help="Técnicos (firma + foto) por envío")
+    parser.add_argument("--foto-ancho", type=int, default=1280)
+    parser.add_argument("--foto-alto", type=int, default=960)
+    parser.add_argument("--foto-calidad", type=int, default=80)
+    parser.add_argument("--sin-foto-general", action="store_true")
+    parser.add_argument("--latencia-db-ms", type=float, default=40,
+                        help="Latencia agregada a cada llamada a Supabase")
+    parser.add_argument("--latencia-smtp-ms", type=float, default=200,
+                        help="Latencia agregada a cada correo")
+    parser.add_argument("--modo-email", choices=("inmediato", "resumen"), default="inmediato")
+    parser.add_argument("--servidor", choices=("flask", "gunicorn"), default="flask",
+                        help="flask = como el Procfile actual; gunicorn = workers x threads")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--puerto-app", type=int, default=5055,
+                        help="Puerto de la primera instancia (las demás usan los siguientes)")
+    parser.add_argument("--instancias", type=int, default=1,
+                        help="Instancias de la app detrás del balanceo round-robin")
+    parser.add_argument("--estado", choices=("memoria", "redis"), default="memoria",
+                        help="Backend de estado compartido (redis = loadtest/redis_falso.py)")
+    parser.add_argument("--p95-max-ms", type=float, default=5000,
+                        help="p95 de POST /formulario aceptable")
+    parser.add_argument("--error-max", type=float, default=0.01, help="Tasa de error aceptable")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    parser.add_argument("--conservar", action="store_true",
+                        help="No borrar el directorio de trabajo (app.log, PDFs)")
+    args = parser.parse_args(argv)
+
+    niveles = [int(n) for n in args.niveles.split(",") if n.strip()]
+    usuarios = max(max(niveles), args.tecnicos + 1)
+
+    supabase = SupabaseFalso(latencia_ms=args.latencia_db_ms)
+    sembrar(supabase, usuarios)
+    supabase.iniciar()
+    smtp = SumideroSMTP(latencia_ms=args.latencia_smtp_ms)
+    smtp.iniciar()
+
+    foto = foto_jpg(args.foto_ancho, args.foto_alto, args.foto_calidad)
+    envios = Envios(usuarios, args.tecnicos, foto, not args.sin_foto_general)
+    print(f"Foto de prueba: {len(foto) / 1024:.0f} KB x "
+          f"{args.tecnicos + (0 if args.sin_foto_general else 1)} por envío")
+
+    redis = None
+    if args.estado == "redis":
+        redis = RedisFalso()
+        redis.iniciar()
+
+    directorio = tempfile.mkdtemp(prefix="ats_carga_")
+    procesos = []
+    try:
+        for i in range(args.instancias):
+            subdirectorio = directorio
+            if args.instancias > 1:
+                subdirectorio = os.path.join(directorio, f"app{i + 1}")
+                os.makedirs(subdirectorio)
+            procesos.append(arrancar_app(
+                args, supabase.url, smtp.puerto, subdirectorio,
+                args.puerto_app + i, redis.url if redis else None,
+            ))
+    except RuntimeError:
+        for proceso, _ in procesos:
+            proceso.kill()
+        raise
+    urls = [url for _, url in procesos]
+    print(f"App ({args.servidor}, estado {args.estado}) en {', '.join(urls)}, "
+          f"directorio de trabajo {directorio}")
+
+    resultados = []
+    try:
+        for concurrencia in niveles:
+            print(f"Nivel {concurrencia} usuarios, {args.duracion:.0f}s...", flush=True)
+            r = correr_nivel(concurrencia, args, urls, envios)
+            r["concurrencia"] = concurrencia
+            resultados.append(r)
+    finally:
+        for proceso, _ in procesos:
+            proceso.terminate()
+        for proceso, _ in procesos:
+            try:
+                proceso.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+        supabase.shutdown()
+        smtp.shutdown()
+        if redis:
+            redis.shutdown()
+
+    saturacion = punto_saturacion(resultados, args.p95_max_ms, args.error_max)
+    imprimir(resultados, saturacion, supabase, smtp)
+    if redis:
+        print(f"Redis falso: {redis.base.comandos} comandos")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "parametros": vars(args),
+                "niveles": resultados,
+                "saturacion": {"concurrencia": saturacion[0], "motivo": saturacion[1]},
+                "supabase_llamadas": supabase.llamadas,
+                "smtp": {"mensajes": smtp.mensajes, "bytes": smtp.bytes, "conexiones": smtp.conexiones},
+            }, f, ensure_ascii=False, indent=2)
+
+    if not any(r["endpoints"].get("POST /formulario", {}).get("n") for r in resultados):
+        print(f"⚠️ No se completó ningún envío. Revisar los app.log en {directorio}")
+        return 1
+    if args.conservar:
+        print(f"Directorio de trabajo conservado: {directorio}")
+    else:
+        shutil.rmtree(directorio, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
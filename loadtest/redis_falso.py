@@ -0,0 +1,278 @@
+"""
+Servidor local que habla el protocolo de Redis (RESP) con los comandos que
+usa estado_compartido.py: GET, SET (PX / EX / NX), DEL, INCR, listas
+(RPUSH, LPUSH, LRANGE, LLEN), conjuntos (SADD, SMEMBERS) y transacciones
+(MULTI / EXEC / DISCARD, WATCH / UNWATCH). Guarda todo en memoria.
+
+Sirve para probar varias instancias de la app con ESTADO_BACKEND=redis
+sin instalar Redis:
+    python -m loadtest.redis_falso --puerto 6380
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class _ErrorComando(Exception):
+    pass
+
+
+class BaseRedisFalsa:
+    def __init__(self):
+        self.datos = {}      # clave -> valor (bytes | list | set)
+        self.expira = {}     # clave -> time.monotonic() de vencimiento
+        self.versiones = {}  # clave -> contador de escrituras (para WATCH)
+        self.lock = threading.RLock()
+        self.comandos = 0
+
+    # --- claves ---
+    def _vigente(self, clave):
+        vence = self.expira.get(clave)
+        if vence is not None and vence <= time.monotonic():
+            self._borrar(clave)
+        return self.datos.get(clave)
+
+    def _tocar(self, clave):
+        self.versiones[clave] = self.versiones.get(clave, 0) + 1
+
+    def _borrar(self, clave) -> int:
+        self.expira.pop(clave, None)
+        if clave in self.datos:
+            del self.datos[clave]
+            self._tocar(clave)
+            return 1
+        return 0
+
+    def _escribir(self, clave, valor, vence=None):
+        self.datos[clave] = valor
+        if vence is None:
+            self.expira.pop(clave, None)
+        else:
+            self.expira[clave] = vence
+        self._tocar(clave)
+
+    def _tipo(self, clave, tipo):
+        valor = self._vigente(clave)
+        if valor is not None and not isinstance(valor, tipo):
+            raise _ErrorComando("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return valor
+
+    def version(self, clave) -> int:
+        self._vigente(clave)
+        return self.versiones.get(clave, 0)
+
+    # --- comandos ---
+    def ejecutar(self, args: list):
+        nombre = args[0].decode().upper()
+        funcion = getattr(self, "cmd_" + nombre.lower(), None)
+        if funcion is None:
+            raise _ErrorComando(f"ERR unknown command '{nombre}'")
+        with self.lock:
+            self.comandos += 1
+            return funcion(*args[1:])
+
+    def cmd_ping(self, *args):
+        return args[0] if args else "PONG"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_auth(self, *args):
+        return "OK"
+
+    def cmd_get(self, clave):
+        return self._tipo(clave, bytes)
+
+    def cmd_set(self, clave, valor, *opciones):
+        vence = None
+        solo_si_no_existe = False
+        opciones = list(opciones)
+        while opciones:
+            op = opciones.pop(0).decode().upper()
+            if op == "NX":
+                solo_si_no_existe = True
+            elif op in ("PX", "EX"):
+                cantidad = int(opciones.pop(0))
+                vence = time.monotonic() + (cantidad / 1000 if op == "PX" else cantidad)
+            else:
+                raise _ErrorComando("ERR syntax error")
+        if solo_si_no_existe and self._vigente(clave) is not None:
+            return None
+        self._escribir(clave, valor, vence)
+        return "OK"
+
+    def cmd_del(self, *claves):
+        return sum(self._borrar(c) for c in claves if self._vigente(c) is not None)
+
+    def cmd_incr(self, clave):
+        valor = self._tipo(clave, bytes)
+        try:
+            nuevo = int(valor or 0) + 1
+        except ValueError:
+            raise _ErrorComando("ERR value is not an integer or out of range")
+        self._escribir(clave, str(nuevo).encode(), self.expira.get(clave))
+        return nuevo
+
+    def cmd_rpush(self, clave, *valores):
+        lista = self._tipo(clave, list) or []
+        lista = lista + list(valores)
+        self._escribir(clave, lista, self.expira.get(clave))
+        return len(lista)
+
+    def cmd_lpush(self, clave, *valores):
+        lista = self._tipo(clave, list) or []
+        lista = list(reversed(valores)) + lista
+        self._escribir(clave, lista, self.expira.get(clave))
+        return len(lista)
+
+    def cmd_lrange(self, clave, inicio, fin):
+        lista = self._tipo(clave, list) or []
+        inicio, fin = int(inicio), int(fin)
+        fin = len(lista) if fin == -1 else fin + 1
+        return lista[inicio:fin]
+
+    def cmd_llen(self, clave):
+        return len(self._tipo(clave, list) or [])
+
+    def cmd_sadd(self, clave, *miembros):
+        conjunto = set(self._tipo(clave, set) or ())
+        nuevos = len(set(miembros) - conjunto)
+        self._escribir(clave, conjunto | set(miembros), self.expira.get(clave))
+        return nuevos
+
+    def cmd_smembers(self, clave):
+        return sorted(self._tipo(clave, set) or ())
+
+    def cmd_flushdb(self):
+        for clave in list(self.datos):
+            self._borrar(clave)
+        return "OK"
+
+    def cmd_dbsize(self):
+        return sum(1 for c in list(self.datos) if self._vigente(c) is not None)
+
+
+# =========================
+# PROTOCOLO
+# =========================
+def _codificar(valor) -> bytes:
+    if valor is None:
+        return b"$-1\r\n"
+    if isinstance(valor, _ErrorComando):
+        return b"-" + str(valor).encode() + b"\r\n"
+    if isinstance(valor, bool):
+        valor = int(valor)
+    if isinstance(valor, int):
+        return b":%d\r\n" % valor
+    if isinstance(valor, str):
+        return b"+" + valor.encode() + b"\r\n"
+    if isinstance(valor, bytes):
+        return b"$%d\r\n%s\r\n" % (len(valor), valor)
+    if isinstance(valor, list):
+        return b"*%d\r\n" % len(valor) + b"".join(_codificar(v) for v in valor)
+    raise TypeError(type(valor))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _leer_comando(self):
+        linea = self.rfile.readline()
+        if not linea:
+            return None
+        if not linea.startswith(b"*"):
+            return linea.split()  # comando inline (ej. "PING" desde telnet)
+        args = []
+        for _ in range(int(linea[1:])):
+            largo = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(largo + 2)[:-2])
+        return args
+
+    def handle(self):
+        base = self.server.base
+        en_multi = None   # comandos encolados tras MULTI
+        vigiladas = {}    # clave -> versión al hacer WATCH
+
+        while True:
+            args = self._leer_comando()
+            if args is None:
+                return
+            if not args:
+                continue
+            nombre = args[0].decode().upper()
+
+            if nombre == "QUIT":
+                self.wfile.write(b"+OK\r\n")
+                return
+            if nombre == "WATCH":
+                with base.lock:
+                    for clave in args[1:]:
+                        vigiladas[clave] = base.version(clave)
+                respuesta = "OK"
+            elif nombre == "UNWATCH":
+                vigiladas = {}
+                respuesta = "OK"
+            elif nombre == "MULTI":
+                en_multi = []
+                respuesta = "OK"
+            elif nombre == "DISCARD":
+                en_multi, vigiladas = None, {}
+                respuesta = "OK"
+            elif nombre == "EXEC":
+                if en_multi is None:
+                    respuesta = _ErrorComando("ERR EXEC without MULTI")
+                else:
+                    with base.lock:
+                        if any(base.version(c) != v for c, v in vigiladas.items()):
+                            respuesta = None
+                        else:
+                            respuesta = []
+                            for comando in en_multi:
+                                try:
+                                    respuesta.append(base.ejecutar(comando))
+                                except _ErrorComando as e:
+                                    respuesta.append(e)
+                    en_multi, vigiladas = None, {}
+            elif en_multi is not None:
+                en_multi.append(args)
+                respuesta = "QUEUED"
+            else:
+                try:
+                    respuesta = base.ejecutar(args)
+                except _ErrorComando as e:
+                    respuesta = e
+
+            self.wfile.write(_codificar(respuesta))
+
+
+class RedisFalso(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, puerto: int = 0, base: BaseRedisFalsa = None):
+        super().__init__(("127.0.0.1", puerto), _Handler)
+        self.base = base or BaseRedisFalsa()
+
+    @property
+    def puerto(self) -> int:
+        return self.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.puerto}/0"
+
+    def iniciar(self) -> threading.Thread:
+        hilo = threading.Thread(target=self.serve_forever, name="redis-falso", daemon=True)
+        hilo.start()
+        return hilo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Redis falso en memoria (protocolo RESP)")
+    parser.add_argument("--puerto", type=int, default=6380)
+    args = parser.parse_args()
+    servidor = RedisFalso(args.puerto)
+    print(f"Redis falso en {servidor.url}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,92 @@
+"""
+Servidor SMTP local que acepta todo y descarta los mensajes (solo cuenta
+mensajes y bytes). Acepta AUTH PLAIN/LOGIN con cualquier clave y no
+ofrece STARTTLS: la app debe correr con SMTP_STARTTLS=0.
+"""
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _enviar(self, linea: str):
+        self.wfile.write((linea + "\r\n").encode("ascii"))
+
+    def _leer(self) -> str:
+        return self.rfile.readline(65536).decode("utf-8", "replace").rstrip("\r\n")
+
+    def handle(self):
+        servidor = self.server
+        self._enviar("220 sumidero-smtp listo")
+        while True:
+            linea = self._leer()
+            if not linea:
+                return
+            comando = linea[:4].upper()
+
+            if comando in ("EHLO", "HELO"):
+                self.wfile.write(
+                    b"250-sumidero-smtp\r\n250-SIZE 52428800\r\n250-8BITMIME\r\n250 AUTH PLAIN LOGIN\r\n"
+                )
+            elif comando == "AUTH":
+                partes = linea.split()
+                if len(partes) >= 2 and partes[1].upper() == "LOGIN":
+                    pendientes = 2 if len(partes) == 2 else 1
+                    for _ in range(pendientes):
+                        self._enviar("334 ")
+                        self._leer()
+                elif len(partes) == 2:
+                    self._enviar("334 ")
+                    self._leer()
+                self._enviar("235 2.7.0 Autenticado")
+            elif comando in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self._enviar("250 OK")
+            elif comando == "DATA":
+                self._enviar("354 Fin con <CRLF>.<CRLF>")
+                tamano = 0
+                while True:
+                    raw = self.rfile.readline()
+                    if not raw or raw in (b".\r\n", b".\n"):
+                        break
+                    tamano += len(raw)
+                if servidor.latencia:
+                    time.sleep(servidor.latencia)
+                servidor.registrar(tamano)
+                self._enviar("250 OK en cola")
+            elif comando == "QUIT":
+                self._enviar("221 Adios")
+                return
+            else:
+                self._enviar("502 Comando no implementado")
+
+
+class SumideroSMTP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, puerto: int = 0, latencia_ms: float = 0):
+        super().__init__(("127.0.0.1", puerto), _Handler)
+        self.latencia = latencia_ms / 1000.0
+        self.mensajes = 0
+        self.bytes = 0
+        self.conexiones = 0
+        self._lock = threading.Lock()
+
+    @property
+    def puerto(self) -> int:
+        return self.server_address[1]
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.conexiones += 1
+        super().process_request(request, client_address)
+
+    def registrar(self, tamano: int):
+        with self._lock:
+            self.mensajes += 1
+            self.bytes += tamano
+
+    def iniciar(self) -> threading.Thread:
+        hilo = threading.Thread(target=self.serve_forever, name="smtp-sumidero", daemon=True)
+        hilo.start()
+        return hilo
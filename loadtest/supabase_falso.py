@@ -0,0 +1,365 @@
+"""
+Servidor HTTP local que imita lo que la app usa de Supabase:
+PostgREST (/rest/v1) y Storage (/storage/v1), con tablas en memoria.
+
+No es un PostgREST completo: soporta los filtros, orden, límite, upsert,
+.single() y las RPC que usa la plataforma. Se le puede agregar latencia
+por request para simular la distancia real a la base.
+"""
+import email
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+
+OPERADORES = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+    "lt": lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+}
+PARAMETROS_RESERVADOS = {"select", "order", "limit", "offset", "on_conflict", "or", "columns"}
+# Keyset de historial/cumplimiento: fecha.lt.X,and(fecha.eq.X,id.lt.Y)
+PATRON_KEYSET = re.compile(r"^\((\w+)\.lt\.([^,]+),and\(\1\.eq\.\2,(\w+)\.lt\.([^)]+)\)\)$")
+
+
+def _convertir(valor_fila, texto: str):
+    """
+    Convierte el valor del filtro (texto) al tipo de la columna.
+    """
+    if isinstance(valor_fila, bool):
+        return texto.lower() == "true"
+    if isinstance(valor_fila, (int, float)):
+        try:
+            return type(valor_fila)(texto)
+        except ValueError:
+            return texto
+    return texto
+
+
+def _cumple(fila: dict, columna: str, expresion: str) -> bool:
+    if expresion.startswith("not."):
+        return not _cumple(fila, columna, expresion[4:])
+    operador, _, texto = expresion.partition(".")
+    valor = fila.get(columna)
+    if operador == "is":
+        return valor is None if texto == "null" else valor == (texto == "true")
+    if operador == "in":
+        opciones = [o.strip().strip('"') for o in texto.strip("()").split(",")]
+        return str(valor) in opciones
+    comparar = OPERADORES.get(operador)
+    if comparar is None:
+        return True
+    return comparar(valor, _convertir(valor, texto))
+
+
+class BaseFalsa:
+    """
+    Tablas en memoria + objetos de Storage. Segura para varios hilos.
+    """
+
+    def __init__(self):
+        self.tablas = {}
+        self.objetos = {}  # (bucket, path) -> bytes
+        self.rpc_disponibles = {"registrar_ats"}
+        # Como db-max-rows de PostgREST: corta cada respuesta sin avisar
+        self.max_filas = None
+        # tabla -> columnas que "no existen" (migración sin aplicar)
+        self.columnas_faltantes = {}
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def sembrar(self, tabla: str, filas: list):
+        with self._lock:
+            destino = self.tablas.setdefault(tabla, [])
+            for fila in filas:
+                destino.append(self._con_id(tabla, dict(fila)))
+
+    def _con_id(self, tabla: str, fila: dict) -> dict:
+        if fila.get("id") is None:
+            self._ids[tabla] = self._ids.get(tabla, 0) + 1
+            fila["id"] = self._ids[tabla]
+        return fila
+
+    # ----- PostgREST -----
+    def columna_faltante(self, tabla: str, select: str):
+        pedidas = (select or "").split(",")
+        return next((c for c in pedidas if c in self.columnas_faltantes.get(tabla, ())), None)
+
+    def seleccionar(self, tabla: str, parametros: list) -> list:
+        with self._lock:
+            filas = list(self.tablas.get(tabla, []))
+
+        limite = offset = None
+        orden = []
+        for clave, valor in parametros:
+            if clave == "order":
+                orden = [p.split(".") for p in valor.split(",")]
+            elif clave == "limit":
+                limite = int(valor)
+            elif clave == "offset":
+                offset = int(valor)
+            elif clave == "or":
+                m = PATRON_KEYSET.match(valor)
+                if m:
+                    col1, v1, col2, v2 = m.groups()
+                    filas = [
+                        f for f in filas
+                        if _cumple(f, col1, f"lt.{v1}")
+                        or (_cumple(f, col1, f"eq.{v1}") and _cumple(f, col2, f"lt.{v2}"))
+                    ]
+            elif clave not in PARAMETROS_RESERVADOS:
+                filas = [f for f in filas if _cumple(f, clave, valor)]
+
+        for partes in reversed(orden):
+            desc = "desc" in partes[1:]
+            filas.sort(key=lambda f: (f.get(partes[0]) is None, f.get(partes[0])), reverse=desc)
+        if offset:
+            filas = filas[offset:]
+        if limite is not None:
+            filas = filas[:limite]
+        if self.max_filas is not None:
+            filas = filas[:self.max_filas]
+        return filas
+
+    def insertar(self, tabla: str, filas: list, conflicto: list = None) -> list:
+        resultado = []
+        with self._lock:
+            destino = self.tablas.setdefault(tabla, [])
+            for fila in filas:
+                existente = None
+                if conflicto:
+                    existente = next(
+                        (f for f in destino if all(f.get(c) == fila.get(c) for c in conflicto)),
+                        None,
+                    )
+                if existente is not None:
+                    existente.update(fila)
+                    resultado.append(dict(existente))
+                else:
+                    nueva = self._con_id(tabla, dict(fila))
+                    destino.append(nueva)
+                    resultado.append(dict(nueva))
+        return resultado
+
+    def actualizar(self, tabla: str, parametros: list, cambios: dict) -> list:
+        filtros = [(k, v) for k, v in parametros if k not in PARAMETROS_RESERVADOS]
+        resultado = []
+        with self._lock:
+            for fila in self.tablas.get(tabla, []):
+                if all(_cumple(fila, k, v) for k, v in filtros):
+                    fila.update(cambios)
+                    resultado.append(dict(fila))
+        return resultado
+
+    def rpc(self, nombre: str, argumentos: dict):
+        if nombre not in self.rpc_disponibles:
+            raise KeyError(nombre)
+        if nombre == "registrar_ats":
+            p = dict(argumentos.get("p") or {})
+            for hija in ("participantes", "epp", "riesgos", "actividad", "lugar_trabajo",
+                         "tema_charla", "expositor_charla", "hora_inicio", "hora_fin",
+                         "recomendaciones"):
+                p.pop(hija, None)
+            filas = self.insertar("ats_registros_diarios", [p], ["fecha", "brigada", "contrata"])
+            return filas[0]["id"]
+        raise KeyError(nombre)
+
+    # ----- Storage -----
+    def subir(self, bucket: str, path: str, contenido: bytes, upsert: bool) -> bool:
+        with self._lock:
+            if (bucket, path) in self.objetos and not upsert:
+                return False
+            self.objetos[(bucket, path)] = contenido
+            return True
+
+    def descargar(self, bucket: str, path: str):
+        with self._lock:
+            return self.objetos.get((bucket, path))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    # ----- utilidades -----
+    def _leer_cuerpo(self) -> bytes:
+        largo = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(largo) if largo else b""
+
+    def _responder(self, estado: int, cuerpo=None, cabeceras: dict = None, crudo: bytes = None):
+        datos = crudo if crudo is not None else json.dumps(cuerpo).encode("utf-8")
+        self.send_response(estado)
+        self.send_header(
+            "Content-Type",
+            "application/octet-stream" if crudo is not None else "application/json",
+        )
+        self.send_header("Content-Length", str(len(datos)))
+        for k, v in (cabeceras or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _error(self, estado: int, codigo: str, mensaje: str):
+        self._responder(estado, {"code": codigo, "message": mensaje, "details": None, "hint": None})
+
+    def _despachar(self, metodo: str):
+        servidor = self.server
+        servidor.contar(metodo, self.path)
+        if servidor.latencia:
+            time.sleep(servidor.latencia)
+
+        partes = urlsplit(self.path)
+        ruta = unquote(partes.path)
+        parametros = parse_qsl(partes.query, keep_blank_values=True)
+        try:
+            if ruta.startswith("/rest/v1/"):
+                self._rest(metodo, ruta[len("/rest/v1/"):], parametros)
+            elif ruta.startswith("/storage/v1/"):
+                self._storage(metodo, ruta[len("/storage/v1/"):])
+            else:
+                self._error(404, "404", "Ruta no soportada")
+        except Exception as e:
+            self._error(500, "XX000", f"Error en servidor falso: {e}")
+
+    def do_GET(self):
+        self._despachar("GET")
+
+    def do_HEAD(self):
+        self._despachar("HEAD")
+
+    def do_POST(self):
+        self._despachar("POST")
+
+    def do_PATCH(self):
+        self._despachar("PATCH")
+
+    # ----- PostgREST -----
+    def _rest(self, metodo: str, recurso: str, parametros: list):
+        base = self.server.base
+
+        if recurso.startswith("rpc/"):
+            cuerpo = json.loads(self._leer_cuerpo() or b"{}")
+            try:
+                self._responder(200, base.rpc(recurso[4:], cuerpo))
+            except KeyError:
+                self._error(404, "PGRST202", f"Could not find the function {recurso[4:]}")
+            return
+
+        if metodo in ("GET", "HEAD"):
+            faltante = base.columna_faltante(recurso, dict(parametros).get("select"))
+            if faltante:
+                self._error(400, "42703", f"column {recurso}.{faltante} does not exist")
+                return
+            filas = base.seleccionar(recurso, parametros)
+            cabeceras = {"Content-Range": f"0-{max(len(filas) - 1, 0)}/*"}
+            if "vnd.pgrst.object" in (self.headers.get("Accept") or ""):
+                if len(filas) != 1:
+                    self._error(406, "PGRST116", "JSON object requested, multiple (or no) rows returned")
+                    return
+                self._responder(200, filas[0], cabeceras)
+            else:
+                self._responder(200, filas, cabeceras)
+            return
+
+        if metodo == "POST":
+            cuerpo = json.loads(self._leer_cuerpo() or b"[]")
+            filas = cuerpo if isinstance(cuerpo, list) else [cuerpo]
+            conflicto = dict(parametros).get("on_conflict")
+            if "merge-duplicates" not in (self.headers.get("Prefer") or ""):
+                conflicto = None
+            resultado = base.insertar(recurso, filas, conflicto.split(",") if conflicto else None)
+            self._responder(201, resultado)
+            return
+
+        if metodo == "PATCH":
+            cambios = json.loads(self._leer_cuerpo() or b"{}")
+            self._responder(200, base.actualizar(recurso, parametros, cambios))
+            return
+
+        self._error(405, "405", "Método no soportado")
+
+    # ----- Storage -----
+    def _storage(self, metodo: str, recurso: str):
+        base = self.server.base
+
+        if metodo == "POST" and recurso.startswith("object/sign/"):
+            bucket = recurso[len("object/sign/"):]
+            cuerpo = json.loads(self._leer_cuerpo() or b"{}")
+            self._responder(200, [
+                {"path": p, "signedURL": f"/object/sign/{bucket}/{p}?token=falso", "error": None}
+                for p in cuerpo.get("paths", [])
+            ])
+            return
+
+        if not recurso.startswith("object/"):
+            self._responder(404, {"statusCode": "404", "error": "not_found", "message": "Ruta no soportada"})
+            return
+        bucket, _, path = recurso[len("object/"):].partition("/")
+
+        if metodo == "POST":
+            cuerpo = self._leer_cuerpo()
+            contenido = cuerpo
+            tipo = self.headers.get("Content-Type") or ""
+            if tipo.startswith("multipart/form-data"):
+                msg = email.message_from_bytes(
+                    f"Content-Type: {tipo}\r\n\r\n".encode() + cuerpo
+                )
+                for parte in msg.get_payload():
+                    if parte.get_param("name", header="content-disposition") == "file":
+                        contenido = parte.get_payload(decode=True)
+            upsert = (self.headers.get("x-upsert") or "").lower() == "true"
+            if not base.subir(bucket, path, contenido, upsert):
+                # Igual que Supabase Storage cuando el objeto ya existe
+                self._responder(400, {"statusCode": "409", "error": "Duplicate",
+                                      "message": "The resource already exists"})
+                return
+            self.server.bytes_subidos += len(contenido)
+            self._responder(200, {"Key": f"{bucket}/{path}", "Id": path})
+            return
+
+        if metodo in ("GET", "HEAD"):
+            contenido = base.descargar(bucket, path)
+            if contenido is None:
+                self._responder(400, {"statusCode": "404", "error": "not_found",
+                                      "message": "Object not found"})
+                return
+            self._responder(200, crudo=contenido)
+            return
+
+        self._responder(405, {"statusCode": "405", "error": "method", "message": "Método no soportado"})
+
+
+class SupabaseFalso(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, puerto: int = 0, latencia_ms: float = 0, base: BaseFalsa = None):
+        super().__init__(("127.0.0.1", puerto), _Handler)
+        self.base = base or BaseFalsa()
+        self.latencia = latencia_ms / 1000.0
+        self.bytes_subidos = 0
+        self.llamadas = {}
+        self._lock_llamadas = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def contar(self, metodo: str, path: str):
+        partes = urlsplit(path).path.split("/")
+        # /rest/v1/<tabla> ó /storage/v1/object/<bucket>
+        clave = f"{metodo} /{'/'.join(partes[1:4])}"
+        with self._lock_llamadas:
+            self.llamadas[clave] = self.llamadas.get(clave, 0) + 1
+
+    def iniciar(self) -> threading.Thread:
+        hilo = threading.Thread(target=self.serve_forever, name="supabase-falso", daemon=True)
+        hilo.start()
+        return hilo
@@ -1,20 +1,42 @@
-from flask import Flask, render_template, request, redirect, session, url_for
-from supabase import create_client, Client
+from flask import Flask, render_template, request, redirect, session, url_for, jsonify, Response, stream_with_context, send_file
+from supabase import Client
 from dotenv import load_dotenv
-from datetime import datetime
+from werkzeug.serving import WSGIRequestHandler
+from datetime import date, datetime
 import base64
+import logging
 import os
+import tempfile
+import uuid
 
-from generate_pdf import generar_pdf
+from generate_pdf import PDF_MAX_BYTES, generar_pdf, generar_pdf_con_limite, limpiar_temporales
 from email_sender import enviar_correo
+from http_cache import configurar_http_cache
+import bitacora
+import auth
+import cliente_supabase
+import estado_compartido
+import historial
+import cumplimiento
+import recordatorios
+import ats_detalle
+import catalogo
+import exportar
+import consolidado
+import ats_payload
+import resumen_correos
 
 # =========================
 # CONFIGURACIÓN BASE
 # =========================
 load_dotenv()
+bitacora.configurar_logging()
+log = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "supersecret")
+configurar_http_cache(app)
+bitacora.configurar_flask(app)
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
@@ -22,13 +44,26 @@ SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("Falta configurar SUPABASE_URL o SUPABASE_ANON_KEY en el .env")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Cliente compartido: pool, timeouts, reintentos y circuit breaker (ver cliente_supabase.py)
+supabase: Client = cliente_supabase.crear_cliente(SUPABASE_URL, SUPABASE_KEY)
 
 # Bucket donde se guardarán los PDFs
 PDF_BUCKET = os.getenv("SUPABASE_PDF_BUCKET", "ats_pdfs")
+# Bloques de técnico en el formulario (al abrir y como máximo por ATS)
+TECNICOS_INICIALES = 3
+MAX_PARTICIPANTES = int(os.getenv("ATS_MAX_PARTICIPANTES", "60"))
+# Cuánto se recuerda un envío del formulario para no procesarlo dos veces
+ENVIO_IDEMPOTENCIA_SEG = int(os.getenv("FORMULARIO_IDEMPOTENCIA_SEG", "86400"))
+# Reclamo mientras se procesa: si la instancia se cae a mitad, vence solo
+ENVIO_EN_PROCESO_SEG = int(os.getenv("FORMULARIO_EN_PROCESO_SEG", "600"))
 
 os.makedirs("temp", exist_ok=True)
 
+# Recordatorio de ATS faltantes (solo si RECORDATORIOS_EN_PROCESO=1)
+recordatorios.iniciar_programador(supabase)
+# Resumen de reportes por supervisor (solo si EMAIL_MODO=resumen)
+resumen_correos.iniciar_programador()
+
 
 def get_user():
     return session.get("usuario")
@@ -54,297 +89,671 @@ def login():
             error = "Ingrese usuario y clave."
             return render_template("login.html", error=error)
 
-        try:
-            resp = (
-                supabase.table("usuarios_brigadas")
-                .select("id,usuario,nombre,cargo,brigada,zona,contrata,dni,clave,activo")
-                .eq("usuario", usuario)
-                .eq("clave", clave)
-                .eq("activo", True)
-                .single()
-                .execute()
-            )
-            data = resp.data
-        except Exception:
-            data = None
+        resultado = auth.autenticar(supabase, usuario, clave, auth.ip_cliente(request))
 
-        if not data:
-            error = "Usuario o clave incorrectos."
-        else:
-            session["usuario"] = {
-                "id": data.get("id"),
-                "usuario": data.get("usuario"),
-                "nombre": data.get("nombre"),
-                "cargo": data.get("cargo"),
-                "brigada": data.get("brigada"),
-                "zona": data.get("zona"),
-                "contrata": data.get("contrata"),
-                "dni": data.get("dni"),
-            }
+        if resultado["ok"]:
+            session["usuario"] = resultado["usuario"]
             return redirect(url_for("formulario"))
 
+        if resultado["motivo"] == "limite":
+            error = f"Demasiados intentos. Espere {resultado['espera']} segundos e intente nuevamente."
+            return render_template("login.html", error=error), 429, {"Retry-After": str(resultado["espera"])}
+        if resultado["motivo"] == "error":
+            error = "No se pudo validar el usuario en este momento. Intente nuevamente."
+            return render_template("login.html", error=error), 503
+        error = "Usuario o clave incorrectos."
+
     return render_template("login.html", error=error)
 
 
 # =========================
 # FORMULARIO ATS
 # =========================
-@app.route("/formulario", methods=["GET", "POST"])
-def formulario():
-    user = get_user()
-    if not user:
-        return redirect(url_for("login"))
+def _render_formulario(user, tecnicos, charlas, cat, mensaje=None):
+    # Cada formulario mostrado lleva un id nuevo (clave de idempotencia del envío)
+    return render_template(
+        "formulario.html",
+        datos=user,
+        tecnicos=tecnicos,
+        charlas=charlas,
+        epp_opciones=cat.nombres_epp,
+        riesgos_opciones=cat.nombres_riesgos,
+        tecnicos_iniciales=TECNICOS_INICIALES,
+        max_participantes=MAX_PARTICIPANTES,
+        envio_id=uuid.uuid4().hex,
+        mensaje=mensaje,
+    )
 
-    # Técnicos activos
-    try:
-        tecnicos = (
-            supabase.table("usuarios_brigadas")
-            .select("usuario,nombre,cargo,brigada,zona,contrata,dni,activo")
-            .eq("activo", True)
-            .order("nombre")
-            .execute()
-        ).data or []
-    except Exception:
-        tecnicos = []
 
-    # Charlas programadas
+def _reclamar_envio(clave_envio: str):
+    """
+    None si este request procesa el envío; si no, el mensaje a mostrar
+    (el del envío original o "en proceso"). El reclamo dura
+    ENVIO_EN_PROCESO_SEG; al terminar se guarda el resultado por
+    ENVIO_IDEMPOTENCIA_SEG y si falla se libera (_liberar_envio).
+    """
     try:
-        charlas = (
-            supabase.table("charlas_programadas")
-            .select("item,tema,expositor")
-            .order("item")
-            .execute()
-        ).data or []
-    except Exception:
-        charlas = []
+        if estado_compartido.reclamar(clave_envio, ENVIO_EN_PROCESO_SEG, {"mensaje": None}):
+            return None
+        previo = estado_compartido.obtener(clave_envio) or {}
+    except estado_compartido.ErrorEstado as e:
+        log.warning("Estado compartido no disponible, el envío se procesa sin idempotencia: %s", e)
+        return None
+    return previo.get("mensaje") or "⏳ Este reporte ya se está procesando. Revise el historial en unos segundos."
 
-    if request.method == "POST":
-        os.makedirs("temp", exist_ok=True)
-        data = {}
 
-        # ===== Datos generales =====
-        data["fecha_dia"] = request.form.get("fecha_dia") or datetime.now().strftime(
-            "%Y-%m-%d"
+def _liberar_envio(clave_envio: str):
+    # El envío falló: el mismo formulario se puede volver a enviar
+    try:
+        estado_compartido.borrar(clave_envio)
+    except estado_compartido.ErrorEstado as e:
+        log.warning("No se pudo liberar el envío fallido: %s", e)
+
+
+def _procesar_envio(user, tecnicos, charlas, cat) -> str:
+    """
+    Genera, envía y registra el ATS del formulario recibido. Devuelve el
+    mensaje para el usuario.
+    """
+    os.makedirs("temp", exist_ok=True)
+    data = {}
+    # Nombre único de los temporales de este envío (hay envíos simultáneos)
+    sufijo = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+    # ===== Datos generales =====
+    data["fecha_dia"] = request.form.get("fecha_dia") or datetime.now().strftime(
+        "%Y-%m-%d"
+    )
+    data["hora_inicio"] = request.form.get("hora_inicio", "")
+    data["hora_fin"] = request.form.get("hora_fin", "")
+
+    trabajo = request.form.get("trabajo") or ""
+    trabajo_otro = request.form.get("trabajo_otro") or ""
+    if trabajo == "OTRO" and trabajo_otro.strip():
+        data["actividad"] = trabajo_otro.strip()
+    else:
+        data["actividad"] = trabajo
+
+    data["lugar_trabajo"] = request.form.get("lugar_trabajo", "")
+    data["recomendaciones"] = request.form.get("recomendaciones", "")
+    data["supervisor"] = request.form.get("supervisor", "SIN SUPERVISOR")
+
+    # Usuario que registra
+    data["usuario_registro"] = user.get("usuario")
+    data["brigada_usuario"] = user.get("brigada")
+    data["zona_usuario"] = user.get("zona")
+    data["contrata"] = user.get("contrata", "")
+    data["area"] = "MRD F.O. LIMA METROP."
+    data["brigada"] = user.get("brigada", "SIN BRIGADA")
+
+    # ===== Charla programada =====
+    charla_item = request.form.get("charla")
+    expositor_manual = request.form.get("expositor_charla", "")
+    charla_sel = next(
+        (c for c in charlas if str(c.get("item")) == str(charla_item)),
+        None,
+    )
+    if charla_sel:
+        data["tema_charla"] = charla_sel.get("tema", "")
+        data["expositor_charla"] = (
+            charla_sel.get("expositor", "") or expositor_manual
         )
-        data["hora_inicio"] = request.form.get("hora_inicio", "")
-        data["hora_fin"] = request.form.get("hora_fin", "")
+    else:
+        data["tema_charla"] = charla_item or ""
+        data["expositor_charla"] = expositor_manual
+
+    # ===== Riesgos =====
+    riesgos = request.form.getlist("riesgos[]")
+    riesgo_otro = (request.form.get("riesgos_otro") or "").strip()
+    if riesgo_otro:
+        riesgos.append(riesgo_otro)
+    data["riesgos"] = riesgos
+    # Peligros, controles y nivel de cada riesgo tal como estaban al enviar
+    data["riesgos_detalle"] = cat.resolver_riesgos(riesgos)
+    data["catalogo_version"] = cat.version
+
+    # ===== Técnicos (tec1..tecN) con firma y foto individual =====
+    # Los bloques se agregan / quitan en el formulario: los índices pueden
+    # tener huecos, el número de item se asigna en orden.
+    tecnicos_post = []
+    vistos = set()
+    tecnicos_por_usuario = {t.get("usuario"): t for t in tecnicos}
+    indices = sorted(
+        int(k[3:]) for k in request.form if k.startswith("tec") and k[3:].isdigit()
+    )
 
-        trabajo = request.form.get("trabajo") or ""
-        trabajo_otro = request.form.get("trabajo_otro") or ""
-        if trabajo == "OTRO" and trabajo_otro.strip():
-            data["actividad"] = trabajo_otro.strip()
-        else:
-            data["actividad"] = trabajo
-
-        data["lugar_trabajo"] = request.form.get("lugar_trabajo", "")
-        data["recomendaciones"] = request.form.get("recomendaciones", "")
-        data["supervisor"] = request.form.get("supervisor", "SIN SUPERVISOR")
-
-        # Usuario que registra
-        data["usuario_registro"] = user.get("usuario")
-        data["brigada_usuario"] = user.get("brigada")
-        data["zona_usuario"] = user.get("zona")
-        data["contrata"] = user.get("contrata", "")
-        data["area"] = "MRD F.O. LIMA METROP."
-        data["brigada"] = user.get("brigada", "SIN BRIGADA")
-
-        # ===== Charla programada =====
-        charla_item = request.form.get("charla")
-        expositor_manual = request.form.get("expositor_charla", "")
-        charla_sel = next(
-            (c for c in charlas if str(c.get("item")) == str(charla_item)),
-            None,
-        )
-        if charla_sel:
-            data["tema_charla"] = charla_sel.get("tema", "")
-            data["expositor_charla"] = (
-                charla_sel.get("expositor", "") or expositor_manual
-            )
-        else:
-            data["tema_charla"] = charla_item or ""
-            data["expositor_charla"] = expositor_manual
-
-        # ===== Riesgos =====
-        riesgos = request.form.getlist("riesgos[]")
-        riesgo_otro = (request.form.get("riesgos_otro") or "").strip()
-        if riesgo_otro:
-            riesgos.append(riesgo_otro)
-        data["riesgos"] = riesgos
-
-        # ===== Técnicos (1..3) con firma y foto individual =====
-        tecnicos_post = []
-
-        for i in (1, 2, 3):
-            key = request.form.get(f"tec{i}")
-            if not key:
-                continue
-
-            tec = next((t for t in tecnicos if t.get("usuario") == key), None)
-            if not tec:
-                continue
-
-            fila = {
-                "item": i,
-                "usuario": tec.get("usuario", ""),
-                "nombre": tec.get("nombre", ""),
-                "cargo": tec.get("cargo", ""),
-                "dni": tec.get("dni", ""),
-                "brigada": tec.get("brigada", ""),
-                "zona": tec.get("zona", ""),
-                "contrata": tec.get("contrata", ""),
-                "epp": request.form.getlist(f"epp{i}[]"),
-                "obs": (request.form.get(f"obs{i}", "") or "").strip(),
-            }
-
-            # Firma desde canvas
-            firma_b64 = request.form.get(f"firma{i}")
-            fila["firma_path"] = None
-            if firma_b64 and "base64" in firma_b64:
-                try:
-                    raw = firma_b64.split(",")[-1]
-                    firma_path = os.path.join(
-                        "temp",
-                        f"firma_tec{i}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png",
-                    )
-                    with open(firma_path, "wb") as out:
-                        out.write(base64.b64decode(raw))
-                    fila["firma_path"] = firma_path
-                except Exception as e:
-                    print(f"Error guardando firma técnico {i}:", e)
-
-            # Foto individual técnico
-            foto_file = request.files.get(f"foto_tec{i}")
-            fila["foto_path"] = None
-            if foto_file and foto_file.filename:
-                try:
-                    foto_path = os.path.join(
-                        "temp",
-                        f"foto_tec{i}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg",
-                    )
-                    foto_file.save(foto_path)
-                    fila["foto_path"] = foto_path
-                except Exception as e:
-                    print(f"Error guardando foto técnico {i}:", e)
-
-            tecnicos_post.append(fila)
-
-        data["tecnicos"] = tecnicos_post
-
-        # ===== Foto general opcional =====
-        foto_general = request.files.get("foto_epp")
-        data["foto_path"] = None
-        if foto_general and foto_general.filename:
+    for i in indices[:MAX_PARTICIPANTES]:
+        key = request.form.get(f"tec{i}")
+        if not key:
+            continue
+
+        tec = tecnicos_por_usuario.get(key)
+        if not tec or key in vistos:
+            continue
+        vistos.add(key)
+
+        fila = {
+            "item": len(tecnicos_post) + 1,
+            "usuario": tec.get("usuario", ""),
+            "nombre": tec.get("nombre", ""),
+            "cargo": tec.get("cargo", ""),
+            "dni": tec.get("dni", ""),
+            "brigada": tec.get("brigada", ""),
+            "zona": tec.get("zona", ""),
+            "contrata": tec.get("contrata", ""),
+            "epp": request.form.getlist(f"epp{i}[]"),
+            "obs": (request.form.get(f"obs{i}", "") or "").strip(),
+        }
+
+        # Firma desde canvas
+        firma_b64 = request.form.get(f"firma{i}")
+        fila["firma_path"] = None
+        if firma_b64 and "base64" in firma_b64:
+            try:
+                raw = firma_b64.split(",")[-1]
+                firma_path = os.path.join(
+                    "temp",
+                    f"firma_tec{i}_{sufijo}.png",
+                )
+                with open(firma_path, "wb") as out:
+                    out.write(base64.b64decode(raw))
+                fila["firma_path"] = firma_path
+            except Exception as e:
+                log.warning("Error guardando firma técnico %s: %s", i, e)
+
+        # Foto individual técnico
+        foto_file = request.files.get(f"foto_tec{i}")
+        fila["foto_path"] = None
+        if foto_file and foto_file.filename:
             try:
                 foto_path = os.path.join(
                     "temp",
-                    f"foto_general_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg",
+                    f"foto_tec{i}_{sufijo}.jpg",
                 )
-                foto_general.save(foto_path)
-                data["foto_path"] = foto_path
+                foto_file.save(foto_path)
+                fila["foto_path"] = foto_path
             except Exception as e:
-                print("Error guardando foto general:", e)
+                log.warning("Error guardando foto técnico %s: %s", i, e)
+
+        tecnicos_post.append(fila)
 
-        # ===== Generar PDF =====
-        pdf_path = generar_pdf(data)
-        pdf_name = os.path.basename(pdf_path)
+    data["tecnicos"] = tecnicos_post
 
-        # ===== Enviar correo con PDF =====
-        email_ok = False
+    # ===== Foto general opcional =====
+    foto_general = request.files.get("foto_epp")
+    data["foto_path"] = None
+    if foto_general and foto_general.filename:
+        try:
+            foto_path = os.path.join(
+                "temp",
+                f"foto_general_{sufijo}.jpg",
+            )
+            foto_general.save(foto_path)
+            data["foto_path"] = foto_path
+        except Exception as e:
+            log.warning("Error guardando foto general: %s", e)
+
+    # ===== Generar PDF =====
+    # En modo payload las imágenes temporales se suben después como blobs.
+    # El PDF también es temporal: se borra después de subirlo o enviarlo
+    pdf_path = os.path.join("temp", f"ATS_{sufijo}.pdf")
+    with bitacora.etapa("pdf", tecnicos=len(tecnicos_post)) as info:
+        if PDF_MAX_BYTES:
+            resultado_pdf = generar_pdf_con_limite(
+                data, PDF_MAX_BYTES, destino=pdf_path, limpiar=not ats_payload.modo_payload(), catalogo=cat
+            )
+            info.update(bytes=resultado_pdf["bytes"], nivel_fotos=resultado_pdf["nivel"])
+        else:
+            generar_pdf(data, destino=pdf_path, limpiar=not ats_payload.modo_payload(), catalogo=cat)
+            info["bytes"] = os.path.getsize(pdf_path)
+    pdf_name = os.path.basename(pdf_path)
+
+    # ===== Enviar correo con PDF =====
+    # En modo resumen el reporte se encola después de registrarlo (ver abajo)
+    email_ok = False
+    supervisor = data.get("supervisor", "SIN SUPERVISOR")
+    if not resumen_correos.modo_resumen():
         try:
-            supervisor = data.get("supervisor", "SIN SUPERVISOR")
             fecha_actual = datetime.now().strftime("%Y-%m-%d")
             brigada_usuario = (user.get("brigada") or "SIN BRIGADA").upper()
             subject = f"Reporte ATS – {supervisor} – {brigada_usuario} – {fecha_actual}"
-            email_ok = enviar_correo(pdf_path, supervisor, subject)
+            with bitacora.etapa("correo") as info:
+                email_ok = enviar_correo(pdf_path, supervisor, subject)
+                info["ok"] = email_ok
         except Exception as e:
-            print("⚠️ Error al enviar correo (controlado):", e)
+            log.warning("Error al enviar correo (controlado): %s", e)
             email_ok = False
 
-        # ===== Subir PDF a Supabase Storage =====
-        pdf_storage_path = None
-        pdf_public_url = None
+    # ===== Modo payload: guardar ATS normalizado + imágenes en vez del PDF =====
+    payload_path = None
+    if ats_payload.modo_payload():
         try:
-            if os.path.isfile(pdf_path):
-                with open(pdf_path, "rb") as f:
-                    file_bytes = f.read()
+            fecha_reg = data.get("fecha_dia") or datetime.now().strftime("%Y-%m-%d")
+            brigada_reg = (data.get("brigada") or "SIN_BRIGADA").replace(" ", "_")
+            with bitacora.etapa("payload"):
+                payload_path = ats_payload.guardar_payload(
+                    supabase, PDF_BUCKET, data, f"ats/{fecha_reg}/{brigada_reg}/{pdf_name}",
+                    catalogo=cat, fotos=resultado_pdf.get("fotos") if PDF_MAX_BYTES else None,
+                )
+        except Exception as e:
+            log.warning("Error al subir payload ATS a Supabase Storage (se sube el PDF): %s", e)
+        limpiar_temporales(data)
 
-                fecha_reg = data.get("fecha_dia") or datetime.now().strftime("%Y-%m-%d")
-                brigada_reg = (data.get("brigada") or "SIN_BRIGADA").replace(" ", "_")
+    # ===== Subir PDF a Supabase Storage =====
+    pdf_storage_path = None
+    pdf_public_url = None
+    try:
+        if payload_path:
+            pass  # El PDF se regenera bajo demanda desde el payload
+        elif os.path.isfile(pdf_path):
+            with open(pdf_path, "rb") as f:
+                file_bytes = f.read()
+
+            fecha_reg = data.get("fecha_dia") or datetime.now().strftime("%Y-%m-%d")
+            brigada_reg = (data.get("brigada") or "SIN_BRIGADA").replace(" ", "_")
 
-                # Ruta dentro del bucket
-                pdf_storage_path = f"ats/{fecha_reg}/{brigada_reg}/{pdf_name}"
+            # Ruta dentro del bucket
+            pdf_storage_path = f"ats/{fecha_reg}/{brigada_reg}/{pdf_name}"
 
-                # Subir al bucket configurado con content-type correcto
+            # Subir al bucket configurado con content-type correcto
+            with bitacora.etapa("storage", bytes=len(file_bytes)):
                 supabase.storage.from_(PDF_BUCKET).upload(
                     pdf_storage_path,
                     file_bytes,
                     file_options={"content-type": "application/pdf"},
                 )
 
-                # Construir URL pública (el bucket debe ser PUBLIC)
-                base_url = SUPABASE_URL.rstrip("/")
-                pdf_public_url = f"{base_url}/storage/v1/object/public/{PDF_BUCKET}/{pdf_storage_path}"
-            else:
-                print("⚠️ PDF no encontrado para subir a Supabase Storage:", pdf_path)
-        except Exception as e:
-            print("⚠️ Error al subir PDF a Supabase Storage:", e)
-            pdf_storage_path = None
-            pdf_public_url = None
+            # Construir URL pública (el bucket debe ser PUBLIC)
+            base_url = SUPABASE_URL.rstrip("/")
+            pdf_public_url = f"{base_url}/storage/v1/object/public/{PDF_BUCKET}/{pdf_storage_path}"
+        else:
+            log.warning("PDF no encontrado para subir a Supabase Storage", extra={"pdf": pdf_path})
+    except Exception as e:
+        log.warning("Error al subir PDF a Supabase Storage: %s", e)
+        pdf_storage_path = None
+        pdf_public_url = None
 
-        # ===== Registrar cumplimiento diario en ats_registros_diarios =====
+    # ===== Registrar cumplimiento diario en ats_registros_diarios =====
+    registro = None
+    registro_id = None
+    try:
+        fecha_reg = data["fecha_dia"]
+        brigada_reg = data.get("brigada_usuario")
+        zona_reg = data.get("zona_usuario")
+        contrata_reg = data.get("contrata")
+        usuario_reg = data.get("usuario_registro")
+        supervisor_reg = data.get("supervisor")
+        tecnicos_count = len(tecnicos_post)
+
+        registro = {
+            "fecha": fecha_reg,
+            "brigada": brigada_reg,
+            "zona": zona_reg,
+            "contrata": contrata_reg,
+            "usuario_registro": usuario_reg,
+            "supervisor": supervisor_reg,
+            "tecnicos_count": tecnicos_count,
+            "completado": True,
+            "pdf_path": pdf_storage_path,
+            "pdf_url": pdf_public_url,
+        }
+        if payload_path:
+            registro["payload_path"] = payload_path
+
+        with bitacora.etapa("registro"):
+            registro_id = ats_detalle.guardar_registro(supabase, registro, data, cat)
+        historial.invalidar_cache()
+        cumplimiento.registrar(registro)
+    except Exception as e:
+        log.warning("Error registrando ATS diario en Supabase: %s", e)
+
+    # ===== Modo resumen: encolar para el correo del supervisor =====
+    # El PDF local se adjunta al enviar el resumen y se borra ahí
+    encolado = False
+    if resumen_correos.modo_resumen() and registro:
+        enlace = pdf_public_url
+        if not enlace and payload_path and registro_id:
+            enlace = url_for("pdf_ats", registro_id=registro_id, _external=True)
         try:
-            fecha_reg = data["fecha_dia"]
-            brigada_reg = data.get("brigada_usuario")
-            zona_reg = data.get("zona_usuario")
-            contrata_reg = data.get("contrata")
-            usuario_reg = data.get("usuario_registro")
-            supervisor_reg = data.get("supervisor")
-            tecnicos_count = len(tecnicos_post)
-
-            registro = {
-                "fecha": fecha_reg,
-                "brigada": brigada_reg,
-                "zona": zona_reg,
-                "contrata": contrata_reg,
-                "usuario_registro": usuario_reg,
-                "supervisor": supervisor_reg,
-                "tecnicos_count": tecnicos_count,
-                "completado": True,
-                "pdf_path": pdf_storage_path,
-                "pdf_url": pdf_public_url,
-            }
-
-            supabase.table("ats_registros_diarios").upsert(
-                registro,
-                on_conflict="fecha,brigada,contrata",
-            ).execute()
+            resumen_correos.encolar(
+                supervisor,
+                dict(registro, enlace=enlace, pdf_path=pdf_path),
+            )
+            email_ok = encolado = True
         except Exception as e:
-            print("⚠️ Error registrando ATS diario en Supabase:", e)
+            log.warning("Error encolando reporte para el resumen (controlado): %s", e)
 
-        # ===== Mensaje en la plataforma =====
-        if email_ok:
-            mensaje = "✅ Reporte ATS generado, enviado por correo y registrado correctamente."
-        else:
-            mensaje = "⚠️ Reporte ATS generado y registrado en la plataforma. No se pudo enviar el correo automático (revisar configuración SMTP)."
-
-        return render_template(
-            "formulario.html",
-            datos=user,
-            tecnicos=tecnicos,
-            charlas=charlas,
-            mensaje=mensaje,
-        )
+    if not encolado:
+        _borrar_pdf_local(pdf_path)
+
+    # ===== Mensaje en la plataforma =====
+    if email_ok and resumen_correos.modo_resumen():
+        mensaje = "✅ Reporte ATS generado y registrado correctamente. Se enviará al supervisor en el resumen de correo."
+    elif email_ok:
+        mensaje = "✅ Reporte ATS generado, enviado por correo y registrado correctamente."
+    else:
+        mensaje = "⚠️ Reporte ATS generado y registrado en la plataforma. No se pudo enviar el correo automático (revisar configuración SMTP)."
+
+    return mensaje
+
+
+def _borrar_pdf_local(pdf_path: str):
+    try:
+        os.remove(pdf_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        log.warning("No se pudo borrar el PDF temporal: %s", e, extra={"pdf": pdf_path})
+
+
+@app.route("/formulario", methods=["GET", "POST"])
+def formulario():
+    user = get_user()
+    if not user:
+        return redirect(url_for("login"))
+
+    # Técnicos activos (cacheados; si Supabase falla se usa la última copia)
+    try:
+        tecnicos = cliente_supabase.referencia("tecnicos", lambda: (
+            supabase.table("usuarios_brigadas")
+            .select("usuario,nombre,cargo,brigada,zona,contrata,dni,activo")
+            .eq("activo", True)
+            .order("nombre")
+            .execute()
+        ).data or [])
+    except Exception as e:
+        log.warning("No se pudo cargar la lista de técnicos: %s", e)
+        tecnicos = []
+
+    # Catálogo de EPP y riesgos (cacheado, con versión)
+    cat = catalogo.obtener(supabase)
+
+    # Charlas programadas
+    try:
+        charlas = cliente_supabase.referencia("charlas", lambda: (
+            supabase.table("charlas_programadas")
+            .select("item,tema,expositor")
+            .order("item")
+            .execute()
+        ).data or [])
+    except Exception as e:
+        log.warning("No se pudieron cargar las charlas programadas: %s", e)
+        charlas = []
+
+    if request.method == "POST":
+        # ===== Idempotencia =====
+        # Doble clic, reintento del navegador o el mismo envío llegando a
+        # otra instancia: se procesa una sola vez
+        envio_id = (request.form.get("envio_id") or "").strip()[:64]
+        clave_envio = f"formulario:envio:{envio_id}"
+        if envio_id:
+            repetido = _reclamar_envio(clave_envio)
+            if repetido:
+                log.info("Envío de formulario repetido", extra={"envio_id": envio_id})
+                return _render_formulario(user, tecnicos, charlas, cat, repetido)
+
+        try:
+            mensaje = _procesar_envio(user, tecnicos, charlas, cat)
+        except Exception:
+            # Sin liberar el envío, reenviar el mismo formulario mostraría
+            # "en proceso" hasta que venza el reclamo
+            if envio_id:
+                _liberar_envio(clave_envio)
+            raise
+
+        if envio_id:
+            try:
+                estado_compartido.guardar(clave_envio, {"mensaje": mensaje}, ENVIO_IDEMPOTENCIA_SEG)
+            except estado_compartido.ErrorEstado as e:
+                log.warning("No se pudo guardar el resultado del envío: %s", e)
+
+        return _render_formulario(user, tecnicos, charlas, cat, mensaje)
 
     # GET
+    return _render_formulario(user, tecnicos, charlas, cat)
+
+
+# =========================
+# HISTORIAL ATS
+# =========================
+def _buscar_historial():
+    filtros = historial.leer_filtros(request.args)
+    resultado = historial.buscar_registros(
+        supabase,
+        filtros,
+        cursor=request.args.get("cursor"),
+        limite=request.args.get("limite", type=int) or historial.LIMITE_DEFECTO,
+    )
+    items = historial.adjuntar_urls(supabase, PDF_BUCKET, resultado["items"])
+    for r in items:
+        # Reportes guardados como payload: el PDF se genera al abrir el enlace
+        if r.get("payload_path"):
+            r["pdf_url"] = url_for("pdf_ats", registro_id=r["id"])
+    return filtros, items, resultado["siguiente"]
+
+
+@app.route("/historial")
+def historial_ats():
+    user = get_user()
+    if not user:
+        return redirect(url_for("login"))
+
+    error = None
+    try:
+        filtros, items, siguiente = _buscar_historial()
+    except Exception as e:
+        log.warning("Error consultando historial ATS: %s", e)
+        filtros, items, siguiente = historial.leer_filtros(request.args), [], None
+        error = "No se pudo consultar el historial. Intente nuevamente."
+
     return render_template(
-        "formulario.html",
+        "historial.html",
         datos=user,
-        tecnicos=tecnicos,
-        charlas=charlas,
-        mensaje=None,
+        filtros=filtros,
+        registros=items,
+        siguiente=siguiente,
+        error=error,
     )
 
 
+@app.route("/api/ats")
+def api_ats():
+    if not get_user():
+        return jsonify({"error": "No autenticado"}), 401
+
+    try:
+        filtros, items, siguiente = _buscar_historial()
+    except Exception as e:
+        log.warning("Error consultando historial ATS (API): %s", e)
+        return jsonify({"error": "Error consultando historial"}), 502
+
+    return jsonify({"filtros": filtros, "items": items, "siguiente": siguiente})
+
+
+# =========================
+# PDF BAJO DEMANDA
+# =========================
+@app.route("/ats/<int:registro_id>/pdf")
+def pdf_ats(registro_id):
+    if not get_user():
+        return redirect(url_for("login"))
+
+    try:
+        filas = historial.consultar_registros(
+            supabase, historial.COLUMNAS, lambda q: q.eq("id", registro_id).limit(1)
+        )
+    except Exception as e:
+        log.warning("Error consultando registro ATS para PDF: %s", e)
+        return "No se pudo consultar el reporte.", 502
+
+    if not filas:
+        return "Reporte no encontrado.", 404
+    registro = filas[0]
+
+    if not registro.get("payload_path"):
+        # Reporte guardado como PDF terminado: URL firmada del bucket
+        urls = historial.urls_firmadas(supabase, PDF_BUCKET, [registro.get("pdf_path")])
+        url = urls.get(registro.get("pdf_path"))
+        if not url:
+            return "El reporte no tiene PDF almacenado.", 404
+        return redirect(url)
+
+    # El ETag sale de la ruta del payload: si el navegador ya tiene esta
+    # versión se responde 304 sin descargar ni renderizar nada
+    etag = ats_payload.etag_payload(registro["payload_path"])
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+    else:
+        try:
+            pdf = ats_payload.obtener_pdf(supabase, PDF_BUCKET, registro["payload_path"])
+        except Exception as e:
+            log.warning("Error regenerando PDF desde payload: %s", e)
+            return "No se pudo generar el PDF.", 502
+
+        nombre = f"ATS_{registro.get('fecha')}_{(registro.get('brigada') or 'SIN_BRIGADA').replace(' ', '_')}.pdf"
+        resp = Response(
+            pdf,
+            mimetype="application/pdf",
+            headers={"Content-Disposition": f'inline; filename="{nombre}"'},
+        )
+    resp.set_etag(etag)
+    resp.cache_control.private = True
+    resp.cache_control.max_age = 86400
+    return resp.make_conditional(request)
+
+
+# =========================
+# EXPORTACIÓN CSV / PARQUET
+# =========================
+@app.route("/exportar")
+def exportar_ats():
+    if not get_user():
+        return redirect(url_for("login"))
+
+    formato = (request.args.get("formato") or "csv").lower()
+    if not exportar.formato_disponible(formato):
+        return jsonify({"error": f"Formato no disponible: {formato}"}), 400
+
+    filtros = historial.leer_filtros(request.args)
+    mimetype, _ = exportar.FORMATOS[formato]
+    nombre = exportar.nombre_archivo(filtros, formato)
+
+    return Response(
+        stream_with_context(exportar.generar_exportacion(supabase, filtros, formato)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+    )
+
+
+# =========================
+# CONSOLIDADO DIARIO (PDF)
+# =========================
+@app.route("/consolidado")
+def consolidado_pdf():
+    if not get_user():
+        return redirect(url_for("login"))
+
+    fecha = (request.args.get("fecha") or date.today().isoformat()).strip()
+    try:
+        date.fromisoformat(fecha)
+    except ValueError:
+        return "Fecha inválida (use YYYY-MM-DD).", 400
+    zona = (request.args.get("zona") or "").strip() or None
+    supervisor = (request.args.get("supervisor") or "").strip() or None
+
+    # El consolidado se arma dentro del request: con más reportes que el
+    # tope web se pide filtrar o generarlo por consola (consolidado.py)
+    tope = consolidado.MAX_REPORTES_WEB
+    try:
+        registros = consolidado.registros_del_dia(
+            supabase, fecha, zona, supervisor, max_reportes=tope + 1
+        )
+    except Exception as e:
+        log.warning("Error consultando registros para el consolidado ATS: %s", e)
+        return "No se pudo generar el consolidado.", 502
+    if not registros:
+        return "No hay ATS registrados para ese día y filtro.", 404
+    if len(registros) > tope:
+        return (f"El consolidado supera los {tope} reportes: filtre por zona o supervisor, "
+                f"o genérelo con python consolidado.py --fecha {fecha}."), 400
+
+    # Se escribe a un temporal en disco y se envía desde ahí
+    salida = tempfile.TemporaryFile(dir="temp")
+    try:
+        with bitacora.etapa("consolidado") as info:
+            resultado = consolidado.generar_consolidado(
+                supabase, PDF_BUCKET, fecha, salida, zona=zona, supervisor=supervisor,
+                registros=registros,
+            )
+            info.update(resultado)
+    except Exception as e:
+        salida.close()
+        log.warning("Error generando consolidado ATS: %s", e)
+        return "No se pudo generar el consolidado.", 502
+
+    salida.seek(0)
+    return send_file(
+        salida,
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=consolidado.nombre_archivo(fecha, zona, supervisor),
+    )
+
+
+# =========================
+# DASHBOARD DE CUMPLIMIENTO
+# =========================
+@app.route("/dashboard")
+def dashboard():
+    user = get_user()
+    if not user:
+        return redirect(url_for("login"))
+
+    error = None
+    resumen = None
+    try:
+        resumen = cumplimiento.resumen_cumplimiento(
+            supabase, request.args.get("desde"), request.args.get("hasta")
+        )
+    except ValueError as e:
+        error = str(e)
+    except Exception as e:
+        log.warning("Error calculando cumplimiento ATS: %s", e)
+        error = "No se pudo calcular el cumplimiento. Intente nuevamente."
+
+    return render_template("dashboard.html", datos=user, resumen=resumen, error=error)
+
+
+@app.route("/api/cumplimiento")
+def api_cumplimiento():
+    if not get_user():
+        return jsonify({"error": "No autenticado"}), 401
+
+    try:
+        resumen = cumplimiento.resumen_cumplimiento(
+            supabase, request.args.get("desde"), request.args.get("hasta")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        log.warning("Error calculando cumplimiento ATS (API): %s", e)
+        return jsonify({"error": "Error calculando cumplimiento"}), 502
+
+    return jsonify(resumen)
+
+
+# =========================
+# SALUD
+# =========================
+@app.route("/salud")
+def salud():
+    # Siempre 200: con Supabase caído la app sigue viva (y sirve datos cacheados)
+    return jsonify({
+        "supabase": cliente_supabase.estado(),
+        "estado_compartido": estado_compartido.estado(),
+    })
+
+
 # =========================
 # LOGOUT
 # =========================
@@ -357,5 +766,11 @@ def logout():
 # =========================
 # MAIN LOCAL
 # =========================
+class _ManejadorHTTP11(WSGIRequestHandler):
+    # Las descargas por streaming (exportar) van chunked: si fallan a mitad
+    # de camino el cliente ve la descarga cortada, no un archivo truncado
+    protocol_version = "HTTP/1.1"
+
+
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    app.run(debug=True, port=5000, request_handler=_ManejadorHTTP11)
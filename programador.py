@@ -0,0 +1,65 @@
+"""
+Ejecución de tareas a horas fijas del día (ej. "09:30,11:00") en un hilo.
+Lo usan los recordatorios de ATS faltantes y el resumen diario de correos.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import bitacora
+
+log = logging.getLogger(__name__)
+
+
+def leer_horas(valor: str, variable: str = "") -> list:
+    """
+    Convierte "09:30, 11:00" en una lista ordenada de `time`.
+    """
+    horas = []
+    for parte in (valor or "").split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        try:
+            horas.append(datetime.strptime(parte, "%H:%M").time())
+        except ValueError:
+            log.warning("Hora inválida en %s: '%s'", variable or "configuración", parte)
+    return sorted(horas)
+
+
+def proximo_corte(horas: list, ahora: datetime) -> datetime:
+    for h in horas:
+        candidato = datetime.combine(ahora.date(), h)
+        if candidato > ahora:
+            return candidato
+    return datetime.combine(ahora.date() + timedelta(days=1), horas[0])
+
+
+def ciclo(nombre: str, horas: list, tarea, detener: threading.Event = None):
+    """
+    Espera cada hora de `horas` y llama `tarea(corte: datetime)`.
+    Los errores de la tarea se registran y el ciclo sigue.
+    """
+    if not horas:
+        log.warning("No hay horas configuradas para '%s'.", nombre)
+        return
+    detener = detener or threading.Event()
+
+    while not detener.is_set():
+        siguiente = proximo_corte(horas, datetime.now())
+        espera = (siguiente - datetime.now()).total_seconds()
+        if detener.wait(max(espera, 0)):
+            break
+        with bitacora.contexto(f"{nombre}-{siguiente:%Y%m%d-%H%M}"):
+            try:
+                tarea(siguiente)
+            except Exception:
+                log.exception("Error en tarea programada '%s' (%s)", nombre, f"{siguiente:%H:%M}")
+
+
+def iniciar_en_hilo(nombre: str, horas: list, tarea) -> threading.Thread:
+    hilo = threading.Thread(
+        target=ciclo, args=(nombre, horas, tarea), name=nombre, daemon=True
+    )
+    hilo.start()
+    return hilo
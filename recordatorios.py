@@ -0,0 +1,241 @@
+"""
+Barrido de ATS faltantes: busca las brigadas activas sin registro del día
+y envía UN correo por supervisor con todas sus brigadas pendientes,
+usando una sola sesión SMTP para todo el barrido.
+
+Uso por consola:
+    python recordatorios.py                      # hoy, una vez
+    python recordatorios.py --fecha 2025-11-09   # otra fecha
+    python recordatorios.py --solo-listar        # no envía correos
+    python recordatorios.py --programar          # corre en las horas de RECORDATORIOS_HORAS
+
+Dentro de la app se activa con RECORDATORIOS_EN_PROCESO=1. Cada corte se
+reclama en el estado compartido: con varias instancias (y ESTADO_BACKEND=redis)
+solo una envía los recordatorios.
+"""
+import argparse
+import logging
+import os
+import threading
+from datetime import date, timedelta
+
+from ats_detalle import CODIGOS_SIN_FUNCION
+from email_sender import SesionSMTP, enviar_recordatorio_faltantes
+import bitacora
+import cliente_supabase
+import cumplimiento
+import estado_compartido
+import programador
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+# Horas de corte, ej. "09:30,11:00"
+HORAS_CORTE = os.getenv("RECORDATORIOS_HORAS", "09:30")
+# Función SQL (ver sql/002_ats_brigadas_sin_registro.sql)
+RPC_FALTANTES = "ats_brigadas_sin_registro"
+# Días hacia atrás para deducir el supervisor habitual de una brigada (modo sin RPC)
+DIAS_HISTORIA_SUPERVISOR = 14
+# Cuánto se recuerda que un corte ya se procesó
+CORTE_PROCESADO_SEG = 2 * 24 * 3600
+
+log = logging.getLogger(__name__)
+
+
+def leer_horas_corte(valor: str = None) -> list:
+    return programador.leer_horas(
+        valor if valor is not None else HORAS_CORTE, "RECORDATORIOS_HORAS"
+    )
+
+
+# =========================
+# BRIGADAS SIN ATS
+# =========================
+def _faltantes_sin_rpc(client, fecha: str) -> list:
+    """
+    Alternativa si la función SQL no está instalada:
+    padrón activo menos los registros del día (diferencia en memoria).
+    """
+    padron = cumplimiento.obtener_padron(client)
+    desde = (date.fromisoformat(fecha) - timedelta(days=DIAS_HISTORIA_SUPERVISOR)).isoformat()
+    por_dia = cumplimiento.consultar_registros(client, desde, fecha)
+
+    supervisor_de = {}
+    for dia in sorted(por_dia):
+        for clave, reg in por_dia[dia].items():
+            supervisor_de[clave] = reg["supervisor"]
+
+    hechos = por_dia.get(fecha, {})
+    return [
+        {
+            "brigada": brigada,
+            "zona": zona,
+            "contrata": contrata,
+            "supervisor": supervisor_de.get((brigada, contrata), cumplimiento.SIN_SUPERVISOR),
+        }
+        for (brigada, contrata), zona in sorted(padron.items())
+        if (brigada, contrata) not in hechos
+    ]
+
+
+def brigadas_sin_ats(client, fecha: str) -> list:
+    """
+    Brigadas activas de usuarios_brigadas sin fila en ats_registros_diarios
+    para `fecha`, con su supervisor habitual. Una sola consulta (RPC).
+    Solo si la función no está instalada se calcula en memoria; cualquier
+    otro error (timeout, circuito abierto, 5xx) se propaga.
+    """
+    try:
+        resp = client.rpc(RPC_FALTANTES, {"p_fecha": fecha}).execute()
+        return resp.data or []
+    except Exception as e:
+        if getattr(e, "code", None) not in CODIGOS_SIN_FUNCION:
+            raise
+        log.info("Falta la función %s (ver sql/002_ats_brigadas_sin_registro.sql). Se calcula en memoria.",
+                 RPC_FALTANTES)
+        return _faltantes_sin_rpc(client, fecha)
+
+
+def agrupar_por_supervisor(faltantes: list) -> dict:
+    grupos = {}
+    for f in faltantes:
+        supervisor = f.get("supervisor") or cumplimiento.SIN_SUPERVISOR
+        grupos.setdefault(supervisor, []).append(f)
+    return grupos
+
+
+# =========================
+# BARRIDO
+# =========================
+def _liberar_corte(clave: str):
+    # No se envió nada: el corte se puede volver a intentar
+    try:
+        estado_compartido.borrar(clave)
+    except estado_compartido.ErrorEstado as e:
+        log.warning("No se pudo liberar el corte de recordatorios: %s", e)
+
+
+def ejecutar_barrido(client, fecha: str = None, corte: str = None, enviar: bool = True) -> dict:
+    """
+    Ejecuta un barrido. Si `corte` ya lo procesó para la fecha este u otro
+    proceso, no vuelve a enviar. Si falla antes de enviar algo (consulta o
+    sesión SMTP), el corte se libera para reintentarlo.
+    Devuelve un resumen del resultado.
+    """
+    fecha = fecha or date.today().isoformat()
+    clave_corte = f"recordatorios:corte:{fecha}:{corte}" if corte else None
+
+    if corte:
+        try:
+            propio = estado_compartido.reclamar(clave_corte, CORTE_PROCESADO_SEG)
+        except estado_compartido.ErrorEstado as e:
+            # Mejor un recordatorio repetido que ninguno
+            log.warning("Estado compartido no disponible, se envía el corte %s igual: %s", corte, e)
+            propio = True
+        if not propio:
+            return {"fecha": fecha, "corte": corte, "omitido": True}
+
+    try:
+        faltantes = brigadas_sin_ats(client, fecha)
+    except Exception:
+        if clave_corte:
+            _liberar_corte(clave_corte)
+        raise
+    grupos = agrupar_por_supervisor(faltantes)
+    resultado = {
+        "fecha": fecha,
+        "corte": corte,
+        "faltantes": len(faltantes),
+        "supervisores": len(grupos),
+        "enviados": 0,
+        "errores": 0,
+    }
+
+    if not enviar or not grupos:
+        return resultado
+
+    abierta = False
+    try:
+        with SesionSMTP() as sesion:
+            abierta = True
+            for supervisor, brigadas in sorted(grupos.items()):
+                if enviar_recordatorio_faltantes(supervisor, fecha, brigadas, sesion):
+                    resultado["enviados"] += 1
+                else:
+                    resultado["errores"] += 1
+    except Exception as e:
+        resultado["errores"] = len(grupos) - resultado["enviados"]
+        if abierta:
+            # Algunos ya se enviaron: el corte queda procesado
+            log.warning("Error enviando recordatorios: %s", e)
+        else:
+            log.warning("No se pudo abrir la sesión SMTP para recordatorios: %s", e)
+            if clave_corte:
+                _liberar_corte(clave_corte)
+
+    return resultado
+
+
+# =========================
+# PROGRAMADOR
+# =========================
+def _tarea_programada(client):
+    def _tarea(corte):
+        hora = corte.strftime("%H:%M")
+        resultado = ejecutar_barrido(client, corte.date().isoformat(), hora)
+        log.info("Barrido ATS %s terminado", hora, extra=resultado)
+
+    return _tarea
+
+
+def ciclo_programado(client, horas: list = None, detener: threading.Event = None):
+    """
+    Espera a cada hora de corte y ejecuta el barrido del día.
+    """
+    programador.ciclo(
+        "recordatorios-ats", horas or leer_horas_corte(), _tarea_programada(client), detener
+    )
+
+
+def iniciar_programador(client):
+    """
+    Arranca el ciclo en un hilo daemon si RECORDATORIOS_EN_PROCESO=1.
+    """
+    if os.getenv("RECORDATORIOS_EN_PROCESO", "0") != "1":
+        return None
+    return programador.iniciar_en_hilo(
+        "recordatorios-ats", leer_horas_corte(), _tarea_programada(client)
+    )
+
+
+# =========================
+# CLI
+# =========================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recordatorio de ATS faltantes por supervisor")
+    parser.add_argument("--fecha", help="Fecha a revisar (YYYY-MM-DD). Por defecto hoy.")
+    parser.add_argument("--solo-listar", action="store_true", help="Solo lista, no envía correos.")
+    parser.add_argument("--programar", action="store_true",
+                        help="Queda corriendo y ejecuta en cada hora de RECORDATORIOS_HORAS.")
+    args = parser.parse_args(argv)
+
+    bitacora.configurar_logging()
+    client = cliente_supabase.cliente_desde_env()
+
+    if args.programar:
+        ciclo_programado(client)
+        return 0
+
+    fecha = args.fecha or date.today().isoformat()
+    if args.solo_listar:
+        for supervisor, brigadas in sorted(agrupar_por_supervisor(brigadas_sin_ats(client, fecha)).items()):
+            print(f"{supervisor}: {', '.join(b['brigada'] for b in brigadas)}")
+        return 0
+
+    print(ejecutar_barrido(client, fecha))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,187 @@
+"""
+Modo de envío "resumen": en lugar de un correo con el PDF adjunto por cada
+ATS, los reportes del día se acumulan por supervisor y se envía UN correo
+con la tabla de reportes y el enlace a cada PDF en Storage.
+
+Se envía a las horas de EMAIL_RESUMEN_HORAS o antes, apenas un supervisor
+junta EMAIL_RESUMEN_MAX_REPORTES reportes. Solo se adjuntan los PDFs
+chicos (EMAIL_ADJUNTO_MAX_KB), con un tope total por correo.
+
+Se activa con EMAIL_MODO=resumen. La cola vive en el estado compartido
+(una lista por supervisor) y el programador corre en todas las instancias:
+sacar la cola es atómico, así cada reporte sale en un solo correo.
+Con el backend en memoria cada proceso envía lo suyo y lo pendiente al
+apagarse; con Redis lo pendiente queda para el próximo envío de cualquier
+instancia. El PDF se adjunta solo si el archivo está en la instancia que
+envía; si no, va el enlace. El archivo local se borra cuando sale su correo.
+"""
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+
+from email_sender import SesionSMTP, enviar_resumen_ats
+import estado_compartido
+import programador
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+MODO_EMAIL = os.getenv("EMAIL_MODO", "inmediato").lower()
+# Horas de envío del resumen, ej. "13:00,18:00"
+HORAS_RESUMEN = os.getenv("EMAIL_RESUMEN_HORAS", "18:00")
+# Se adelanta el envío cuando un supervisor junta esta cantidad de reportes
+MAX_REPORTES = int(os.getenv("EMAIL_RESUMEN_MAX_REPORTES", "10"))
+ADJUNTO_MAX_BYTES = int(os.getenv("EMAIL_ADJUNTO_MAX_KB", "1024")) * 1024
+ADJUNTOS_TOTAL_BYTES = int(os.getenv("EMAIL_ADJUNTOS_TOTAL_MB", "15")) * 1024 * 1024
+
+log = logging.getLogger(__name__)
+
+# Estado compartido: un conjunto con los supervisores y una lista por supervisor
+CLAVE_SUPERVISORES = "resumen:supervisores"
+
+
+def modo_resumen() -> bool:
+    return MODO_EMAIL == "resumen"
+
+
+# =========================
+# COLA
+# =========================
+def encolar(supervisor: str, reporte: dict) -> int:
+    """
+    Agrega un reporte a la cola del supervisor. Si llega a MAX_REPORTES,
+    se dispara el envío de ese supervisor en segundo plano.
+    Devuelve la cantidad de reportes pendientes del supervisor.
+    """
+    supervisor = supervisor or "SIN SUPERVISOR"
+    reporte = dict(reporte, encolado=datetime.now().strftime("%H:%M"))
+
+    estado_compartido.agregar_miembro(CLAVE_SUPERVISORES, supervisor)
+    cantidad = estado_compartido.empujar(_clave_cola(supervisor), [reporte])
+
+    if MAX_REPORTES and cantidad >= MAX_REPORTES:
+        threading.Thread(
+            target=enviar_pendientes,
+            args=(supervisor,),
+            name="resumen-correos-lote",
+            daemon=True,
+        ).start()
+    return cantidad
+
+
+def _clave_cola(supervisor: str) -> str:
+    return f"resumen:cola:{supervisor}"
+
+
+def tomar_pendientes(supervisor: str = None) -> dict:
+    """
+    Saca de la cola los reportes (de un supervisor o de todos).
+    """
+    supervisores = [supervisor] if supervisor is not None else estado_compartido.miembros(CLAVE_SUPERVISORES)
+    grupos = {}
+    for sup in supervisores:
+        cola = estado_compartido.tomar_lista(_clave_cola(sup))
+        if cola:
+            grupos[sup] = cola
+    return grupos
+
+
+def _devolver(supervisor: str, reportes: list):
+    # Si el envío falla, los reportes vuelven al inicio de la cola
+    try:
+        estado_compartido.empujar(_clave_cola(supervisor), reportes, al_inicio=True)
+    except estado_compartido.ErrorEstado as e:
+        log.error("Se perdieron %s reportes del resumen de %s: %s", len(reportes), supervisor, e)
+
+
+def cantidad_pendientes() -> dict:
+    cantidades = {}
+    for sup in estado_compartido.miembros(CLAVE_SUPERVISORES):
+        n = estado_compartido.largo(_clave_cola(sup))
+        if n:
+            cantidades[sup] = n
+    return cantidades
+
+
+# =========================
+# ENVÍO
+# =========================
+def enviar_pendientes(supervisor: str = None) -> dict:
+    """
+    Envía un correo resumen por supervisor con una sola sesión SMTP.
+    Devuelve un resumen del resultado.
+    """
+    try:
+        grupos = tomar_pendientes(supervisor)
+    except estado_compartido.ErrorEstado as e:
+        log.warning("No se pudo leer la cola del resumen de ATS: %s", e)
+        grupos = {}
+    resultado = {
+        "supervisores": len(grupos),
+        "reportes": sum(len(r) for r in grupos.values()),
+        "enviados": 0,
+        "errores": 0,
+    }
+    if not grupos:
+        return resultado
+
+    try:
+        with SesionSMTP() as sesion:
+            for sup, reportes in sorted(grupos.items()):
+                ok = enviar_resumen_ats(
+                    sup, reportes, sesion, ADJUNTO_MAX_BYTES, ADJUNTOS_TOTAL_BYTES
+                )
+                if ok:
+                    resultado["enviados"] += 1
+                    _borrar_pdfs(reportes)
+                else:
+                    resultado["errores"] += 1
+                    _devolver(sup, reportes)
+    except Exception as e:
+        log.warning("No se pudo abrir la sesión SMTP para el resumen de ATS: %s", e)
+        for sup, reportes in grupos.items():
+            _devolver(sup, reportes)
+        resultado["errores"] = len(grupos)
+
+    return resultado
+
+
+def _borrar_pdfs(reportes: list):
+    # PDFs temporales de los reportes ya enviados (los de esta instancia)
+    for r in reportes:
+        pdf_path = r.get("pdf_path")
+        if not pdf_path or not os.path.isfile(pdf_path):
+            continue
+        try:
+            os.remove(pdf_path)
+        except OSError as e:
+            log.warning("No se pudo borrar el PDF temporal: %s", e, extra={"pdf": pdf_path})
+
+
+# =========================
+# PROGRAMADOR
+# =========================
+def _tarea(corte):
+    resultado = enviar_pendientes()
+    if resultado["reportes"]:
+        log.info("Resumen de ATS %s enviado", f"{corte:%H:%M}", extra=resultado)
+
+
+def iniciar_programador():
+    """
+    En modo resumen arranca el envío a las horas configuradas y deja
+    registrado el envío de lo pendiente al apagar el proceso.
+    """
+    if not modo_resumen():
+        return None
+    if estado_compartido.es_local():
+        # Con estado compartido lo pendiente lo envía cualquier otra instancia
+        atexit.register(enviar_pendientes)
+    return programador.iniciar_en_hilo(
+        "resumen-correos",
+        programador.leer_horas(HORAS_RESUMEN, "EMAIL_RESUMEN_HORAS"),
+        _tarea,
+    )
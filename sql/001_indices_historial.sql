@@ -0,0 +1,18 @@
+-- Índices para el historial de ATS (búsqueda con paginación keyset).
+-- El orden de la consulta es (fecha DESC, id DESC); cada filtro frecuente
+-- tiene su propio índice compuesto para que la búsqueda no recorra la tabla.
+
+create index if not exists ats_registros_fecha_id_idx
+    on ats_registros_diarios (fecha desc, id desc);
+
+create index if not exists ats_registros_brigada_fecha_idx
+    on ats_registros_diarios (brigada, fecha desc, id desc);
+
+create index if not exists ats_registros_zona_fecha_idx
+    on ats_registros_diarios (zona, fecha desc, id desc);
+
+create index if not exists ats_registros_contrata_fecha_idx
+    on ats_registros_diarios (contrata, fecha desc, id desc);
+
+create index if not exists ats_registros_supervisor_fecha_idx
+    on ats_registros_diarios (supervisor, fecha desc, id desc);
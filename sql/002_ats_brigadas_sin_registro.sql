@@ -0,0 +1,39 @@
+-- Brigadas activas sin ATS registrado en una fecha (diferencia de conjuntos
+-- en una sola consulta). El supervisor se toma del último ATS de la brigada.
+-- Usada por recordatorios.py vía supabase.rpc("ats_brigadas_sin_registro").
+
+create or replace function ats_brigadas_sin_registro(p_fecha date)
+returns table (brigada text, zona text, contrata text, supervisor text)
+language sql
+stable
+as $$
+    select b.brigada,
+           b.zona,
+           b.contrata,
+           coalesce(
+               (select r.supervisor
+                  from ats_registros_diarios r
+                 where r.brigada = b.brigada
+                   and r.contrata is not distinct from b.contrata
+                 order by r.fecha desc
+                 limit 1),
+               'SIN SUPERVISOR'
+           ) as supervisor
+      from (
+            select distinct on (u.brigada, coalesce(u.contrata, ''))
+                   u.brigada, u.zona, u.contrata
+              from usuarios_brigadas u
+             where u.activo
+               and u.brigada is not null
+             order by u.brigada, coalesce(u.contrata, '')
+           ) b
+     where not exists (
+            select 1
+              from ats_registros_diarios r
+             where r.fecha = p_fecha
+               and r.completado
+               and r.brigada = b.brigada
+               and r.contrata is not distinct from b.contrata
+           )
+     order by b.brigada;
+$$;
@@ -0,0 +1,137 @@
+-- Detalle estructurado de cada ATS.
+-- Se escribe con registrar_ats(p jsonb): upsert del resumen en
+-- ats_registros_diarios y reemplazo de las tablas hijas, todo en una
+-- transacción y un solo viaje desde la app.
+
+alter table ats_registros_diarios
+    add column if not exists actividad        text,
+    add column if not exists lugar_trabajo    text,
+    add column if not exists tema_charla      text,
+    add column if not exists expositor_charla text,
+    add column if not exists hora_inicio      time,
+    add column if not exists hora_fin         time,
+    add column if not exists recomendaciones  text;
+
+create table if not exists ats_participantes (
+    registro_id   bigint not null references ats_registros_diarios (id) on delete cascade,
+    item          int    not null,
+    usuario       text,
+    nombre        text,
+    cargo         text,
+    dni           text,
+    observaciones text,
+    primary key (registro_id, item)
+);
+
+create table if not exists ats_epp_checks (
+    registro_id bigint  not null references ats_registros_diarios (id) on delete cascade,
+    item        int     not null,
+    epp         text    not null,
+    marcado     boolean not null,
+    primary key (registro_id, item, epp)
+);
+
+create index if not exists ats_epp_checks_epp_idx
+    on ats_epp_checks (epp) where not marcado;
+
+create table if not exists ats_riesgos (
+    registro_id bigint not null references ats_registros_diarios (id) on delete cascade,
+    item        int    not null,
+    riesgo      text   not null,
+    primary key (registro_id, item)
+);
+
+create index if not exists ats_riesgos_riesgo_idx on ats_riesgos (riesgo);
+
+
+create or replace function registrar_ats(p jsonb)
+returns bigint
+language plpgsql
+as $$
+declare
+    v_id bigint;
+begin
+    insert into ats_registros_diarios (
+        fecha, brigada, zona, contrata, usuario_registro, supervisor,
+        tecnicos_count, completado, pdf_path, pdf_url,
+        actividad, lugar_trabajo, tema_charla, expositor_charla,
+        hora_inicio, hora_fin, recomendaciones
+    )
+    values (
+        (p->>'fecha')::date,
+        p->>'brigada',
+        p->>'zona',
+        p->>'contrata',
+        p->>'usuario_registro',
+        p->>'supervisor',
+        coalesce((p->>'tecnicos_count')::int, 0),
+        coalesce((p->>'completado')::boolean, true),
+        p->>'pdf_path',
+        p->>'pdf_url',
+        p->>'actividad',
+        p->>'lugar_trabajo',
+        p->>'tema_charla',
+        p->>'expositor_charla',
+        nullif(p->>'hora_inicio', '')::time,
+        nullif(p->>'hora_fin', '')::time,
+        p->>'recomendaciones'
+    )
+    on conflict (fecha, brigada, contrata) do update set
+        zona             = excluded.zona,
+        usuario_registro = excluded.usuario_registro,
+        supervisor       = excluded.supervisor,
+        tecnicos_count   = excluded.tecnicos_count,
+        completado       = excluded.completado,
+        pdf_path         = excluded.pdf_path,
+        pdf_url          = excluded.pdf_url,
+        actividad        = excluded.actividad,
+        lugar_trabajo    = excluded.lugar_trabajo,
+        tema_charla      = excluded.tema_charla,
+        expositor_charla = excluded.expositor_charla,
+        hora_inicio      = excluded.hora_inicio,
+        hora_fin         = excluded.hora_fin,
+        recomendaciones  = excluded.recomendaciones
+    returning id into v_id;
+
+    -- Un nuevo envío del mismo día reemplaza el detalle anterior
+    delete from ats_participantes where registro_id = v_id;
+    delete from ats_epp_checks    where registro_id = v_id;
+    delete from ats_riesgos       where registro_id = v_id;
+
+    insert into ats_participantes (registro_id, item, usuario, nombre, cargo, dni, observaciones)
+    select v_id, x.item, x.usuario, x.nombre, x.cargo, x.dni, x.observaciones
+      from jsonb_to_recordset(coalesce(p->'participantes', '[]'::jsonb))
+           as x(item int, usuario text, nombre text, cargo text, dni text, observaciones text);
+
+    insert into ats_epp_checks (registro_id, item, epp, marcado)
+    select v_id, x.item, x.epp, x.marcado
+      from jsonb_to_recordset(coalesce(p->'epp', '[]'::jsonb))
+           as x(item int, epp text, marcado boolean);
+
+    insert into ats_riesgos (registro_id, item, riesgo)
+    select v_id, x.item, x.riesgo
+      from jsonb_to_recordset(coalesce(p->'riesgos', '[]'::jsonb))
+           as x(item int, riesgo text);
+
+    return v_id;
+end;
+$$;
+
+
+-- Ejemplos de consulta (con sql/006_catalogo_ats.sql aplicado conviene
+-- agrupar por epp_id / riesgo_id, que no cambian al renombrar):
+--
+-- Incumplimiento de EPP por tipo en el mes
+--   select e.epp, count(*) filter (where not e.marcado) as faltas, count(*) as verificaciones
+--     from ats_epp_checks e
+--     join ats_registros_diarios r on r.id = e.registro_id
+--    where r.fecha >= date_trunc('month', current_date)
+--    group by e.epp
+--    order by faltas desc;
+--
+-- Frecuencia de riesgos reportados por zona
+--   select r.zona, x.riesgo, count(*)
+--     from ats_riesgos x
+--     join ats_registros_diarios r on r.id = x.registro_id
+--    group by r.zona, x.riesgo
+--    order by count(*) desc;
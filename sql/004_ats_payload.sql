@@ -0,0 +1,82 @@
+-- Modo de almacenamiento "payload" (ATS_ALMACENAMIENTO=payload):
+-- ruta del JSON comprimido del ATS, a partir del cual se regenera el PDF.
+-- registrar_ats se redefine para guardar también esta columna.
+
+alter table ats_registros_diarios
+    add column if not exists payload_path text;
+
+
+create or replace function registrar_ats(p jsonb)
+returns bigint
+language plpgsql
+as $$
+declare
+    v_id bigint;
+begin
+    insert into ats_registros_diarios (
+        fecha, brigada, zona, contrata, usuario_registro, supervisor,
+        tecnicos_count, completado, pdf_path, pdf_url, payload_path,
+        actividad, lugar_trabajo, tema_charla, expositor_charla,
+        hora_inicio, hora_fin, recomendaciones
+    )
+    values (
+        (p->>'fecha')::date,
+        p->>'brigada',
+        p->>'zona',
+        p->>'contrata',
+        p->>'usuario_registro',
+        p->>'supervisor',
+        coalesce((p->>'tecnicos_count')::int, 0),
+        coalesce((p->>'completado')::boolean, true),
+        p->>'pdf_path',
+        p->>'pdf_url',
+        p->>'payload_path',
+        p->>'actividad',
+        p->>'lugar_trabajo',
+        p->>'tema_charla',
+        p->>'expositor_charla',
+        nullif(p->>'hora_inicio', '')::time,
+        nullif(p->>'hora_fin', '')::time,
+        p->>'recomendaciones'
+    )
+    on conflict (fecha, brigada, contrata) do update set
+        zona             = excluded.zona,
+        usuario_registro = excluded.usuario_registro,
+        supervisor       = excluded.supervisor,
+        tecnicos_count   = excluded.tecnicos_count,
+        completado       = excluded.completado,
+        pdf_path         = excluded.pdf_path,
+        pdf_url          = excluded.pdf_url,
+        payload_path     = excluded.payload_path,
+        actividad        = excluded.actividad,
+        lugar_trabajo    = excluded.lugar_trabajo,
+        tema_charla      = excluded.tema_charla,
+        expositor_charla = excluded.expositor_charla,
+        hora_inicio      = excluded.hora_inicio,
+        hora_fin         = excluded.hora_fin,
+        recomendaciones  = excluded.recomendaciones
+    returning id into v_id;
+
+    -- Un nuevo envío del mismo día reemplaza el detalle anterior
+    delete from ats_participantes where registro_id = v_id;
+    delete from ats_epp_checks    where registro_id = v_id;
+    delete from ats_riesgos       where registro_id = v_id;
+
+    insert into ats_participantes (registro_id, item, usuario, nombre, cargo, dni, observaciones)
+    select v_id, x.item, x.usuario, x.nombre, x.cargo, x.dni, x.observaciones
+      from jsonb_to_recordset(coalesce(p->'participantes', '[]'::jsonb))
+           as x(item int, usuario text, nombre text, cargo text, dni text, observaciones text);
+
+    insert into ats_epp_checks (registro_id, item, epp, marcado)
+    select v_id, x.item, x.epp, x.marcado
+      from jsonb_to_recordset(coalesce(p->'epp', '[]'::jsonb))
+           as x(item int, epp text, marcado boolean);
+
+    insert into ats_riesgos (registro_id, item, riesgo)
+    select v_id, x.item, x.riesgo
+      from jsonb_to_recordset(coalesce(p->'riesgos', '[]'::jsonb))
+           as x(item int, riesgo text);
+
+    return v_id;
+end;
+$$;
@@ -0,0 +1,38 @@
+-- Claves con hash (PBKDF2, formato werkzeug) para el login (ver auth.py).
+-- La columna se completa sola: en el primer login correcto de cada usuario
+-- la app guarda el hash. Cuando todos estén migrados se puede vaciar la
+-- clave en texto plano (o activar LOGIN_BORRAR_CLAVE_PLANA=1).
+
+alter table usuarios_brigadas
+    add column if not exists clave_hash text;
+
+-- Restablecer una clave sigue siendo editar `clave` en la tabla: al cambiarla
+-- se borra el hash, así la clave anterior deja de entrar y el siguiente
+-- login con la nueva vuelve a generar el hash. Si en el mismo update se
+-- escribe también clave_hash, se respeta ese hash.
+create or replace function usuarios_brigadas_clave_cambiada()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.clave is not null
+       and new.clave is distinct from old.clave
+       and new.clave_hash is not distinct from old.clave_hash then
+        new.clave_hash := null;
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists usuarios_brigadas_clave_cambiada on usuarios_brigadas;
+create trigger usuarios_brigadas_clave_cambiada
+    before update of clave on usuarios_brigadas
+    for each row execute function usuarios_brigadas_clave_cambiada();
+
+-- El login busca por usuario (ya no por usuario + clave)
+create index if not exists usuarios_brigadas_usuario_idx
+    on usuarios_brigadas (usuario);
+
+-- Cuando ya no queden usuarios sin hash:
+--   select count(*) from usuarios_brigadas where clave_hash is null;
+--   update usuarios_brigadas set clave = null where clave_hash is not null;
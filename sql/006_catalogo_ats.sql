@@ -0,0 +1,235 @@
+-- Catálogo de EPP y riesgos del ATS (ver catalogo.py).
+-- El id de cada fila es estable: renombrar un EPP o riesgo no cambia su id.
+-- Los nombres anteriores se agregan como alias para que los ATS ya
+-- guardados sigan marcando la columna correcta.
+-- Cualquier cambio en las tablas sube catalogo_ats_version; la app solo
+-- recarga el catálogo cuando la versión cambia.
+
+create table if not exists catalogo_epp (
+    id      text primary key,
+    nombre  text    not null,           -- texto en el formulario y en ats_epp_checks
+    columna text    not null,           -- encabezado vertical en el PDF
+    alias   text[]  not null default '{}',
+    orden   int     not null default 0,
+    activo  boolean not null default true
+);
+
+create table if not exists catalogo_riesgos (
+    id        text primary key,
+    nombre    text    not null,         -- texto en el formulario y en ats_riesgos
+    peligros  text    not null,
+    riesgo    text    not null,
+    controles text    not null,
+    nivel     char(1) not null default 'M' check (nivel in ('A', 'M', 'B')),
+    orden     int     not null default 0,
+    activo    boolean not null default true
+);
+
+create table if not exists catalogo_ats_version (
+    id             smallint primary key default 1 check (id = 1),
+    version        bigint      not null default 1,
+    actualizado_en timestamptz not null default now()
+);
+
+insert into catalogo_ats_version (id) values (1) on conflict (id) do nothing;
+
+create or replace function catalogo_ats_subir_version()
+returns trigger
+language plpgsql
+as $$
+begin
+    update catalogo_ats_version
+       set version = version + 1, actualizado_en = now()
+     where id = 1;
+    return null;
+end;
+$$;
+
+drop trigger if exists catalogo_epp_version on catalogo_epp;
+create trigger catalogo_epp_version
+    after insert or update or delete on catalogo_epp
+    for each statement execute function catalogo_ats_subir_version();
+
+drop trigger if exists catalogo_riesgos_version on catalogo_riesgos;
+create trigger catalogo_riesgos_version
+    after insert or update or delete on catalogo_riesgos
+    for each statement execute function catalogo_ats_subir_version();
+
+
+-- Catálogo inicial (el mismo que usa la app si las tablas no existen)
+insert into catalogo_epp (id, nombre, columna, alias, orden) values
+    ('fotocheck',            'Fotocheck',                     'Fotocheck',            '{}', 1),
+    ('uniforme',             'Uniforme',                      'Uniforme',             '{}', 2),
+    ('casco',                'Casco de seguridad',            'Casco',                '{}', 3),
+    ('barbiquejo',           'Barbuquejo',                    'Barbiquejo',           '{}', 4),
+    ('lentes',               'Lentes de seguridad',           'Lentes',               '{}', 5),
+    ('lentes_uv',            'Lentes ultravioletas',          'UV',                   '{"Lentes UV"}', 6),
+    ('guantes_dielectricos', 'Guantes dieléctricos',          'Guantes Dielectricos', '{}', 7),
+    ('guantes_anticorte',    'Guantes anticorte',             'Guantes Anticorte',    '{}', 8),
+    ('chaleco',              'Chaleco reflectivo',            'Chaleco',              '{}', 9),
+    ('arnes',                'Arnés / cinturón de seguridad', 'Arnes',                '{"Arnés","Cinturón de seguridad"}', 10),
+    ('botas',                'Botas dieléctricas',            'Botas',                '{"Botas de seguridad"}', 11),
+    ('sctr',                 'SCTR',                          'SCTR',                 '{}', 12)
+on conflict (id) do nothing;
+
+insert into catalogo_riesgos (id, nombre, peligros, riesgo, controles, nivel, orden) values
+    ('caidas_distinto_nivel', 'Caídas a distinto nivel',
+     'Trabajo en altura: postes, escaleras, cámaras y buzones',
+     'Caída de persona, fracturas, contusiones',
+     'Arnés con línea de vida, escalera inspeccionada y asegurada, delimitar la zona', 'A', 1),
+    ('transito_vehicular', 'Atropellos / tránsito vehicular',
+     'Trabajo en vía pública con circulación de vehículos',
+     'Atropello, golpes',
+     'Conos y señalización, chaleco reflectivo, vigía de tránsito', 'A', 2),
+    ('cortes_fibra', 'Cortes con FO / vidrio',
+     'Fragmentos de fibra y vidrio, herramientas de corte',
+     'Cortes, fibra incrustada en piel u ojos',
+     'Guantes anticorte, lentes de seguridad, recipiente para residuos de fibra', 'M', 3),
+    ('contacto_electrico', 'Contacto eléctrico',
+     'Redes eléctricas cercanas, equipos energizados',
+     'Electrocución, quemaduras',
+     'Distancia de seguridad, guantes y botas dieléctricas, verificar ausencia de tensión', 'A', 4),
+    ('golpes_herramientas', 'Golpes con herramientas',
+     'Herramientas manuales',
+     'Golpes, contusiones',
+     'Herramientas en buen estado, guantes, orden en la zona de trabajo', 'B', 5),
+    ('superficies_inestables', 'Deslizamientos / superficies inestables',
+     'Terreno irregular, húmedo o inestable',
+     'Resbalones, caídas al mismo nivel',
+     'Inspeccionar el terreno, calzado de seguridad, orden y limpieza', 'M', 6),
+    ('ergonomico', 'Esfuerzo físico / posturas forzadas',
+     'Manipulación de bobinas y cargas, posturas prolongadas',
+     'Lesiones musculoesqueléticas',
+     'Levantar entre dos o con ayuda mecánica, técnica de levantamiento, pausas activas', 'M', 7),
+    ('exposicion_solar', 'Exposición solar / calor',
+     'Radiación UV, temperatura elevada',
+     'Quemaduras solares, golpe de calor',
+     'Bloqueador solar, lentes UV, cubrenuca, hidratación', 'M', 8),
+    ('robo_asalto', 'Robo / asalto',
+     'Zonas con riesgo de inseguridad',
+     'Agresiones, robo de equipos',
+     'Trabajar en grupo, coordinar con supervisión, no exponer equipos', 'M', 9),
+    ('animales', 'Animales (perros, insectos)',
+     'Perros, insectos y roedores en la zona o en cámaras',
+     'Mordeduras, picaduras',
+     'Inspección previa, repelente, mantener distancia', 'B', 10)
+on conflict (id) do nothing;
+
+-- Id estable del catálogo junto al nombre en el detalle de cada ATS: los
+-- reportes agrupan por id y un EPP o riesgo renombrado no se parte en dos.
+-- Lo que no está en el catálogo (texto libre) queda con id null.
+alter table ats_epp_checks add column if not exists epp_id text;
+alter table ats_riesgos    add column if not exists riesgo_id text;
+
+create index if not exists ats_epp_checks_epp_id_idx
+    on ats_epp_checks (epp_id) where not marcado;
+create index if not exists ats_riesgos_riesgo_id_idx on ats_riesgos (riesgo_id);
+
+-- ATS guardados antes del catálogo: id por nombre o alias
+update ats_epp_checks e
+   set epp_id = c.id
+  from catalogo_epp c
+ where e.epp_id is null
+   and (e.epp = c.nombre or e.epp = any (c.alias));
+
+update ats_riesgos x
+   set riesgo_id = c.id
+  from catalogo_riesgos c
+ where x.riesgo_id is null
+   and x.riesgo = c.nombre;
+
+-- registrar_ats (sql/004_ats_payload.sql) guardando también los ids
+create or replace function registrar_ats(p jsonb)
+returns bigint
+language plpgsql
+as $$
+declare
+    v_id bigint;
+begin
+    insert into ats_registros_diarios (
+        fecha, brigada, zona, contrata, usuario_registro, supervisor,
+        tecnicos_count, completado, pdf_path, pdf_url, payload_path,
+        actividad, lugar_trabajo, tema_charla, expositor_charla,
+        hora_inicio, hora_fin, recomendaciones
+    )
+    values (
+        (p->>'fecha')::date,
+        p->>'brigada',
+        p->>'zona',
+        p->>'contrata',
+        p->>'usuario_registro',
+        p->>'supervisor',
+        coalesce((p->>'tecnicos_count')::int, 0),
+        coalesce((p->>'completado')::boolean, true),
+        p->>'pdf_path',
+        p->>'pdf_url',
+        p->>'payload_path',
+        p->>'actividad',
+        p->>'lugar_trabajo',
+        p->>'tema_charla',
+        p->>'expositor_charla',
+        nullif(p->>'hora_inicio', '')::time,
+        nullif(p->>'hora_fin', '')::time,
+        p->>'recomendaciones'
+    )
+    on conflict (fecha, brigada, contrata) do update set
+        zona             = excluded.zona,
+        usuario_registro = excluded.usuario_registro,
+        supervisor       = excluded.supervisor,
+        tecnicos_count   = excluded.tecnicos_count,
+        completado       = excluded.completado,
+        pdf_path         = excluded.pdf_path,
+        pdf_url          = excluded.pdf_url,
+        payload_path     = excluded.payload_path,
+        actividad        = excluded.actividad,
+        lugar_trabajo    = excluded.lugar_trabajo,
+        tema_charla      = excluded.tema_charla,
+        expositor_charla = excluded.expositor_charla,
+        hora_inicio      = excluded.hora_inicio,
+        hora_fin         = excluded.hora_fin,
+        recomendaciones  = excluded.recomendaciones
+    returning id into v_id;
+
+    -- Un nuevo envío del mismo día reemplaza el detalle anterior
+    delete from ats_participantes where registro_id = v_id;
+    delete from ats_epp_checks    where registro_id = v_id;
+    delete from ats_riesgos       where registro_id = v_id;
+
+    insert into ats_participantes (registro_id, item, usuario, nombre, cargo, dni, observaciones)
+    select v_id, x.item, x.usuario, x.nombre, x.cargo, x.dni, x.observaciones
+      from jsonb_to_recordset(coalesce(p->'participantes', '[]'::jsonb))
+           as x(item int, usuario text, nombre text, cargo text, dni text, observaciones text);
+
+    insert into ats_epp_checks (registro_id, item, epp_id, epp, marcado)
+    select v_id, x.item, x.epp_id, x.epp, x.marcado
+      from jsonb_to_recordset(coalesce(p->'epp', '[]'::jsonb))
+           as x(item int, epp_id text, epp text, marcado boolean);
+
+    insert into ats_riesgos (registro_id, item, riesgo_id, riesgo)
+    select v_id, x.item, x.riesgo_id, x.riesgo
+      from jsonb_to_recordset(coalesce(p->'riesgos', '[]'::jsonb))
+           as x(item int, riesgo_id text, riesgo text);
+
+    return v_id;
+end;
+$$;
+
+
+-- Ejemplos:
+--
+-- Renombrar un EPP sin perder los ATS anteriores
+--   update catalogo_epp
+--      set nombre = 'Casco dieléctrico', alias = alias || 'Casco de seguridad'
+--    where id = 'casco';
+--
+-- Subir el nivel de un riesgo
+--   update catalogo_riesgos set nivel = 'A' where id = 'robo_asalto';
+--
+-- Incumplimiento de EPP por id en el mes (con el nombre actual)
+--   select c.id, c.nombre, count(*) filter (where not e.marcado) as faltas, count(*) as verificaciones
+--     from ats_epp_checks e
+--     join ats_registros_diarios r on r.id = e.registro_id
+--     join catalogo_epp c on c.id = e.epp_id
+--    where r.fecha >= date_trunc('month', current_date)
+--    group by c.id, c.nombre
+--    order by faltas desc;
@@ -1,2 +1,7 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+
 def subir_a_google_drive(filename, zona):
-    print(f"Simulando subida de {filename} a Google Drive carpeta {zona}")
\ No newline at end of file
+    log.info("Simulando subida a Google Drive", extra={"archivo": filename, "zona": zona})
\ No newline at end of file
@@ -1,7 +1,10 @@
+import logging
 import os
 import requests
 from datetime import datetime
 
+log = logging.getLogger(__name__)
+
 
 def subir_a_onedrive(filepath, supervisor, fecha):
     """
@@ -10,7 +13,7 @@ def subir_a_onedrive(filepath, supervisor, fecha):
     """
     upload_link = os.getenv("ONEDRIVE_UPLOAD_LINK")
     if not upload_link:
-        print("⚠️ No se encontró la variable ONEDRIVE_UPLOAD_LINK en el .env")
+        log.warning("No se encontró la variable ONEDRIVE_UPLOAD_LINK en el .env")
         return
 
     # Normalizamos los nombres
@@ -21,16 +24,22 @@ def subir_a_onedrive(filepath, supervisor, fecha):
     # Construimos una subcarpeta virtual
     upload_url = f"{upload_link}/{supervisor_folder}/{fecha_folder}/{filename}"
 
-    print(f"📤 Subiendo archivo: {filename} → {supervisor_folder}/{fecha_folder}/")
+    log.info(
+        "Subiendo archivo a OneDrive",
+        extra={"archivo": filename, "carpeta": f"{supervisor_folder}/{fecha_folder}/"},
+    )
 
     try:
         with open(filepath, "rb") as f:
             response = requests.put(upload_url, data=f)
 
         if response.status_code in [200, 201, 204]:
-            print(f"✅ Archivo subido correctamente: {response.status_code}")
+            log.info("Archivo subido correctamente a OneDrive", extra={"estado": response.status_code})
         else:
-            print(f"❌ Error al subir: {response.status_code} → {response.text}")
+            log.error(
+                "Error al subir a OneDrive",
+                extra={"estado": response.status_code, "respuesta": response.text[:500]},
+            )
 
     except Exception as e:
-        print(f"⚠️ Error al conectar con OneDrive: {e}")
+        log.warning("Error al conectar con OneDrive: %s", e)
@@ -0,0 +1,66 @@
+"""
+Fixtures comunes. Las pruebas usan los servidores locales de loadtest/
+(Supabase, Redis) en puertos efímeros: no hace falta red ni credenciales.
+
+    python -m pytest -q
+"""
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+import cliente_supabase  # noqa: E402
+import estado_compartido  # noqa: E402
+from loadtest.redis_falso import RedisFalso  # noqa: E402
+from loadtest.supabase_falso import SupabaseFalso  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def entorno(monkeypatch):
+    """
+    Cada prueba arranca con estado compartido vacío (en memoria), circuitos
+    cerrados y el directorio del repo como cwd (logo, temp/).
+    """
+    monkeypatch.chdir(RAIZ)
+    monkeypatch.setattr(estado_compartido, "_backend", estado_compartido.EstadoMemoria())
+    monkeypatch.setattr(estado_compartido, "_prefijo", "")
+    monkeypatch.setattr(
+        cliente_supabase, "_circuitos", {s: cliente_supabase.Circuito(s) for s in cliente_supabase.TIMEOUTS}
+    )
+
+
+@pytest.fixture
+def supabase_falso():
+    servidor = SupabaseFalso()
+    servidor.iniciar()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def cliente(supabase_falso):
+    return cliente_supabase.crear_cliente(supabase_falso.url, "clave-de-prueba")
+
+
+@pytest.fixture
+def redis_falso():
+    servidor = RedisFalso()
+    servidor.iniciar()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def estado_redis(redis_falso, monkeypatch):
+    """
+    Estado compartido sobre el Redis falso (como ESTADO_BACKEND=redis).
+    """
+    monkeypatch.setattr(estado_compartido, "_backend", estado_compartido.EstadoRedis(redis_falso.url))
+    monkeypatch.setattr(estado_compartido, "_prefijo", "ats:")
+    return redis_falso
@@ -0,0 +1,112 @@
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+import ats_detalle
+import catalogo
+from cliente_supabase import CircuitoAbierto
+
+REGISTRO = {"fecha": "2025-11-10", "brigada": "B1", "contrata": "CICSA", "completado": True}
+DATA = {
+    "actividad": "Tendido de fibra",
+    "riesgos": ["Caídas a distinto nivel", "Tráfico vehicular"],
+    "tecnicos": [
+        {"item": 1, "usuario": "t1", "nombre": "UNO", "epp": ["Casco de seguridad", "Linterna propia"]},
+        {"item": 2, "usuario": "t2", "nombre": "DOS", "epp": []},
+    ],
+}
+
+
+def _catalogo():
+    base = catalogo.Catalogo.base()
+    epp = [e for e in base.epp if e["id"] in ("casco", "uniforme", "lentes_uv")]
+    return catalogo.Catalogo(epp, base.riesgos)
+
+
+def test_payload_guarda_epp_marcado_y_no_marcado():
+    payload = ats_detalle.construir_payload(REGISTRO, DATA, _catalogo())
+    assert payload["fecha"] == "2025-11-10" and payload["actividad"] == "Tendido de fibra"
+    assert [p["usuario"] for p in payload["participantes"]] == ["t1", "t2"]
+    assert payload["epp"] == [
+        {"item": 1, "epp_id": "uniforme", "epp": "Uniforme", "marcado": False},
+        {"item": 1, "epp_id": "casco", "epp": "Casco de seguridad", "marcado": True},
+        {"item": 1, "epp_id": "lentes_uv", "epp": "Lentes ultravioletas", "marcado": False},
+        {"item": 1, "epp_id": None, "epp": "Linterna propia", "marcado": True},
+        {"item": 2, "epp_id": "uniforme", "epp": "Uniforme", "marcado": False},
+        {"item": 2, "epp_id": "casco", "epp": "Casco de seguridad", "marcado": False},
+        {"item": 2, "epp_id": "lentes_uv", "epp": "Lentes ultravioletas", "marcado": False},
+    ]
+    assert payload["riesgos"] == [
+        {"item": 1, "riesgo_id": "caidas_distinto_nivel", "riesgo": "Caídas a distinto nivel"},
+        {"item": 2, "riesgo_id": None, "riesgo": "Tráfico vehicular"},
+    ]
+
+
+def test_alias_marca_el_epp_por_id():
+    data = {"tecnicos": [{"item": 1, "epp": ["Lentes UV"]}]}
+    checks = ats_detalle.construir_payload(REGISTRO, data, _catalogo())["epp"]
+    # Un solo registro por EPP: el alias no se guarda aparte
+    assert [(c["epp_id"], c["marcado"]) for c in checks] == [
+        ("uniforme", False), ("casco", False), ("lentes_uv", True),
+    ]
+
+
+def test_guardar_con_rpc(supabase_falso, cliente):
+    registro_id = ats_detalle.guardar_registro(cliente, dict(REGISTRO), DATA)
+    filas = supabase_falso.base.tablas["ats_registros_diarios"]
+    assert registro_id == filas[0]["id"]
+
+
+def test_sin_funcion_guarda_solo_el_resumen(supabase_falso, cliente):
+    supabase_falso.base.rpc_disponibles = set()
+    registro_id = ats_detalle.guardar_registro(cliente, dict(REGISTRO), DATA)
+    filas = supabase_falso.base.tablas["ats_registros_diarios"]
+    assert len(filas) == 1 and registro_id == filas[0]["id"]
+
+
+class _ClienteQueFalla:
+    """
+    La RPC lanza `error`; registra si se intentó el upsert de respaldo.
+    """
+
+    def __init__(self, error):
+        self.error = error
+        self.upserts = []
+
+    def rpc(self, nombre, argumentos):
+        return self
+
+    def execute(self):
+        raise self.error
+
+    def table(self, nombre):
+        raise AssertionError("no debe guardar solo el resumen")
+
+
+@pytest.mark.parametrize("error", [
+    httpx.ReadTimeout("timeout"),
+    CircuitoAbierto("rest", 30),
+    APIError({"code": "23505", "message": "duplicate key value violates unique constraint"}),
+    APIError({"code": "57014", "message": "canceling statement due to statement timeout"}),
+])
+def test_otros_errores_se_propagan(error):
+    with pytest.raises(type(error)):
+        ats_detalle.guardar_registro(_ClienteQueFalla(error), dict(REGISTRO), DATA)
+
+
+def test_funcion_inexistente_segun_postgres():
+    class _SinFuncion(_ClienteQueFalla):
+        def table(self, nombre):
+            self.upserts.append(nombre)
+            return _Upsert()
+
+    class _Upsert:
+        def upsert(self, *args, **kwargs):
+            return self
+
+        def execute(self):
+            return type("R", (), {"data": [{"id": 7}]})()
+
+    cliente = _SinFuncion(APIError({"code": "42883", "message": "function registrar_ats(jsonb) does not exist"}))
+    assert ats_detalle.guardar_registro(cliente, dict(REGISTRO), DATA) == 7
+    assert cliente.upserts == ["ats_registros_diarios"]
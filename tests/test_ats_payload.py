@@ -0,0 +1,122 @@
+import pytest
+from PIL import Image
+
+import ats_payload
+import catalogo
+from cache_local import CacheBytesLRU
+
+BUCKET = "ats_pdfs"
+
+
+@pytest.fixture(autouse=True)
+def cache_vacia(monkeypatch):
+    monkeypatch.setattr(ats_payload, "_cache_renders", CacheBytesLRU(16 * 1024 * 1024))
+
+
+def _imagen(ruta, color, formato):
+    Image.new("RGB", (120, 80), color).save(ruta, formato)
+    return str(ruta)
+
+
+@pytest.fixture
+def data(tmp_path):
+    foto = _imagen(tmp_path / "foto.jpg", (200, 30, 30), "JPEG")
+    return {
+        "fecha_dia": "2025-11-10",
+        "actividad": "Empalme de fibra",
+        "supervisor": "ANA",
+        "brigada": "BRIG 01",
+        "riesgos": ["Trabajo en altura"],
+        "tecnicos": [
+            {"item": 1, "usuario": "t1", "nombre": "UNO", "epp": ["Casco de seguridad"],
+             "firma_path": _imagen(tmp_path / "f1.png", (0, 0, 0), "PNG"), "foto_path": foto},
+            # Misma foto: se sube un solo blob
+            {"item": 2, "usuario": "t2", "nombre": "DOS", "epp": [],
+             "firma_path": None, "foto_path": foto},
+        ],
+        "foto_path": None,
+    }
+
+
+def test_ida_y_vuelta(supabase_falso, cliente, data):
+    path = ats_payload.guardar_payload(cliente, BUCKET, data, "ats/2025-11-10/BRIG_01/ATS_x.pdf")
+    assert path == "ats/2025-11-10/BRIG_01/ATS_x.json.gz"
+    blobs = [p for (_, p) in supabase_falso.base.objetos if p.startswith("blobs/")]
+    assert len(blobs) == 2  # firma + foto compartida
+
+    cargado = ats_payload.cargar_payload(cliente, BUCKET, path)
+    assert cargado["actividad"] == "Empalme de fibra"
+    assert cargado["tecnicos"][0]["epp"] == ["Casco de seguridad"]
+    assert cargado["tecnicos"][0]["foto_path"] == cargado["tecnicos"][1]["foto_path"]
+    assert isinstance(cargado["tecnicos"][0]["firma_path"], bytes)
+    assert cargado["tecnicos"][1]["firma_path"] is None
+
+
+def test_render_deterministico(supabase_falso, cliente, data):
+    path = ats_payload.guardar_payload(cliente, BUCKET, data, "ats/x.pdf")
+    primero = ats_payload.renderizar(ats_payload.cargar_payload(cliente, BUCKET, path))
+    segundo = ats_payload.renderizar(ats_payload.cargar_payload(cliente, BUCKET, path))
+    assert primero.startswith(b"%PDF") and primero == segundo
+
+
+def test_obtener_pdf_usa_cache(supabase_falso, cliente, data):
+    path = ats_payload.guardar_payload(cliente, BUCKET, data, "ats/x.pdf")
+    pdf = ats_payload.obtener_pdf(cliente, BUCKET, path)
+    supabase_falso.base.objetos.clear()
+    # Ya no está en Storage: sale del cache de renders
+    assert ats_payload.obtener_pdf(cliente, BUCKET, path) == pdf
+
+
+def test_recorrido_masivo_no_llena_el_cache(supabase_falso, cliente, data):
+    path = ats_payload.guardar_payload(cliente, BUCKET, data, "ats/x.pdf")
+    ats_payload.obtener_pdf(cliente, BUCKET, path, guardar_cache=False)
+    assert len(ats_payload._cache_renders) == 0
+
+
+def test_etag_estable():
+    assert ats_payload.etag_payload("ats/a.json.gz") == ats_payload.etag_payload("ats/a.json.gz")
+    assert ats_payload.etag_payload("ats/a.json.gz") != ats_payload.etag_payload("ats/b.json.gz")
+
+
+def test_etag_cambia_con_el_diseno(monkeypatch):
+    antes = ats_payload.etag_payload("ats/a.json.gz")
+    monkeypatch.setattr(ats_payload, "VERSION_DISENO", ats_payload.VERSION_DISENO + 1)
+    assert ats_payload.etag_payload("ats/a.json.gz") != antes
+
+
+def _catalogo_recortado():
+    base = catalogo.Catalogo.base()
+    return catalogo.Catalogo(base.epp[:-1], base.riesgos, version="v2")
+
+
+def test_etag_no_depende_del_catalogo_vigente(monkeypatch):
+    antes = ats_payload.etag_payload("ats/a.json.gz")
+    monkeypatch.setattr(catalogo, "_vigente", _catalogo_recortado())
+    assert ats_payload.etag_payload("ats/a.json.gz") == antes
+
+
+def test_render_con_las_columnas_guardadas(supabase_falso, cliente, data, monkeypatch):
+    path = ats_payload.guardar_payload(cliente, BUCKET, data, "ats/x.pdf", catalogo=catalogo.Catalogo.base())
+    primero = ats_payload.renderizar(ats_payload.cargar_payload(cliente, BUCKET, path))
+    # Otro worker con otro catálogo cargado genera los mismos bytes
+    monkeypatch.setattr(catalogo, "_vigente", _catalogo_recortado())
+    cargado = ats_payload.cargar_payload(cliente, BUCKET, path)
+    assert len(cargado["epp"]) == len(catalogo.Catalogo.base().epp)
+    assert ats_payload.renderizar(cargado) == primero
+
+
+def test_sube_las_fotos_reducidas(supabase_falso, cliente, data):
+    foto = data["tecnicos"][0]["foto_path"]
+    ats_payload.guardar_payload(cliente, BUCKET, data, "ats/x.pdf", fotos={foto: b"jpeg-reducido"})
+    blobs = {p: v for (_, p), v in supabase_falso.base.objetos.items() if p.startswith("blobs/")}
+    assert b"jpeg-reducido" in blobs.values()
+    assert not any(v == open(foto, "rb").read() for v in blobs.values())
+
+
+def test_renders_no_se_mezclan_entre_disenos(supabase_falso, cliente, data, monkeypatch):
+    path = ats_payload.guardar_payload(cliente, BUCKET, data, "ats/x.pdf")
+    ats_payload.obtener_pdf(cliente, BUCKET, path)
+    monkeypatch.setattr(ats_payload, "VERSION_DISENO", ats_payload.VERSION_DISENO + 1)
+    ats_payload.obtener_pdf(cliente, BUCKET, path)
+    # Con otro diseño el render cacheado no sirve: se genera y guarda aparte
+    assert len(ats_payload._cache_renders) == 2
@@ -0,0 +1,222 @@
+import socket
+
+import pytest
+from flask import Flask
+
+import auth
+import estado_compartido
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1_700_000_000.0
+
+    def time(self):
+        return self.ahora
+
+
+@pytest.fixture(autouse=True)
+def hash_barato(monkeypatch):
+    monkeypatch.setattr(auth, "HASH_ITERACIONES", 1000)
+    monkeypatch.setattr(auth, "_hash_relleno", None)
+    monkeypatch.setattr(auth, "_sin_columna_hash", False)
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(auth, "time", reloj)
+    return reloj
+
+
+@pytest.fixture
+def cubos(monkeypatch):
+    monkeypatch.setattr(auth, "_cubo_usuario", auth.CuboTokens("usuario", 3, 3))
+    monkeypatch.setattr(auth, "_cubo_ip", auth.CuboTokens("ip", 100, 100))
+
+
+@pytest.fixture
+def usuarios(supabase_falso):
+    supabase_falso.base.sembrar("usuarios_brigadas", [
+        {"usuario": "jperez", "nombre": "JUAN", "brigada": "B1", "activo": True, "clave": "1234"},
+        {"usuario": "baja", "nombre": "BAJA", "activo": False, "clave": "1234"},
+    ])
+    return supabase_falso.base
+
+
+def _fila(base, usuario):
+    return next(f for f in base.seleccionar("usuarios_brigadas", []) if f["usuario"] == usuario)
+
+
+# =========================
+# CLAVES
+# =========================
+def test_verificar_clave_plana_y_hash():
+    assert auth.verificar_clave({"clave": "1234"}, "1234")
+    assert not auth.verificar_clave({"clave": "1234"}, "12345")
+    assert not auth.verificar_clave({"clave": None}, "")
+    assert auth.verificar_clave({"clave_hash": auth.hash_clave("abcd")}, "abcd")
+
+
+def test_con_hash_la_clave_plana_no_entra():
+    fila = {"clave": "vieja", "clave_hash": auth.hash_clave("nueva")}
+    assert not auth.verificar_clave(fila, "vieja")
+    assert auth.verificar_clave(fila, "nueva")
+
+
+def test_rehash_al_cambiar_el_costo(monkeypatch):
+    clave_hash = auth.hash_clave("abcd")
+    assert not auth._requiere_rehash(clave_hash)
+    monkeypatch.setattr(auth, "HASH_ITERACIONES", 2000)
+    assert auth._requiere_rehash(clave_hash)
+
+
+# =========================
+# CUBOS
+# =========================
+def test_cubo_consume_y_se_recarga(reloj):
+    cubo = auth.CuboTokens("prueba", 2, 6)  # un intento cada 10 s
+    assert cubo.consumir("x") == 0
+    assert cubo.consumir("x") == 0
+    assert cubo.consumir("x") == pytest.approx(10)
+    reloj.ahora += 5
+    assert cubo.espera("x") == pytest.approx(5)
+    reloj.ahora += 5
+    assert cubo.espera("x") == 0
+    assert cubo.consumir("x") == 0
+    # Otra clave tiene su propio cubo
+    assert cubo.consumir("y") == 0
+
+
+def test_espera_no_consume(reloj):
+    cubo = auth.CuboTokens("prueba", 1, 1)
+    for _ in range(3):
+        assert cubo.espera("x") == 0
+    assert cubo.consumir("x") == 0
+    assert cubo.espera("x") > 0
+
+
+def test_cubo_compartido_entre_instancias(estado_redis, reloj):
+    a = auth.CuboTokens("prueba", 2, 1)
+    b = auth.CuboTokens("prueba", 2, 1)
+    assert a.consumir("x") == 0
+    assert b.consumir("x") == 0
+    assert a.consumir("x") > 0
+
+
+def test_sin_estado_compartido_se_permite(monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+    monkeypatch.setattr(estado_compartido, "_backend", estado_compartido.EstadoRedis(f"redis://127.0.0.1:{puerto}"))
+    cubo = auth.CuboTokens("prueba", 1, 1)
+    assert cubo.consumir("x") == 0
+    assert cubo.consumir("x") == 0
+    assert cubo.espera("x") == 0
+
+
+# =========================
+# LOGIN
+# =========================
+@pytest.fixture
+def consultas(monkeypatch):
+    hechas = []
+    consultar = auth._consultar_usuario
+
+    def contar(client, campo, valor, columnas):
+        hechas.append(campo)
+        return consultar(client, campo, valor, columnas)
+
+    monkeypatch.setattr(auth, "_consultar_usuario", contar)
+    return hechas
+
+
+def test_login_migra_al_hash(cliente, usuarios, cubos):
+    resultado = auth.autenticar(cliente, "jperez", "1234", "10.0.0.1")
+    assert resultado["ok"] and resultado["usuario"]["nombre"] == "JUAN"
+    assert "clave" not in resultado["usuario"]
+    fila = _fila(usuarios, "jperez")
+    assert auth.verificar_clave({"clave_hash": fila["clave_hash"]}, "1234")
+
+
+def test_ola_de_logins_no_llega_a_la_base(cliente, usuarios, cubos, consultas):
+    for _ in range(5):
+        assert auth.autenticar(cliente, "jperez", "1234", "10.0.0.1")["ok"]
+    # Solo el primero: perfil y hash quedan en cache
+    assert consultas == ["usuario"]
+
+
+def test_cache_sin_clave_plana(cliente, usuarios, cubos):
+    auth.autenticar(cliente, "jperez", "1234", "10.0.0.1")
+    perfil = auth._cache_usuarios.get("jperez")
+    assert perfil["nombre"] == "JUAN"
+    assert not set(auth.CAMPOS_CLAVE) & set(perfil)
+    assert auth._cache_hashes.get(perfil["id"]) == _fila(usuarios, "jperez")["clave_hash"]
+
+
+def test_clave_restablecida_en_la_base(cliente, usuarios, cubos, consultas):
+    assert auth.autenticar(cliente, "jperez", "1234", "10.0.0.1")["ok"]
+    # Lo que hace el trigger de sql/005 al editar la clave
+    _fila(usuarios, "jperez").update(clave="nueva", clave_hash=None)
+    # Con el hash anterior en cache la clave nueva falla una vez y el
+    # fallo borra el hash cacheado: el siguiente intento lee la base
+    assert not auth.autenticar(cliente, "jperez", "nueva", "10.0.0.1")["ok"]
+    assert auth.autenticar(cliente, "jperez", "nueva", "10.0.0.1")["ok"]
+    assert consultas == ["usuario", "id"]
+    assert not auth.autenticar(cliente, "jperez", "1234", "10.0.0.1")["ok"]
+
+
+def test_mismo_costo_con_clave_plana_y_sin_usuario(monkeypatch):
+    rellenos = []
+    monkeypatch.setattr(auth, "_verificar_relleno", rellenos.append)
+    auth.verificar_clave({"clave": "1234"}, "1234")
+    auth.verificar_clave({"clave": None}, "x")
+    assert rellenos == ["1234", "x"]
+
+
+def test_usuario_inexistente_o_inactivo(cliente, usuarios, cubos):
+    for usuario in ("nadie", "baja"):
+        resultado = auth.autenticar(cliente, usuario, "1234", "10.0.0.1")
+        assert resultado == {"ok": False, "motivo": "credenciales"}
+    # Se verificó contra el hash de relleno
+    assert auth._hash_relleno
+
+
+def test_solo_los_fallos_bloquean_la_cuenta(cliente, usuarios, cubos, reloj):
+    for _ in range(5):
+        assert auth.autenticar(cliente, "jperez", "1234", "10.0.0.1")["ok"]
+    for _ in range(3):
+        assert auth.autenticar(cliente, "jperez", "mal", "10.0.0.2")["motivo"] == "credenciales"
+    bloqueado = auth.autenticar(cliente, "JPerez", "1234", "10.0.0.1")
+    assert bloqueado["motivo"] == "limite" and bloqueado["espera"] > 0
+    reloj.ahora += 60
+    assert auth.autenticar(cliente, "jperez", "1234", "10.0.0.1")["ok"]
+
+
+def test_login_correcto_reinicia_el_cubo(cliente, usuarios, cubos):
+    for _ in range(2):
+        auth.autenticar(cliente, "jperez", "mal", "10.0.0.1")
+    assert auth.autenticar(cliente, "jperez", "1234", "10.0.0.1")["ok"]
+    for _ in range(2):
+        assert auth.autenticar(cliente, "jperez", "mal", "10.0.0.1")["motivo"] == "credenciales"
+
+
+def test_limite_por_ip(cliente, usuarios, monkeypatch):
+    monkeypatch.setattr(auth, "_cubo_ip", auth.CuboTokens("ip", 2, 1))
+    auth.autenticar(cliente, "jperez", "1234", "10.0.0.1")
+    auth.autenticar(cliente, "otro", "1234", "10.0.0.1")
+    assert auth.autenticar(cliente, "jperez", "1234", "10.0.0.1")["motivo"] == "limite"
+    assert auth.autenticar(cliente, "jperez", "1234", "10.0.0.9")["ok"]
+
+
+@pytest.mark.parametrize("proxies, esperado", [(0, "10.0.0.1"), (1, "200.1.1.1"), (2, "6.6.6.6")])
+def test_ip_cliente_detras_de_proxies(monkeypatch, proxies, esperado):
+    monkeypatch.setattr(auth, "PROXIES_CONFIABLES", proxies)
+    app = Flask(__name__)
+    with app.test_request_context(
+        "/login",
+        environ_base={"REMOTE_ADDR": "10.0.0.1"},
+        # El cliente puede inventar la primera; el router agrega la real al final
+        headers={"X-Forwarded-For": "6.6.6.6, 200.1.1.1"},
+    ) as ctx:
+        assert auth.ip_cliente(ctx.request) == esperado
@@ -0,0 +1,67 @@
+import json
+import logging
+
+import pytest
+from flask import Flask
+
+import bitacora
+
+
+def _registro(nivel=logging.INFO, msg="hola %s", args=("mundo",), **extra):
+    record = logging.LogRecord("prueba", nivel, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_con_request_id_y_extra():
+    with bitacora.contexto("abc-123") as request_id:
+        record = _registro(bytes=1234, etapa="pdf")
+        assert bitacora.FiltroContexto().filter(record)
+    evento = json.loads(bitacora.FormatoJSON().format(record))
+    assert request_id == "abc-123"
+    assert evento["request_id"] == "abc-123"
+    assert (evento["msg"], evento["nivel"], evento["bytes"], evento["etapa"]) == ("hola mundo", "INFO", 1234, "pdf")
+    assert "muestreado" not in evento
+
+
+def test_request_id_invalido_se_reemplaza():
+    with bitacora.contexto("con espacios\ny saltos") as request_id:
+        assert request_id and " " not in request_id
+    assert bitacora.request_id_actual() is None
+
+
+def test_etapas_se_miden_en_el_contexto():
+    with bitacora.contexto():
+        with bitacora.etapa("pdf", tecnicos=3) as info:
+            info["bytes"] = 10
+        with pytest.raises(ValueError):
+            with bitacora.etapa("correo"):
+                raise ValueError("smtp")
+        etapas = bitacora.etapas_actuales()
+    assert set(etapas) == {"pdf", "correo"}
+    assert info["ok"] and info["ms"] >= 0 and info["tecnicos"] == 3
+
+
+def test_muestreo_limita_info_pero_no_warning(monkeypatch):
+    # Todo en el mismo segundo
+    monkeypatch.setattr(bitacora.time, "monotonic", lambda: 1000.5)
+    filtro = bitacora.FiltroMuestreo(max_por_seg=3)
+    info = [filtro.filter(_registro(muestreado=True)) for _ in range(5)]
+    assert info == [True, True, True, False, False]
+    assert filtro.filter(_registro(logging.WARNING, muestreado=True))
+    assert not bitacora.FiltroMuestreo().filter(_registro(muestreado=False))
+
+
+def test_flask_devuelve_el_request_id():
+    app = Flask(__name__)
+    bitacora.configurar_flask(app)
+
+    @app.route("/eco")
+    def eco():
+        return bitacora.request_id_actual()
+
+    cliente = app.test_client()
+    resp = cliente.get("/eco", headers={bitacora.CABECERA_REQUEST_ID: "req-42"})
+    assert resp.headers[bitacora.CABECERA_REQUEST_ID] == "req-42" == resp.get_data(as_text=True)
+    generado = cliente.get("/eco").headers[bitacora.CABECERA_REQUEST_ID]
+    assert generado and generado != "req-42"
@@ -0,0 +1,96 @@
+import pytest
+
+import catalogo
+
+
+@pytest.fixture(autouse=True)
+def catalogo_base(monkeypatch):
+    monkeypatch.setattr(catalogo, "_vigente", catalogo._BASE)
+    monkeypatch.setattr(catalogo, "_error_hasta", 0.0)
+
+
+@pytest.fixture
+def tablas(supabase_falso):
+    base = supabase_falso.base
+    base.sembrar("catalogo_ats_version", [{"version": 7}])
+    base.sembrar("catalogo_epp", [
+        {"id": "casco", "nombre": "Casco", "columna": "Casco", "alias": [], "orden": 2, "activo": True},
+        {"id": "arnes", "nombre": "Arnés", "columna": "Arnes", "alias": ["Cinturón"], "orden": 1, "activo": True},
+        {"id": "viejo", "nombre": "Viejo", "columna": "Viejo", "alias": [], "orden": 3, "activo": False},
+    ])
+    base.sembrar("catalogo_riesgos", [
+        {"id": "altura", "nombre": "Altura", "peligros": "p", "riesgo": "r", "controles": "c",
+         "nivel": "X", "orden": 1, "activo": True},
+    ])
+    return base
+
+
+def _version(base, version):
+    base.tablas["catalogo_ats_version"][0]["version"] = version
+
+
+def test_ids_epp_por_nombre_columna_o_alias():
+    cat = catalogo.Catalogo.base()
+    assert cat.ids_epp(["  ARNES ", "Cinturón de seguridad", "Lentes UV", "Casco", "inventado"]) == {
+        "arnes", "lentes_uv", "casco",
+    }
+    assert cat.ids_epp(None) == set()
+
+
+def test_resolver_riesgos_en_orden_y_genericos():
+    cat = catalogo.Catalogo.base()
+    filas = cat.resolver_riesgos(["contacto electrico", "Otro: lluvia"])
+    assert [f["nombre"] for f in filas] == ["contacto electrico", "Otro: lluvia"]
+    assert (filas[0]["id"], filas[0]["nivel"]) == ("contacto_electrico", "A")
+    assert filas[1]["id"] is None and filas[1]["controles"] == catalogo.RIESGO_GENERICO["controles"]
+
+
+def test_carga_desde_la_base(cliente, tablas):
+    cat = catalogo.obtener(cliente)
+    assert cat.version == 7
+    assert cat.ids_columnas_epp == ["arnes", "casco"]
+    # Nivel inválido en la base: se usa el genérico
+    assert cat.resolver_riesgos(["altura"])[0]["nivel"] == catalogo.RIESGO_GENERICO["nivel"]
+    assert catalogo.vigente() is cat
+
+
+def test_sin_cambio_de_version_no_recarga(cliente, tablas):
+    cat = catalogo.obtener(cliente)
+    tablas.tablas["catalogo_epp"][0]["columna"] = "Casco nuevo"
+    catalogo.invalidar()
+    assert catalogo.obtener(cliente) is cat
+    _version(tablas, 8)
+    catalogo.invalidar()
+    nuevo = catalogo.obtener(cliente)
+    assert nuevo.version == 8 and "Casco nuevo" in nuevo.etiquetas_epp
+
+
+def test_otra_instancia_reutiliza_lo_cargado(cliente, tablas, estado_redis, monkeypatch):
+    cat = catalogo.obtener(cliente)
+    # Otra instancia: arranca con el catálogo base, lee las filas del estado compartido
+    monkeypatch.setattr(catalogo, "_vigente", catalogo._BASE)
+    tablas.tablas.clear()
+    otro = catalogo.obtener(cliente)
+    assert otro is not cat and otro.ids_columnas_epp == cat.ids_columnas_epp
+    assert catalogo.obtener(cliente) is otro
+
+
+def test_sin_version_no_reconstruye_en_cada_request(cliente, supabase_falso):
+    # Sin tablas: catálogo base (versión None)
+    cat = catalogo.obtener(cliente)
+    assert cat.ids_columnas_epp == catalogo._BASE.ids_columnas_epp
+    assert catalogo.obtener(cliente) is cat
+    assert catalogo.obtener(cliente) is cat
+
+
+def test_error_usa_el_vigente_y_espera(cliente, tablas, monkeypatch):
+    class Roto:
+        def table(self, nombre):
+            raise OSError("sin conexión")
+
+    assert catalogo.obtener(Roto()) is catalogo._BASE
+    assert catalogo._error_hasta > 0
+    # Durante la espera no se consulta la base aunque vuelva
+    assert catalogo.obtener(cliente) is catalogo._BASE
+    monkeypatch.setattr(catalogo, "_error_hasta", 0.0)
+    assert catalogo.obtener(cliente).version == 7
@@ -0,0 +1,174 @@
+import httpx
+import pytest
+
+import cliente_supabase
+from cliente_supabase import Circuito, CircuitoAbierto
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+        self.dormido = []
+
+    def monotonic(self):
+        return self.ahora
+
+    def sleep(self, segundos):
+        self.dormido.append(segundos)
+        self.ahora += segundos
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(cliente_supabase, "time", reloj)
+    return reloj
+
+
+@pytest.fixture
+def circuito(monkeypatch):
+    circuito = Circuito("rest", umbral=2, espera=30)
+    monkeypatch.setitem(cliente_supabase._circuitos, "rest", circuito)
+    return circuito
+
+
+def _transporte(respuestas):
+    """
+    TransporteResiliente sobre un MockTransport que va devolviendo
+    `respuestas` (códigos HTTP o excepciones). Devuelve (http, llamadas).
+    """
+    llamadas = []
+    pendientes = list(respuestas)
+
+    def responder(request):
+        llamadas.append(request.method)
+        r = pendientes.pop(0) if len(pendientes) > 1 else pendientes[0]
+        if isinstance(r, Exception):
+            raise r
+        return httpx.Response(r, json=[])
+
+    http = httpx.Client(transport=cliente_supabase.TransporteResiliente(httpx.MockTransport(responder)))
+    return http, llamadas
+
+
+URL = "http://supabase.local/rest/v1/ats_registros_diarios"
+
+
+# =========================
+# CIRCUITO
+# =========================
+def test_circuito_abre_tras_el_umbral(reloj):
+    c = Circuito("rest", umbral=3, espera=30)
+    for _ in range(2):
+        c.permitir()
+        c.fallo("HTTP 503")
+    assert c.estado == Circuito.CERRADO
+    # Un éxito reinicia la cuenta de fallos seguidos
+    c.exito()
+    for _ in range(3):
+        c.permitir()
+        c.fallo("HTTP 503")
+    assert c.abierto
+    with pytest.raises(CircuitoAbierto) as e:
+        c.permitir()
+    assert e.value.espera == pytest.approx(30)
+    assert c.resumen()["rechazadas"] == 1 and c.resumen()["aperturas"] == 1
+
+
+def test_semiabierto_deja_pasar_una_prueba(reloj):
+    c = Circuito("rest", umbral=1, espera=30)
+    c.fallo("timeout")
+    reloj.ahora += 30
+    c.permitir()
+    assert c.estado == Circuito.SEMIABIERTO
+    with pytest.raises(CircuitoAbierto):
+        c.permitir()
+    # La prueba falla: vuelve a abrirse por otros 30 s
+    c.fallo("timeout")
+    assert c.abierto
+    reloj.ahora += 29
+    with pytest.raises(CircuitoAbierto):
+        c.permitir()
+    reloj.ahora += 1
+    c.permitir()
+    c.exito()
+    assert c.estado == Circuito.CERRADO
+    c.permitir()
+
+
+def test_servicio_por_ruta():
+    assert cliente_supabase._servicio("/rest/v1/tabla") == "rest"
+    assert cliente_supabase._servicio("/storage/v1/object/x") == "storage"
+    assert cliente_supabase._servicio("/auth/v1/user") == "otros"
+
+
+# =========================
+# TRANSPORTE
+# =========================
+def test_lectura_se_reintenta_ante_503(reloj, circuito):
+    http, llamadas = _transporte([503, 503, 200])
+    assert http.get(URL).status_code == 200
+    assert llamadas == ["GET"] * 3
+    assert circuito.resumen()["reintentos"] == 2 and circuito.estado == Circuito.CERRADO
+    assert len(reloj.dormido) == 2
+
+
+def test_escritura_no_se_reintenta(reloj, circuito):
+    http, llamadas = _transporte([503, 201])
+    assert http.post(URL, json={}).status_code == 503
+    assert llamadas == ["POST"]
+    assert circuito.resumen()["fallos"] == 1
+
+
+def test_error_de_conexion_agota_reintentos(reloj, circuito):
+    http, llamadas = _transporte([httpx.ConnectError("connection refused")])
+    with pytest.raises(httpx.ConnectError):
+        http.get(URL)
+    assert len(llamadas) == 1 + cliente_supabase.REINTENTOS
+
+
+def test_circuito_abierto_no_llama(reloj, circuito):
+    http, llamadas = _transporte([503])
+    http.post(URL, json={})
+    http.post(URL, json={})
+    assert circuito.abierto
+    with pytest.raises(CircuitoAbierto):
+        http.get(URL)
+    assert len(llamadas) == 2
+    # Un 500 o un 4xx son respuestas del servicio: cierran el circuito
+    http, _ = _transporte([500])
+    reloj.ahora += 30
+    assert http.get(URL).status_code == 500
+    assert circuito.estado == Circuito.CERRADO
+
+
+def test_circuito_abierto_a_traves_del_cliente(supabase_falso, cliente, monkeypatch):
+    c = Circuito("rest", umbral=1, espera=30)
+    c.fallo("prueba")
+    monkeypatch.setitem(cliente_supabase._circuitos, "rest", c)
+    with pytest.raises(CircuitoAbierto):
+        cliente.table("ats_registros_diarios").select("id").execute()
+    assert cliente_supabase.estado()["estado"] == "degradado"
+
+
+# =========================
+# REFERENCIA
+# =========================
+def test_referencia_cachea_y_usa_la_ultima_copia():
+    llamadas = []
+
+    def consulta():
+        llamadas.append(1)
+        return ["T1", "T2"]
+
+    assert cliente_supabase.referencia("tecnicos", consulta) == ["T1", "T2"]
+    assert cliente_supabase.referencia("tecnicos", consulta) == ["T1", "T2"]
+    assert len(llamadas) == 1
+
+    def caida():
+        raise CircuitoAbierto("rest", 30)
+
+    cliente_supabase._referencias.borrar("tecnicos")  # venció el TTL
+    assert cliente_supabase.referencia("tecnicos", caida) == ["T1", "T2"]
+    with pytest.raises(CircuitoAbierto):
+        cliente_supabase.referencia("charlas", caida)
@@ -0,0 +1,124 @@
+import io
+
+import pytest
+from pypdf import PdfReader
+from reportlab.pdfgen import canvas
+
+import consolidado
+
+BUCKET = "ats_pdfs"
+
+
+def _pdf(*textos, logo=True):
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, invariant=1)
+    for texto in textos:
+        if logo:
+            c.drawImage("static/logo_cicsa.png", 50, 700, 120, 40)
+        c.drawString(100, 600, texto)
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def _leer(salida: bytes):
+    # strict: xref, offsets y referencias tienen que estar bien
+    lector = PdfReader(io.BytesIO(salida), strict=True)
+    return lector, [p.extract_text().strip() for p in lector.pages]
+
+
+def _cerrar(escritor, marcadores=()):
+    escritor.cerrar(list(range(len(escritor.paginas))), list(marcadores), {"/Title": "prueba"})
+
+
+def test_une_paginas_en_orden():
+    salida = io.BytesIO()
+    escritor = consolidado.EscritorPDF(salida)
+    assert escritor.agregar_pdf(_pdf("A1", "A2")) == 0
+    assert escritor.agregar_pdf(_pdf("B1")) == 2
+    escritor.cerrar([2, 0, 1], [("B", 2, []), ("A", 0, [("A2", 1, [])])], {"/Title": "prueba"})
+    lector, textos = _leer(salida.getvalue())
+    assert textos == ["B1", "A1", "A2"]
+    assert [m.title for m in lector.outline if not isinstance(m, list)] == ["B", "A"]
+    assert lector.metadata.title == "prueba"
+
+
+def test_streams_repetidos_una_sola_vez():
+    salida = io.BytesIO()
+    escritor = consolidado.EscritorPDF(salida)
+    escritor.agregar_pdf(_pdf("A"))
+    escritos = len(escritor._por_hash)
+    tamano = salida.tell()
+    escritor.agregar_pdf(_pdf("B"))
+    # El logo ya estaba: solo se agrega el contenido de la página nueva
+    assert len(escritor._por_hash) == escritos + 1
+    assert salida.tell() - tamano < tamano / 2
+    _cerrar(escritor)
+    assert _leer(salida.getvalue())[1] == ["A", "B"]
+
+
+def test_reporte_que_falla_a_mitad_no_deja_nada(monkeypatch):
+    salida = io.BytesIO()
+    escritor = consolidado.EscritorPDF(salida)
+    escritor.agregar_pdf(_pdf("A"))
+    tamano, objetos = salida.tell(), len(escritor._offsets)
+
+    convertir = consolidado.EscritorPDF._convertir
+    llamadas = []
+
+    def falla_a_mitad(self, obj, lector, mapa):
+        llamadas.append(1)
+        if len(llamadas) > 5:
+            raise ValueError("objeto corrupto")
+        return convertir(self, obj, lector, mapa)
+
+    monkeypatch.setattr(consolidado.EscritorPDF, "_convertir", falla_a_mitad)
+    with pytest.raises(ValueError):
+        escritor.agregar_pdf(_pdf("B", logo=False))
+    assert (salida.tell(), len(escritor._offsets)) == (tamano, objetos)
+    monkeypatch.setattr(consolidado.EscritorPDF, "_convertir", convertir)
+
+    escritor.agregar_pdf(_pdf("C"))
+    _cerrar(escritor)
+    contenido = salida.getvalue()
+    assert _leer(contenido)[1] == ["A", "C"]
+    assert b"(B)" not in contenido
+
+
+def test_pdf_ilegible_no_escribe():
+    salida = io.BytesIO()
+    escritor = consolidado.EscritorPDF(salida)
+    tamano = salida.tell()
+    with pytest.raises(Exception):
+        escritor.agregar_pdf(b"%PDF-1.4 esto no es un pdf")
+    assert salida.tell() == tamano and escritor.paginas == []
+
+
+def test_consolidado_del_dia(supabase_falso, cliente, tmp_path):
+    base = supabase_falso.base
+    base.sembrar("ats_registros_diarios", [
+        {"fecha": "2025-11-10", "brigada": "B2", "zona": "SUR", "contrata": "CICSA", "pdf_path": "b2.pdf"},
+        {"fecha": "2025-11-10", "brigada": "B1", "zona": "NORTE", "contrata": "CICSA", "pdf_path": "b1.pdf"},
+        {"fecha": "2025-11-10", "brigada": "B3", "zona": "SUR", "contrata": "CICSA", "pdf_path": "falta.pdf"},
+        {"fecha": "2025-11-10", "brigada": "B4", "zona": "SUR", "contrata": "CICSA", "pdf_path": "roto.pdf"},
+        {"fecha": "2025-11-09", "brigada": "B5", "zona": "SUR", "contrata": "CICSA", "pdf_path": "b1.pdf"},
+    ])
+    base.objetos[(BUCKET, "b1.pdf")] = _pdf("REPORTE B1")
+    base.objetos[(BUCKET, "b2.pdf")] = _pdf("REPORTE B2 P1", "REPORTE B2 P2")
+    base.objetos[(BUCKET, "roto.pdf")] = b"no es un pdf"
+
+    destino = tmp_path / "consolidado.pdf"
+    resultado = consolidado.generar_consolidado(cliente, BUCKET, "2025-11-10", str(destino))
+    assert resultado == {"reportes": 4, "incluidos": 2, "paginas": 4}
+
+    lector, textos = _leer(destino.read_bytes())
+    # Índice primero, después los reportes por zona y brigada
+    assert "B3" in textos[0] and "No disponible" in textos[0]
+    assert textos[1:] == ["REPORTE B1", "REPORTE B2 P1", "REPORTE B2 P2"]
+    assert [m.title for m in lector.outline if not isinstance(m, list)] == ["Índice", "Zona NORTE", "Zona SUR"]
+
+
+def test_consolidado_vacio(supabase_falso, cliente):
+    salida = io.BytesIO()
+    assert consolidado.generar_consolidado(cliente, BUCKET, "2025-11-10", salida)["reportes"] == 0
+    assert salida.getvalue() == b""
@@ -0,0 +1,60 @@
+import pytest
+
+import cumplimiento
+from cache_local import CacheTTL
+
+
+@pytest.fixture(autouse=True)
+def caches_vacias(monkeypatch):
+    monkeypatch.setattr(cumplimiento, "_cache_padron", CacheTTL(ttl=60, max_items=1))
+    monkeypatch.setattr(cumplimiento, "_cache_dias", CacheTTL(ttl=60, max_items=400))
+    monkeypatch.setattr(cumplimiento, "_cache_resumen", CacheTTL(ttl=60, max_items=64))
+
+
+def _brigadas(servidor, cantidad, activa=lambda i: True):
+    servidor.base.sembrar("usuarios_brigadas", [
+        {"brigada": f"B{i:04d}", "zona": "NORTE" if i % 2 else "SUR", "contrata": "CICSA", "activo": activa(i)}
+        for i in range(cantidad)
+    ])
+
+
+def test_padron_pagina_mas_alla_de_max_rows(supabase_falso, cliente, monkeypatch):
+    # PostgREST corta cada respuesta en max-rows sin avisar
+    supabase_falso.base.max_filas = 100
+    monkeypatch.setattr(cumplimiento, "FILAS_POR_PAGINA", 100)
+    _brigadas(supabase_falso, 250, activa=lambda i: i % 5 != 0)
+    padron = cumplimiento.obtener_padron(cliente)
+    assert len(padron) == 200
+    assert ("B0001", "CICSA") in padron and ("B0005", "CICSA") not in padron
+
+
+def test_padron_justo_en_el_limite(supabase_falso, cliente, monkeypatch):
+    supabase_falso.base.max_filas = 50
+    monkeypatch.setattr(cumplimiento, "FILAS_POR_PAGINA", 50)
+    _brigadas(supabase_falso, 100)
+    assert len(cumplimiento.obtener_padron(cliente)) == 100
+
+
+def test_resumen_y_registro_incremental(supabase_falso, cliente):
+    _brigadas(supabase_falso, 4)
+    supabase_falso.base.sembrar("ats_registros_diarios", [
+        {"fecha": "2025-11-10", "brigada": "B0000", "zona": "SUR", "contrata": "CICSA",
+         "supervisor": "ANA", "completado": True},
+    ])
+    resumen = cumplimiento.resumen_cumplimiento(cliente, "2025-11-10", "2025-11-10")
+    assert (resumen["esperados"], resumen["completados"]) == (4, 1)
+    assert {g["clave"]: g["completados"] for g in resumen["por_zona"]} == {"NORTE": 0, "SUR": 1}
+
+    cumplimiento.registrar({"fecha": "2025-11-10", "brigada": "B0001", "zona": "NORTE",
+                            "contrata": "CICSA", "supervisor": "ANA", "completado": True})
+    resumen = cumplimiento.resumen_cumplimiento(cliente, "2025-11-10", "2025-11-10")
+    assert resumen["completados"] == 2
+    assert {p["brigada"] for p in resumen["pendientes"]} == {"B0002", "B0003"}
+
+
+def test_rango_invalido():
+    with pytest.raises(ValueError):
+        cumplimiento.normalizar_rango("2025-01-01", "2025-12-31")
+    with pytest.raises(ValueError):
+        cumplimiento.normalizar_rango("ayer", None)
+    assert cumplimiento.normalizar_rango("2025-11-10", "2025-11-01") == ("2025-11-01", "2025-11-10")
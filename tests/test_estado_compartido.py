@@ -0,0 +1,136 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import estado_compartido
+from estado_compartido import CacheCompartida, ErrorEstado
+
+
+@pytest.fixture(params=["memoria", "redis"])
+def backend(request):
+    # Lo que funciona en memoria tiene que funcionar igual con Redis
+    if request.param == "redis":
+        request.getfixturevalue("estado_redis")
+    return request.param
+
+
+@pytest.fixture
+def redis_caido(monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+    monkeypatch.setattr(estado_compartido, "_backend", estado_compartido.EstadoRedis(f"redis://127.0.0.1:{puerto}"))
+
+
+def test_valores_json_y_claves_tupla(backend):
+    estado_compartido.guardar(("historial", "2025-11-10", 3), {"items": [1, 2], "texto": "ñandú"})
+    assert estado_compartido.obtener(("historial", "2025-11-10", 3)) == {"items": [1, 2], "texto": "ñandú"}
+    assert estado_compartido.obtener("no-existe", default=[]) == []
+    estado_compartido.borrar(("historial", "2025-11-10", 3))
+    assert estado_compartido.obtener(("historial", "2025-11-10", 3)) is None
+
+
+def test_ttl(backend):
+    estado_compartido.guardar("corta", 1, ttl=0.05)
+    estado_compartido.guardar("larga", 2, ttl=60)
+    time.sleep(0.1)
+    assert estado_compartido.obtener("corta") is None
+    assert estado_compartido.obtener("larga") == 2
+
+
+def test_reclamar_una_sola_vez(backend):
+    assert estado_compartido.reclamar("envio:abc", ttl=0.1, valor="instancia-1")
+    assert not estado_compartido.reclamar("envio:abc", ttl=0.1, valor="instancia-2")
+    assert estado_compartido.obtener("envio:abc") == "instancia-1"
+    time.sleep(0.15)
+    # Vencido el TTL se puede volver a reclamar
+    assert estado_compartido.reclamar("envio:abc", ttl=60)
+
+
+def test_reclamar_concurrente(backend):
+    ganadores = []
+    barrera = threading.Barrier(8)
+
+    def intentar(i):
+        barrera.wait()
+        if estado_compartido.reclamar("tarea:corte", ttl=60, valor=i):
+            ganadores.append(i)
+
+    hilos = [threading.Thread(target=intentar, args=(i,)) for i in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert len(ganadores) == 1
+
+
+def test_actualizar_concurrente_no_pierde_escrituras(backend):
+    def sumar():
+        for _ in range(20):
+            estado_compartido.actualizar("contador", lambda v: (v or 0) + 1, ttl=60)
+
+    hilos = [threading.Thread(target=sumar) for _ in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert estado_compartido.obtener("contador") == 80
+
+
+def test_listas_en_orden(backend):
+    assert estado_compartido.empujar("cola", [{"n": 1}, {"n": 2}]) == 2
+    assert estado_compartido.empujar("cola", [{"n": 0}, {"n": 0.5}], al_inicio=True) == 4
+    assert estado_compartido.empujar("cola", []) == 4
+    assert estado_compartido.largo("cola") == 4
+    assert [v["n"] for v in estado_compartido.tomar_lista("cola")] == [0, 0.5, 1, 2]
+    assert estado_compartido.tomar_lista("cola") == []
+    assert estado_compartido.largo("cola") == 0
+
+
+def test_conjuntos(backend):
+    for sup in ["ANA", "LUIS", "ANA", "JOSÉ"]:
+        estado_compartido.agregar_miembro("supervisores", sup)
+    assert estado_compartido.miembros("supervisores") == {"ANA", "LUIS", "JOSÉ"}
+    assert estado_compartido.miembros("vacio") == set()
+
+
+def test_cache_compartida(backend):
+    cache = CacheCompartida("prueba", ttl=60)
+    assert cache.obtener_o_calcular(("a", 1), lambda: [1, 2]) == [1, 2]
+    assert cache.obtener_o_calcular(("a", 1), lambda: pytest.fail("no debía recalcular")) == [1, 2]
+    cache.borrar(("a", 1))
+    assert cache.get(("a", 1)) is None
+    with pytest.raises(RuntimeError):
+        cache.limpiar()
+
+
+def test_cache_limpiable(backend):
+    cache = CacheCompartida("historial", ttl=60, limpiable=True)
+    otra = CacheCompartida("historial", ttl=60, limpiable=True)  # la de otra instancia
+    cache.set("pagina", [1])
+    assert otra.get("pagina") == [1]
+    otra.limpiar()
+    assert cache.get("pagina") is None
+
+
+def test_prefijo_separa_apps(estado_redis, monkeypatch):
+    estado_compartido.guardar("clave", 1)
+    assert estado_redis.base.datos[b"ats:clave"] == b"1"
+    monkeypatch.setattr(estado_compartido, "_prefijo", "otra:")
+    assert estado_compartido.obtener("clave") is None
+
+
+def test_redis_caido(redis_caido):
+    cache = CacheCompartida("prueba", ttl=60)
+    # Las caches se comportan como vacías
+    assert cache.obtener_o_calcular("x", lambda: 5) == 5
+    assert cache.get("x", "vacio") == "vacio"
+    cache.borrar("x")
+    # El resto de las operaciones avisa
+    with pytest.raises(ErrorEstado):
+        estado_compartido.reclamar("envio:abc", ttl=60)
+    with pytest.raises(ErrorEstado):
+        estado_compartido.empujar("cola", [1])
+    assert estado_compartido.estado()["ok"] is False
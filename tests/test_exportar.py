@@ -0,0 +1,84 @@
+import csv
+import io
+import logging
+from datetime import date
+
+import pytest
+
+import exportar
+
+
+@pytest.fixture
+def registros(supabase_falso):
+    supabase_falso.base.sembrar("ats_registros_diarios", [
+        {
+            "fecha": f"2025-11-{1 + i % 10:02d}",
+            "brigada": f"BRIGADA Ñ {i}",
+            "zona": "NORTE",
+            "contrata": "CICSA",
+            "tecnicos_count": i % 4,
+            "completado": True,
+        }
+        for i in range(23)
+    ])
+    return supabase_falso
+
+
+def test_lotes_por_keyset_cubren_todo(cliente, registros):
+    lotes = list(exportar.iterar_lotes(cliente, {}, tamano_lote=5))
+    assert [len(lote) for lote in lotes] == [5, 5, 5, 5, 3]
+    ids = [f["id"] for lote in lotes for f in lote]
+    assert sorted(ids) == list(range(1, 24)) and len(set(ids)) == 23
+
+
+def test_lote_exacto_termina_sin_lote_vacio(cliente, registros):
+    # 13 filas del 1 al 5 de noviembre en un lote de 13: la consulta
+    # siguiente vuelve vacía y no se entrega un lote vacío
+    lotes = list(exportar.iterar_lotes(cliente, {"desde": "2025-11-01", "hasta": "2025-11-05"}, tamano_lote=13))
+    assert [len(lote) for lote in lotes] == [13]
+
+
+def test_csv_con_bom_y_un_trozo_por_lote():
+    lotes = [[{"id": 1, "brigada": "CAÑETE"}], [{"id": 2, "brigada": "B2", "extra": "x"}]]
+    trozos = list(exportar.generar_csv(iter(lotes)))
+    assert len(trozos) == 2
+    texto = b"".join(trozos).decode("utf-8")
+    assert texto.startswith("﻿")
+    filas = list(csv.DictReader(io.StringIO(texto.lstrip("﻿"))))
+    assert [f["brigada"] for f in filas] == ["CAÑETE", "B2"]
+    assert list(filas[0]) == exportar.CAMPOS
+
+
+def test_exportacion_csv_completa(cliente, registros):
+    texto = b"".join(exportar.generar_exportacion(cliente, {}, "csv")).decode("utf-8")
+    assert len(list(csv.DictReader(io.StringIO(texto.lstrip("﻿"))))) == 23
+
+
+def test_parquet_un_row_group_por_lote(cliente, registros):
+    pq = pytest.importorskip("pyarrow.parquet")
+    datos = b"".join(exportar.generar_parquet(exportar.iterar_lotes(cliente, {}, tamano_lote=10)))
+    tabla = pq.read_table(io.BytesIO(datos))
+    assert tabla.num_rows == 23
+    assert pq.ParquetFile(io.BytesIO(datos)).num_row_groups == 3
+    assert str(tabla.schema.field("fecha").type) == "date32[day]"
+    assert min(tabla.column("fecha").to_pylist()) == date(2025, 11, 1)
+
+
+def test_error_a_mitad_de_camino_corta_la_exportacion(cliente, registros, monkeypatch, caplog):
+    iterar = exportar.iterar_lotes
+
+    def lotes_que_fallan(*args, **kwargs):
+        lotes = iterar(*args, **kwargs, tamano_lote=10)
+        yield next(lotes)
+        raise RuntimeError("timeout leyendo el lote 2")
+
+    monkeypatch.setattr(exportar, "iterar_lotes", lotes_que_fallan)
+    trozos = exportar.generar_exportacion(cliente, {"zona": "NORTE"}, "csv")
+    assert next(trozos)
+    with caplog.at_level(logging.ERROR, logger="exportar"), pytest.raises(RuntimeError):
+        list(trozos)
+    assert "Exportación interrumpida" in caplog.text
+
+
+def test_nombre_archivo():
+    assert exportar.nombre_archivo({"desde": "2025-01-01"}, "csv") == "ats_registros_2025-01-01_hoy.csv"
@@ -0,0 +1,143 @@
+import io
+import os
+import re
+from pathlib import Path
+
+import pytest
+from PIL import Image
+from pypdf import PdfReader
+
+import generate_pdf
+
+
+def _foto(ruta, ancho=2400, alto=1800):
+    # Ruido: el JPEG no lo puede comprimir, como una foto real de campo
+    Image.frombytes("RGB", (ancho, alto), os.urandom(ancho * alto * 3)).save(ruta, "JPEG", quality=92)
+    return str(ruta)
+
+
+def _firma(ruta):
+    Image.new("RGB", (300, 100), "white").save(ruta, "PNG")
+    return str(ruta)
+
+
+def _data(tmp_path, tecnicos=1, foto=None):
+    return {
+        "fecha_dia": "2025-11-10",
+        "actividad": "Empalme de fibra",
+        "supervisor": "ANA",
+        "riesgos": ["Trabajo en altura"],
+        "tecnicos": [
+            {"item": i + 1, "usuario": f"t{i}", "nombre": f"TECNICO {i + 1:02d}", "dni": f"{i:08d}",
+             "epp": ["Casco de seguridad"], "firma_path": _firma(tmp_path / f"firma{i}.png"),
+             "foto_path": foto}
+            for i in range(tecnicos)
+        ],
+        "foto_path": None,
+    }
+
+
+@pytest.fixture(scope="module")
+def foto_grande(tmp_path_factory):
+    return _foto(tmp_path_factory.mktemp("fotos") / "grande.jpg")
+
+
+def test_dentro_del_limite_reduce_las_fotos(tmp_path, foto_grande):
+    assert os.path.getsize(foto_grande) > 1024 * 1024
+    destino = io.BytesIO()
+    resultado = generate_pdf.generar_pdf_con_limite(
+        _data(tmp_path, 2, foto_grande), 600 * 1024, destino=destino, limpiar=False
+    )
+    assert resultado["dentro_limite"]
+    assert resultado["nivel"] > 0
+    assert resultado["bytes"] == len(destino.getvalue()) <= 600 * 1024
+    assert len(PdfReader(destino).pages) >= 1
+    # limpiar=False no toca los archivos de entrada
+    assert os.path.exists(foto_grande)
+
+
+def test_sin_necesidad_no_recomprime(tmp_path):
+    foto = _foto(tmp_path / "chica.jpg", 200, 150)
+    resultado = generate_pdf.generar_pdf_con_limite(
+        _data(tmp_path, 1, foto), 10 * 1024 * 1024, destino=io.BytesIO()
+    )
+    assert resultado["nivel"] == 0 and resultado["dentro_limite"]
+    # limpiar=True (por defecto) borra los temporales
+    assert not os.path.exists(foto)
+
+
+def test_limite_imposible_guarda_el_mas_chico(tmp_path, foto_grande):
+    destino = tmp_path / "ats.pdf"
+    resultado = generate_pdf.generar_pdf_con_limite(
+        _data(tmp_path, 1, foto_grande), 10 * 1024, destino=str(destino), limpiar=False
+    )
+    assert not resultado["dentro_limite"]
+    assert resultado["nivel"] == len(generate_pdf.NIVELES_FOTO) - 1
+    assert destino.stat().st_size == resultado["bytes"]
+
+
+def test_invariante_da_los_mismos_bytes(tmp_path):
+    data = _data(tmp_path, 2)
+    primero = io.BytesIO()
+    segundo = io.BytesIO()
+    generate_pdf.generar_pdf(data, primero, invariante=True, limpiar=False)
+    generate_pdf.generar_pdf(data, segundo, invariante=True, limpiar=False)
+    assert primero.getvalue() == segundo.getvalue()
+
+
+def _texto(pdf_bytes):
+    return [pagina.extract_text() for pagina in PdfReader(io.BytesIO(pdf_bytes)).pages]
+
+
+@pytest.mark.parametrize("tecnicos", [1, 25, 60])
+def test_cualquier_cantidad_de_participantes(tmp_path, tecnicos):
+    foto = _foto(tmp_path / "foto.jpg", 80, 60)
+    destino = io.BytesIO()
+    generate_pdf.generar_pdf(_data(tmp_path, tecnicos, foto), destino, invariante=True, limpiar=False)
+    paginas = _texto(destino.getvalue())
+    texto = "\n".join(paginas)
+    for i in range(tecnicos):
+        assert f"TECNICO {i + 1:02d}" in texto
+    # "X de Y" en cada página, con el total real (Y es un XObject aparte)
+    total = len(paginas)
+    assert all(re.search(rf"\b{n} de\s+{total}\b", p) for n, p in enumerate(paginas, start=1))
+    if tecnicos > 1:
+        assert total > 1
+
+
+def test_foto_general_una_sola_vez(tmp_path):
+    data = _data(tmp_path, 8)
+    data["foto_path"] = _foto(tmp_path / "general.jpg", 80, 60)
+    destino = io.BytesIO()
+    generate_pdf.generar_pdf(data, destino, invariante=True, limpiar=False)
+    imagenes = sum(len(p.images) for p in PdfReader(destino).pages)
+    # 8 firmas + logo + la foto general (no una por técnico)
+    assert imagenes <= 8 + 2
+
+
+def test_fotos_en_memoria_sin_decodificar_a_rgb(tmp_path, monkeypatch):
+    # reportlab decodifica a RGB (y retiene) las imágenes que no incrusta
+    # tal cual: con fotos de 1600 px eran ~6 MB por foto hasta el final
+    decodificadas = []
+    original = generate_pdf.ImageReader.getRGBData
+
+    def contar(self):
+        decodificadas.append(self.jpeg_fh() is not None)
+        return original(self)
+
+    monkeypatch.setattr(generate_pdf.ImageReader, "getRGBData", contar)
+    foto = Path(_foto(tmp_path / "foto.jpg", 1200, 900)).read_bytes()
+    data = _data(tmp_path, 3, foto)
+    data["tecnicos"][1]["foto_path"] = Path(_foto(tmp_path / "otra.jpg", 1200, 900)).read_bytes()
+    destino = io.BytesIO()
+    resultado = generate_pdf.generar_pdf_con_limite(data, 1, destino=destino, limpiar=False)
+    assert resultado["nivel"] == len(generate_pdf.NIVELES_FOTO) - 1
+    assert True not in decodificadas
+    jpeg = [
+        x.get_object() for p in PdfReader(destino).pages
+        for x in p["/Resources"].get("/XObject", {}).values()
+        if "/DCTDecode" in str(x.get_object().get("/Filter"))
+    ]
+    # Dos fotos distintas, la repetida una sola vez, reducidas al último nivel
+    assert len(jpeg) == 2
+    assert max(o["/Width"] for o in jpeg) <= generate_pdf.NIVELES_FOTO[-1][0]
@@ -0,0 +1,83 @@
+from datetime import date
+
+import historial
+
+
+def _sembrar(servidor, cantidad, fecha="2025-11-0{}"):
+    servidor.base.sembrar("ats_registros_diarios", [
+        {
+            "fecha": fecha.format(1 + i % 3),
+            "brigada": f"B{i:03d}",
+            "zona": "NORTE" if i % 2 else "SUR",
+            "contrata": "CICSA",
+            "completado": True,
+        }
+        for i in range(cantidad)
+    ])
+
+
+def test_cursor_ida_y_vuelta():
+    cursor = historial.codificar_cursor("2025-11-09", 123)
+    assert historial.decodificar_cursor(cursor) == ("2025-11-09", 123)
+
+
+def test_cursor_invalido_es_none():
+    assert historial.decodificar_cursor("no-es-un-cursor") is None
+    assert historial.decodificar_cursor(historial.codificar_cursor("9999-99-99", 1)) is None
+    assert historial.decodificar_cursor("") is None
+
+
+def test_leer_filtros():
+    filtros = historial.leer_filtros({
+        "desde": "2025-11-01", "hasta": "mal", "zona": " NORTE ", "brigada": "",
+    })
+    assert filtros == {"desde": "2025-11-01", "zona": "NORTE"}
+
+
+def test_rango_semana_empieza_el_lunes():
+    assert historial.rango_rapido("semana", date(2025, 11, 13)) == ("2025-11-10", "2025-11-13")
+    assert historial.rango_rapido("hoy", date(2025, 11, 13)) == ("2025-11-13", "2025-11-13")
+
+
+def test_paginas_por_keyset_sin_repetir(supabase_falso, cliente):
+    _sembrar(supabase_falso, 25)
+    vistos = []
+    cursor = None
+    while True:
+        pagina = historial.buscar_registros(cliente, {}, cursor=cursor, limite=10)
+        vistos.extend(r["id"] for r in pagina["items"])
+        cursor = pagina["siguiente"]
+        if not cursor:
+            break
+    assert sorted(vistos) == list(range(1, 26))
+    assert len(vistos) == len(set(vistos))
+    orden = [(r["fecha"], r["id"]) for r in supabase_falso.base.seleccionar("ats_registros_diarios", [])]
+    esperado = [i for _, i in sorted(orden, reverse=True)]
+    assert vistos == esperado
+
+
+def test_filtro_exacto(supabase_falso, cliente):
+    _sembrar(supabase_falso, 10)
+    items = historial.buscar_registros(cliente, {"zona": "NORTE"})["items"]
+    assert items and all(r["zona"] == "NORTE" for r in items)
+
+
+def test_invalidar_cache_muestra_registros_nuevos(supabase_falso, cliente):
+    _sembrar(supabase_falso, 3)
+    assert len(historial.buscar_registros(cliente, {})["items"]) == 3
+    _sembrar(supabase_falso, 1)
+    # Cacheado: todavía no aparece
+    assert len(historial.buscar_registros(cliente, {})["items"]) == 3
+    historial.invalidar_cache()
+    assert len(historial.buscar_registros(cliente, {})["items"]) == 4
+
+
+def test_sin_columna_payload_path_reintenta_sin_ella(supabase_falso, cliente, monkeypatch):
+    # Base sin sql/004 aplicado: la consulta con payload_path falla con 42703
+    monkeypatch.setattr(historial, "_sin_columna_payload_hasta", 0.0)
+    supabase_falso.base.columnas_faltantes = {"ats_registros_diarios": {"payload_path"}}
+    _sembrar(supabase_falso, 3)
+    items = historial.buscar_registros(cliente, {})["items"]
+    assert len(items) == 3
+    assert all(not r.get("payload_path") for r in items)
+    assert historial._sin_columna_payload_hasta > 0
@@ -0,0 +1,89 @@
+import gzip
+import os
+
+import pytest
+from flask import Flask, url_for
+
+import http_cache
+from cache_local import CacheBytesLRU
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    (tmp_path / "app.css").write_text("body { color: #002b5c; }\n" * 100)
+    monkeypatch.setattr(http_cache, "_huellas", {})
+    monkeypatch.setattr(http_cache, "_estaticos_comprimidos", CacheBytesLRU(1024 * 1024))
+    app = Flask(__name__, static_folder=str(tmp_path), static_url_path="/static")
+    http_cache.configurar_http_cache(app)
+
+    @app.route("/pagina")
+    def pagina():
+        return "<p>hola</p>" * 200
+
+    return app
+
+
+def _url_estatico(app, filename):
+    with app.test_request_context():
+        return url_for("static", filename=filename)
+
+
+def test_url_for_agrega_huella(app):
+    url = _url_estatico(app, "app.css")
+    huella = http_cache.huella_estatico(app.static_folder, "app.css")
+    assert url == f"/static/app.css?v={huella}"
+
+
+def test_huella_vigente_es_inmutable(app):
+    resp = app.test_client().get(_url_estatico(app, "app.css"))
+    assert resp.status_code == 200
+    assert resp.cache_control.immutable
+    assert resp.cache_control.max_age == http_cache.UN_ANIO
+
+
+@pytest.mark.parametrize("query", ["", "?v=inventada", "?v=000000000000"])
+def test_sin_huella_vigente_se_revalida(app, query):
+    resp = app.test_client().get("/static/app.css" + query)
+    assert resp.status_code == 200
+    assert not resp.cache_control.immutable
+    assert resp.cache_control.max_age == http_cache.UNA_HORA
+
+
+def test_huella_vieja_deja_de_ser_inmutable(app, tmp_path):
+    url = _url_estatico(app, "app.css")
+    css = tmp_path / "app.css"
+    css.write_text("body { color: red; }\n" * 100)
+    # mtime distinto aunque la prueba corra en el mismo segundo
+    stat = css.stat()
+    os.utime(css, (stat.st_atime, stat.st_mtime + 10))
+    resp = app.test_client().get(url)
+    assert not resp.cache_control.immutable
+
+
+def test_estatico_comprimido_se_reutiliza(app):
+    cliente = app.test_client()
+    url = _url_estatico(app, "app.css")
+    primera = cliente.get(url, headers={"Accept-Encoding": "gzip"})
+    assert primera.headers["Content-Encoding"] == "gzip"
+    assert len(http_cache._estaticos_comprimidos) == 1
+    segunda = cliente.get(url, headers={"Accept-Encoding": "gzip"})
+    assert gzip.decompress(segunda.data) == gzip.decompress(primera.data)
+    assert len(http_cache._estaticos_comprimidos) == 1
+
+
+def test_cache_de_comprimidos_acotada(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(http_cache, "_estaticos_comprimidos", CacheBytesLRU(200))
+    cliente = app.test_client()
+    for i in range(5):
+        (tmp_path / f"f{i}.css").write_text(f"/* {i} */" + "a { b: c; }\n" * 300)
+        cliente.get(_url_estatico(app, f"f{i}.css"), headers={"Accept-Encoding": "gzip"})
+    assert http_cache._estaticos_comprimidos.bytes_usados <= 200
+
+
+def test_pagina_html_con_etag_y_304(app):
+    cliente = app.test_client()
+    resp = cliente.get("/pagina")
+    assert resp.headers.get("ETag")
+    assert resp.cache_control.no_cache
+    otra = cliente.get("/pagina", headers={"If-None-Match": resp.headers["ETag"]})
+    assert otra.status_code == 304
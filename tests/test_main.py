@@ -0,0 +1,150 @@
+import glob
+import os
+
+import pytest
+
+import estado_compartido
+
+
+@pytest.fixture(scope="module")
+def main():
+    # main.py crea el cliente al importarse; en cada prueba se reemplaza
+    # por el del servidor falso
+    valores = {"SUPABASE_URL": "http://127.0.0.1:9", "SUPABASE_ANON_KEY": "clave-de-prueba"}
+    anteriores = {k: os.environ.get(k) for k in valores}
+    os.environ.update(valores)
+    try:
+        import main
+    finally:
+        for k, v in anteriores.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+    main.app.testing = True
+    return main
+
+
+@pytest.fixture
+def app(main, supabase_falso, cliente, monkeypatch):
+    monkeypatch.setattr(main, "supabase", cliente)
+    monkeypatch.setattr(main, "SUPABASE_URL", supabase_falso.url)
+    monkeypatch.setattr(main, "enviar_correo", lambda *a, **k: True)
+    supabase_falso.base.sembrar("usuarios_brigadas", [
+        {"usuario": "t1", "nombre": "TECNICO UNO", "brigada": "B1", "zona": "NORTE",
+         "contrata": "CICSA", "activo": True},
+    ])
+    return main.app
+
+
+@pytest.fixture
+def navegador(app):
+    cliente_web = app.test_client()
+    with cliente_web.session_transaction() as sesion:
+        sesion["usuario"] = {"id": 1, "usuario": "jefe", "brigada": "B1", "zona": "NORTE", "contrata": "CICSA"}
+    return cliente_web
+
+
+FORMULARIO = {
+    "envio_id": "e7f1c2",
+    "fecha_dia": "2025-11-10",
+    "trabajo": "Empalme",
+    "supervisor": "ANA",
+    "tec1": "t1",
+    "riesgos[]": ["Caídas a distinto nivel"],
+}
+CLAVE_ENVIO = "formulario:envio:e7f1c2"
+
+
+def _registros(supabase_falso):
+    return supabase_falso.base.seleccionar("ats_registros_diarios", [])
+
+
+def test_envio_repetido_se_procesa_una_vez(navegador, supabase_falso):
+    primera = navegador.post("/formulario", data=FORMULARIO)
+    assert primera.status_code == 200
+    segunda = navegador.post("/formulario", data=FORMULARIO)
+    assert segunda.status_code == 200
+    assert len(_registros(supabase_falso)) == 1
+    # El reenvío muestra el resultado del envío original
+    assert "enviado por correo y registrado" in segunda.get_data(as_text=True)
+
+
+@pytest.mark.parametrize("modo_email", ["individual", "resumen"])
+def test_pdf_temporal_se_borra(navegador, main, supabase_falso, monkeypatch, modo_email):
+    adjuntos = []
+    monkeypatch.setattr(main, "enviar_correo", lambda pdf_path, *a: adjuntos.append(os.path.isfile(pdf_path)) or True)
+    monkeypatch.setattr(main.resumen_correos, "MODO_EMAIL", modo_email)
+    monkeypatch.setattr(main.resumen_correos, "MAX_REPORTES", 0)
+    navegador.post("/formulario", data=FORMULARIO)
+
+    subidos = [p for (_, p) in supabase_falso.base.objetos if p.endswith(".pdf")]
+    assert len(subidos) == 1 and os.path.basename(subidos[0]).startswith("ATS_")
+    if modo_email == "resumen":
+        # Queda en temp/ hasta que sale el resumen del supervisor
+        pendientes = main.resumen_correos.tomar_pendientes()["ANA"]
+        assert os.path.dirname(pendientes[0]["pdf_path"]) == "temp"
+        main.resumen_correos._borrar_pdfs(pendientes)
+    else:
+        assert adjuntos == [True]
+    assert glob.glob(os.path.join("temp", "ATS_*.pdf")) == []
+
+
+def test_envio_en_proceso_en_otra_instancia(navegador, supabase_falso):
+    assert estado_compartido.reclamar(CLAVE_ENVIO, 600, {"mensaje": None})
+    resp = navegador.post("/formulario", data=FORMULARIO)
+    assert "ya se está procesando" in resp.get_data(as_text=True)
+    assert _registros(supabase_falso) == []
+
+
+@pytest.mark.parametrize("con_redis", [False, True])
+def test_envio_fallido_libera_el_reclamo(navegador, main, supabase_falso, monkeypatch, request, con_redis):
+    if con_redis:
+        request.getfixturevalue("estado_redis")
+
+    def falla(*args, **kwargs):
+        raise RuntimeError("sin espacio en disco")
+
+    generar = main.generar_pdf_con_limite
+    monkeypatch.setattr(main, "generar_pdf_con_limite", falla)
+    with pytest.raises(RuntimeError):
+        navegador.post("/formulario", data=FORMULARIO)
+    assert estado_compartido.obtener(CLAVE_ENVIO) is None
+
+    # Reintento del mismo formulario: se procesa, una sola vez
+    monkeypatch.setattr(main, "generar_pdf_con_limite", generar)
+    resp = navegador.post("/formulario", data=FORMULARIO)
+    assert "ya se está procesando" not in resp.get_data(as_text=True)
+    assert len(_registros(supabase_falso)) == 1
+    assert estado_compartido.obtener(CLAVE_ENVIO)["mensaje"]
+
+
+def test_pdf_ats_304_sin_renderizar(navegador, main, supabase_falso, monkeypatch):
+    supabase_falso.base.sembrar("ats_registros_diarios", [
+        {"id": 7, "fecha": "2025-11-10", "brigada": "B1", "payload_path": "ats/x.json.gz"},
+    ])
+
+    def falla(*args, **kwargs):
+        raise AssertionError("no debe renderizar")
+
+    monkeypatch.setattr(main.ats_payload, "obtener_pdf", falla)
+    etag = main.ats_payload.etag_payload("ats/x.json.gz")
+    resp = navegador.get("/ats/7/pdf", headers={"If-None-Match": f'"{etag}"'})
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == f'"{etag}"'
+
+
+def test_consolidado_web_con_tope(navegador, main, supabase_falso, monkeypatch):
+    supabase_falso.base.sembrar("ats_registros_diarios", [
+        {"fecha": "2025-11-10", "brigada": f"B{i}", "zona": "NORTE", "pdf_path": f"b{i}.pdf"}
+        for i in range(3)
+    ])
+
+    def falla(*args, **kwargs):
+        raise AssertionError("no debe armar el consolidado")
+
+    monkeypatch.setattr(main.consolidado, "MAX_REPORTES_WEB", 2)
+    monkeypatch.setattr(main.consolidado, "generar_consolidado", falla)
+    resp = navegador.get("/consolidado?fecha=2025-11-10")
+    assert resp.status_code == 400
+    assert "consolidado.py" in resp.get_data(as_text=True)
@@ -0,0 +1,106 @@
+import contextlib
+
+import httpx
+import pytest
+
+import cumplimiento
+import estado_compartido
+import recordatorios
+from cache_local import CacheTTL
+
+
+@pytest.fixture(autouse=True)
+def caches_vacias(monkeypatch):
+    monkeypatch.setattr(cumplimiento, "_cache_padron", CacheTTL(ttl=60, max_items=1))
+
+
+@pytest.fixture
+def correos(monkeypatch):
+    enviados = []
+    monkeypatch.setattr(recordatorios, "SesionSMTP", contextlib.nullcontext)
+    monkeypatch.setattr(
+        recordatorios, "enviar_recordatorio_faltantes",
+        lambda supervisor, fecha, brigadas, sesion: enviados.append((supervisor, fecha, len(brigadas))) or True,
+    )
+    return enviados
+
+
+@pytest.fixture
+def padron(supabase_falso):
+    supabase_falso.base.sembrar("usuarios_brigadas", [
+        {"brigada": f"B{i}", "zona": "NORTE", "contrata": "CICSA", "activo": True} for i in range(5)
+    ])
+    supabase_falso.base.sembrar("ats_registros_diarios", [
+        # Días anteriores: supervisor habitual de cada brigada
+        {"fecha": "2025-11-09", "brigada": "B0", "contrata": "CICSA", "supervisor": "ANA", "completado": True},
+        {"fecha": "2025-11-09", "brigada": "B1", "contrata": "CICSA", "supervisor": "ANA", "completado": True},
+        {"fecha": "2025-11-09", "brigada": "B2", "contrata": "CICSA", "supervisor": "LUIS", "completado": True},
+        # Hoy solo B0 registró
+        {"fecha": "2025-11-10", "brigada": "B0", "contrata": "CICSA", "supervisor": "ANA", "completado": True},
+    ])
+
+
+def test_faltantes_sin_rpc_con_supervisor_habitual(cliente, padron):
+    faltantes = recordatorios.brigadas_sin_ats(cliente, "2025-11-10")
+    grupos = recordatorios.agrupar_por_supervisor(faltantes)
+    assert {s: sorted(b["brigada"] for b in bs) for s, bs in grupos.items()} == {
+        "ANA": ["B1"],
+        "LUIS": ["B2"],
+        cumplimiento.SIN_SUPERVISOR: ["B3", "B4"],
+    }
+
+
+def test_un_correo_por_supervisor(cliente, padron, correos):
+    resultado = recordatorios.ejecutar_barrido(cliente, "2025-11-10")
+    assert resultado["faltantes"] == 4
+    assert resultado["enviados"] == 3
+    assert sorted(correos) == sorted([
+        ("ANA", "2025-11-10", 1), ("LUIS", "2025-11-10", 1), (cumplimiento.SIN_SUPERVISOR, "2025-11-10", 2),
+    ])
+
+
+def test_cada_corte_se_envia_una_sola_vez(cliente, padron, correos):
+    primero = recordatorios.ejecutar_barrido(cliente, "2025-11-10", "09:30")
+    repetido = recordatorios.ejecutar_barrido(cliente, "2025-11-10", "09:30")
+    otro_corte = recordatorios.ejecutar_barrido(cliente, "2025-11-10", "11:00")
+    assert primero["enviados"] == 3
+    assert repetido == {"fecha": "2025-11-10", "corte": "09:30", "omitido": True}
+    assert otro_corte["enviados"] == 3
+    assert len(correos) == 6
+
+
+def test_solo_listar_no_envia(cliente, padron, correos):
+    resultado = recordatorios.ejecutar_barrido(cliente, "2025-11-10", enviar=False)
+    assert resultado["supervisores"] == 3 and resultado["enviados"] == 0
+    assert correos == []
+
+
+def test_sin_sesion_smtp_libera_el_corte(cliente, padron, correos, monkeypatch):
+    def sin_servidor():
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(recordatorios, "SesionSMTP", sin_servidor)
+    resultado = recordatorios.ejecutar_barrido(cliente, "2025-11-10", "09:30")
+    assert resultado["enviados"] == 0 and resultado["errores"] == 3
+    assert estado_compartido.obtener("recordatorios:corte:2025-11-10:09:30") is None
+
+    # El reintento del mismo corte sí envía
+    monkeypatch.setattr(recordatorios, "SesionSMTP", contextlib.nullcontext)
+    assert recordatorios.ejecutar_barrido(cliente, "2025-11-10", "09:30")["enviados"] == 3
+
+
+def test_error_de_la_rpc_no_cae_al_calculo_en_memoria(padron, monkeypatch):
+    class _Cliente:
+        def rpc(self, nombre, argumentos):
+            return self
+
+        def execute(self):
+            raise httpx.ReadTimeout("timeout")
+
+    def en_memoria(*args):
+        raise AssertionError("no debe calcular en memoria")
+
+    monkeypatch.setattr(recordatorios, "_faltantes_sin_rpc", en_memoria)
+    with pytest.raises(httpx.ReadTimeout):
+        recordatorios.ejecutar_barrido(_Cliente(), "2025-11-10", "09:30")
+    assert estado_compartido.obtener("recordatorios:corte:2025-11-10:09:30") is None
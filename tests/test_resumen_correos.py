@@ -0,0 +1,105 @@
+import contextlib
+import threading
+
+import pytest
+
+import resumen_correos
+
+
+@pytest.fixture(params=["memoria", "redis"])
+def backend(request, monkeypatch):
+    # La cola tiene que comportarse igual en una instancia que en varias
+    if request.param == "redis":
+        request.getfixturevalue("estado_redis")
+    monkeypatch.setattr(resumen_correos, "MAX_REPORTES", 0)
+    return request.param
+
+
+@pytest.fixture
+def fallan():
+    return set()
+
+
+@pytest.fixture
+def correos(monkeypatch, fallan):
+    enviados = []
+
+    def enviar(supervisor, reportes, sesion, *topes):
+        if supervisor in fallan:
+            return False
+        enviados.append((supervisor, [r["brigada"] for r in reportes]))
+        return True
+
+    monkeypatch.setattr(resumen_correos, "SesionSMTP", contextlib.nullcontext)
+    monkeypatch.setattr(resumen_correos, "enviar_resumen_ats", enviar)
+    return enviados
+
+
+def _reporte(brigada):
+    return {"fecha": "2025-11-10", "brigada": brigada, "enlace": f"https://x/{brigada}.pdf"}
+
+
+def test_cola_por_supervisor(backend):
+    assert resumen_correos.encolar("ANA", _reporte("B1")) == 1
+    assert resumen_correos.encolar("ANA", _reporte("B2")) == 2
+    assert resumen_correos.encolar("", _reporte("B3")) == 1
+    assert resumen_correos.cantidad_pendientes() == {"ANA": 2, "SIN SUPERVISOR": 1}
+
+    grupos = resumen_correos.tomar_pendientes()
+    assert [r["brigada"] for r in grupos["ANA"]] == ["B1", "B2"]
+    assert grupos["ANA"][0]["encolado"]
+    # Sacar es atómico: lo tomado ya no está
+    assert resumen_correos.tomar_pendientes() == {}
+    assert resumen_correos.cantidad_pendientes() == {}
+
+
+def test_un_correo_por_supervisor(backend, correos):
+    for sup, brigada in [("ANA", "B1"), ("LUIS", "B2"), ("ANA", "B3")]:
+        resumen_correos.encolar(sup, _reporte(brigada))
+    resultado = resumen_correos.enviar_pendientes()
+    assert resultado == {"supervisores": 2, "reportes": 3, "enviados": 2, "errores": 0}
+    assert correos == [("ANA", ["B1", "B3"]), ("LUIS", ["B2"])]
+
+
+def test_envio_fallido_vuelve_al_inicio_de_la_cola(backend, correos, fallan):
+    resumen_correos.encolar("ANA", _reporte("B1"))
+    resumen_correos.encolar("ANA", _reporte("B2"))
+    fallan.add("ANA")
+    assert resumen_correos.enviar_pendientes()["errores"] == 1
+    resumen_correos.encolar("ANA", _reporte("B3"))
+    fallan.clear()
+    resumen_correos.enviar_pendientes("ANA")
+    assert correos == [("ANA", ["B1", "B2", "B3"])]
+
+
+def test_pdf_local_se_borra_al_enviar(backend, correos, fallan, tmp_path):
+    pdfs = {b: tmp_path / f"{b}.pdf" for b in ("B1", "B2")}
+    for p in pdfs.values():
+        p.write_bytes(b"%PDF-1.4")
+    resumen_correos.encolar("ANA", dict(_reporte("B1"), pdf_path=str(pdfs["B1"])))
+    resumen_correos.encolar("LUIS", dict(_reporte("B2"), pdf_path=str(pdfs["B2"])))
+    fallan.add("LUIS")
+    resumen_correos.enviar_pendientes()
+    # El que no salió conserva su adjunto para el próximo intento
+    assert not pdfs["B1"].exists() and pdfs["B2"].exists()
+
+
+def test_sin_smtp_no_se_pierde_nada(backend, monkeypatch):
+    def sesion_rota():
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(resumen_correos, "SesionSMTP", sesion_rota)
+    resumen_correos.encolar("ANA", _reporte("B1"))
+    resumen_correos.encolar("LUIS", _reporte("B2"))
+    assert resumen_correos.enviar_pendientes()["errores"] == 2
+    assert resumen_correos.cantidad_pendientes() == {"ANA": 1, "LUIS": 1}
+
+
+def test_tope_de_reportes_adelanta_el_envio(monkeypatch):
+    disparado = threading.Event()
+    monkeypatch.setattr(resumen_correos, "MAX_REPORTES", 2)
+    monkeypatch.setattr(resumen_correos, "enviar_pendientes", lambda sup: disparado.set())
+    resumen_correos.encolar("ANA", _reporte("B1"))
+    assert not disparado.wait(0.2)
+    resumen_correos.encolar("ANA", _reporte("B2"))
+    assert disparado.wait(2)